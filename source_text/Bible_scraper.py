@@ -1,29 +1,132 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+"""
+Scrapes chapters from biblija.lt into <folder>/<code>_<chapter>.txt.
+
+Books come from a manifest: the gospels in BOOKS below, or a JSON file with the
+same fields, e.g. [{"code": "Apd", "chapters": 28, "folder": "apastalu_darbai"}].
+Chapters are fetched through one pooled session by a bounded thread pool, with
+a minimum interval between requests to the same host. Raw HTML is kept in
+.html_cache/ together with its ETag/Last-Modified, so a re-run only sends
+conditional GETs and unchanged chapters come back as 304 with no body.
+
+    python source_text/Bible_scraper.py                  # all books in BOOKS
+    python source_text/Bible_scraper.py --books Jn Mk
+    python source_text/Bible_scraper.py --manifest books.json --workers 8
+"""
+
+import argparse
+import hashlib
+import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
 import requests
 from bs4 import BeautifulSoup
-
-BASE_URL = "https://biblija.lt/index.aspx?cmp=reading&doc=BiblijaRKK1998_Jn_"
-OUTPUT_DIR = "Jono_evangelija"
-NAMING_CONVENTION = "Jn_{chapter}.txt"
-START_CHAPTER = 1
-END_CHAPTER = 21  # inclusive
-
-
-def fetch_html(chapter):
-    url = BASE_URL + str(chapter)
-    print(f"Fetching chapter {chapter}: {url}")
-    r = requests.get(url)
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+BASE_URL = "https://biblija.lt/index.aspx?cmp=reading&doc=BiblijaRKK1998_{code}_{chapter}"
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(SCRIPT_DIR, ".html_cache")
+NAMING_CONVENTION = "{code}_{chapter}.txt"
+
+BOOKS = [
+    {"code": "Mt", "chapters": 28, "folder": "mato_evangelija"},
+    {"code": "Mk", "chapters": 16, "folder": "morkaus_evangelija"},
+    {"code": "Lk", "chapters": 24, "folder": "luko_evangelija"},
+    {"code": "Jn", "chapters": 21, "folder": "jono_evangelija"},
+]
+
+MAX_WORKERS = 4
+MIN_INTERVAL = 0.3  # seconds between two requests to the same host
+TIMEOUT = 30
+
+
+class HostRateLimiter:
+    """Spaces out requests to each host by at least min_interval seconds, across threads"""
+
+    def __init__(self, min_interval=MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(workers=MAX_WORKERS):
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "LLM-cross-examination-with-Bible scraper"
+    return session
+
+
+def load_manifest(path=None):
+    if path is None:
+        return BOOKS
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _cache_paths(url, cache_dir):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir, key + ".html"), os.path.join(cache_dir, key + ".json")
+
+
+def fetch_html(session, limiter, url, cache_dir=CACHE_DIR):
+    """
+    Conditional GET through the HTML cache.
+    Returns: (html, status) where status is "cached" (304) or "fetched".
+    """
+    html_path, meta_path = _cache_paths(url, cache_dir)
+    headers = {}
+    if os.path.exists(html_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    limiter.wait(url)
+    r = session.get(url, headers=headers, timeout=TIMEOUT)
+    if r.status_code == 304:
+        with open(html_path, "r", encoding="utf-8") as f:
+            return f.read(), "cached"
     r.raise_for_status()
     r.encoding = "utf-8"
-    return r.text
+    html = r.text
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}, f)
+    return html, "fetched"
 
 
 def extract_chapter_text(html):
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, HTML_PARSER)
 
     # chapter label: Mk 1, Mk 2, ...
     chapter_label = soup.find("td", class_="bibl_kn")
@@ -51,23 +154,72 @@ def extract_chapter_text(html):
     return "\n".join(out_lines)
 
 
-def save_chapter(chapter, text):
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    filename = os.path.join(OUTPUT_DIR, NAMING_CONVENTION.format(chapter=chapter))
-    with open(filename, "w", encoding="utf-8") as f:
+def save_chapter(output_dir, filename, text):
+    """Write the chapter only if it changed, so unchanged files keep their mtime. Returns True if written"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, filename)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == text:
+                return False
+    with open(path, "w", encoding="utf-8") as f:
         f.write(text)
-    print(f"Saved: {filename}")
+    return True
+
+
+def scrape_chapter(session, limiter, book, chapter, output_root, base_url, cache_dir):
+    url = base_url.format(code=book["code"], chapter=chapter)
+    html, status = fetch_html(session, limiter, url, cache_dir)
+    text = extract_chapter_text(html)
+    filename = NAMING_CONVENTION.format(code=book["code"], chapter=chapter)
+    written = save_chapter(os.path.join(output_root, book["folder"]), filename, text)
+    return status, written
+
+
+def scrape(books, output_root=SCRIPT_DIR, base_url=BASE_URL, cache_dir=CACHE_DIR, workers=MAX_WORKERS, min_interval=MIN_INTERVAL):
+    """Scrape every chapter of every book. Returns {"fetched", "cached", "written", "failed"} counts"""
+    session = make_session(workers)
+    limiter = HostRateLimiter(min_interval)
+    counts = {"fetched": 0, "cached": 0, "written": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(scrape_chapter, session, limiter, book, chapter, output_root, base_url, cache_dir): (book["code"], chapter)
+            for book in books
+            for chapter in range(1, book["chapters"] + 1)
+        }
+        for future in as_completed(futures):
+            code, chapter = futures[future]
+            try:
+                status, written = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"Error on {code} {chapter}: {e}")
+                continue
+            counts[status] += 1
+            counts["written"] += written
+            print(f"{code} {chapter}: {status}{', saved' if written else ''}")
+
+    session.close()
+    print(f"Done: {counts['fetched']} fetched, {counts['cached']} not modified, {counts['written']} files written, {counts['failed']} failed")
+    return counts
 
 
 def main():
-    for chapter in range(START_CHAPTER, END_CHAPTER + 1):
-        try:
-            html = fetch_html(chapter)
-            text = extract_chapter_text(html)
-            save_chapter(chapter, text)
-            time.sleep(0.3)
-        except Exception as e:
-            print(f"Error on chapter {chapter}: {e}")
+    arg_parser = argparse.ArgumentParser(description="Scrape Bible chapters from biblija.lt")
+    arg_parser.add_argument("--manifest", help="JSON list of {code, chapters, folder} (default: BOOKS)")
+    arg_parser.add_argument("--books", nargs="+", help="only these book codes from the manifest")
+    arg_parser.add_argument("--output", default=SCRIPT_DIR)
+    arg_parser.add_argument("--base-url", default=BASE_URL)
+    arg_parser.add_argument("--cache-dir", default=CACHE_DIR)
+    arg_parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    arg_parser.add_argument("--min-interval", type=float, default=MIN_INTERVAL)
+    args = arg_parser.parse_args()
+
+    books = load_manifest(args.manifest)
+    if args.books:
+        books = [book for book in books if book["code"] in args.books]
+    scrape(books, args.output, args.base_url, args.cache_dir, args.workers, args.min_interval)
 
 
 if __name__ == "__main__":
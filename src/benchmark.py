@@ -0,0 +1,311 @@
+"""
+Offline throughput/latency benchmark of the generation and evaluation pipelines.
+
+A local OpenAI-compatible stub (/v1/chat/completions) answers generation
+prompts with the requested number of questions and evaluation prompts with a
+grade for every question id. Latency is log-normal (median, sigma) plus a
+per-character cost, and a share of requests fails with 429 + Retry-After (or
+another status). litellm is routed to the stub with OPENAI_API_BASE and
+models "openai/bench-*", so the real llm_client / rate limiter / retry code is
+measured, with the response cache switched off.
+
+    python src/benchmark.py --books Mk --latency-ms 300 --error-rate 0.05
+
+Reported per mode: wall clock, chapters/sec, requests, p50/p95/p99 request
+latency (one attempt each: llm_client turns off litellm's own retries), retries
+in llm_client and errors injected by the stub. A run fails if the stub served
+more requests than llm_client made, i.e. if retries were hidden in the SDK.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+SOURCE_ROOT = Path(__file__).parent.parent / "source_text"
+AUTHOR_MODEL = "openai/bench-author"
+EVALUATOR_MODEL = "openai/bench-evaluator"
+MODES = ("generate", "generate-async", "evaluate", "evaluate-batched")
+
+
+class StubConfig:
+    def __init__(self, latency_ms=300.0, sigma=0.5, ms_per_kchar=20.0, error_rate=0.0,
+                 error_status=429, retry_after=0.2, question_chars=250, seed=0):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.ms_per_kchar = ms_per_kchar
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.question_chars = question_chars
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.response_bytes = 0
+
+
+def _generation_reply(prompt, config):
+    match = re.search(r"Sukurk (\d+)", prompt)
+    count = int(match.group(1)) if match else 3
+    filler = "ž" * max(0, config.question_chars - 60)
+    questions = [
+        {
+            "question_text": f"Bandomasis klausimas {i + 1}? {filler}",
+            "options": {"a": "Pirmas", "b": "Antras", "c": "Trečias", "d": "Ketvirtas"},
+            "correct_answer": "abcd"[i % 4],
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"questions": questions}, ensure_ascii=False)
+
+
+def _evaluation_reply(prompt):
+    ids = re.findall(r'"id": "([^"]+)"', prompt)
+    return json.dumps([{"id": question_id, "grade": 5, "comment": "Gerai."} for question_id in ids], ensure_ascii=False)
+
+
+def make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            prompt = body["messages"][-1]["content"]
+            with config.lock:
+                config.requests += 1
+                fail = config.random.random() < config.error_rate
+                latency = config.random.lognormvariate(math.log(config.latency_ms / 1000), config.sigma)
+                if fail:
+                    config.errors += 1
+
+            if fail:
+                time.sleep(latency / 4)
+                self._send(config.error_status, {"error": {"message": "stub error", "type": "stub"}},
+                           {"Retry-After": str(config.retry_after)})
+                return
+
+            if "response_format" in body:
+                content = _evaluation_reply(prompt)
+            else:
+                content = _generation_reply(prompt, config)
+            time.sleep(latency + len(content) / 1000 * config.ms_per_kchar / 1000)
+            with config.lock:
+                config.response_bytes += len(content.encode("utf-8"))
+            self._send(200, {
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub(config):
+    """Start the stub on a free local port. Returns the server (call shutdown() when done)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Recorder:
+    """Wraps llm_client.completion/acompletion to time every request; a failed request is retried by llm_client"""
+
+    def __init__(self, llm_client):
+        self.llm_client = llm_client
+        self.latencies = []
+        self.failures = 0
+        self._completion = llm_client.completion
+        self._acompletion = llm_client.acompletion
+
+    def __enter__(self):
+        completion, acompletion = self._completion, self._acompletion
+
+        def timed_completion(**kwargs):
+            start = time.perf_counter()
+            try:
+                return completion(**kwargs)
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+
+        async def timed_acompletion(**kwargs):
+            start = time.perf_counter()
+            try:
+                return await acompletion(**kwargs)
+            except Exception:
+                self.failures += 1
+                raise
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+
+        self.llm_client.completion = timed_completion
+        self.llm_client.acompletion = timed_acompletion
+        return self
+
+    def __exit__(self, *exc):
+        self.llm_client.completion = self._completion
+        self.llm_client.acompletion = self._acompletion
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def gospel_folders(books=None):
+    import layout
+
+    return [folder for book, folder in layout.discover_books(SOURCE_ROOT).items() if not books or book in books]
+
+
+def run_mode(mode, folders, work_dir, args):
+    import llm_evaluation
+    import llm_generation
+
+    questions_root = work_dir / "questions"
+    evaluations_root = work_dir / f"evaluations_{mode}"
+    chapters = 0
+
+    for folder in folders:
+        book = next(folder.glob("*.txt")).stem.split("_")[0]
+        questions_dir = questions_root / f"klausimai_{book}"
+        chapters += len(list(folder.glob("*.txt")))
+
+        if mode == "generate":
+            shutil.rmtree(questions_dir, ignore_errors=True)
+            questions_dir.mkdir(parents=True)
+            llm_generation.generate_questions_from_all_text_files(folder, AUTHOR_MODEL, questions_dir)
+        elif mode == "generate-async":
+            shutil.rmtree(questions_dir, ignore_errors=True)
+            questions_dir.mkdir(parents=True)
+            asyncio.run(llm_generation.generate_questions_from_all_text_files_async(
+                folder, AUTHOR_MODEL, questions_dir, {"openai": args.concurrency}
+            ))
+        else:
+            output_dir = evaluations_root / f"{book}_evaluations"
+            output_dir.mkdir(parents=True, exist_ok=True)
+            budget = args.batch_token_budget if mode == "evaluate-batched" else None
+            llm_evaluation.evaluate_questions_with_one_model(questions_dir, EVALUATOR_MODEL, output_dir, folder, budget)
+    return chapters
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--books", nargs="+", help="evangelijų kodai (numatyta: visos keturios)")
+    arg_parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    arg_parser.add_argument("--latency-ms", type=float, default=300.0, help="vėlinimo mediana")
+    arg_parser.add_argument("--sigma", type=float, default=0.5, help="log-normalaus vėlinimo sklaida")
+    arg_parser.add_argument("--ms-per-kchar", type=float, default=20.0, help="papildomas vėlinimas 1000 atsakymo simbolių")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--error-status", type=int, default=429)
+    arg_parser.add_argument("--retry-after", type=float, default=0.2)
+    arg_parser.add_argument("--question-chars", type=int, default=250, help="vieno sugeneruoto klausimo dydis")
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="lygiagrečių užklausų limitas async režimui")
+    arg_parser.add_argument("--batch-token-budget", type=int, default=24000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--verbose", action="store_true", help="rodyti konvejerio išvestį")
+    args = arg_parser.parse_args()
+
+    # jokių tinklo užklausų: litellm naudoja vietinį kainų žemėlapį ir stub serverį
+    os.environ["LITELLM_LOCAL_MODEL_COST_MAP"] = "True"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    # bandomieji skambučiai neturi patekti į results/telemetry.jsonl
+    os.environ.setdefault("LLM_TELEMETRY", "off")
+
+    config = StubConfig(args.latency_ms, args.sigma, args.ms_per_kchar, args.error_rate,
+                        args.error_status, args.retry_after, args.question_chars, args.seed)
+    server = start_stub(config)
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    import llm_client
+    import rate_limiter
+    import response_cache
+
+    response_cache.configure(mode="off")
+    rate_limiter.configure({"openai": 1_000_000})
+    # litellm importuojamas tingiai; importas neturi patekti į pirmos užklausos vėlinimą
+    import litellm  # noqa: F401
+
+    folders = gospel_folders(args.books)
+    work_dir = Path(tempfile.mkdtemp(prefix="llm_benchmark_"))
+    modes = list(args.modes)
+    if any(mode.startswith("evaluate") for mode in modes) and not any(mode.startswith("generate") for mode in modes):
+        # vertinimui reikia klausimų - jie sugeneruojami iš anksto, į matavimą neįtraukiami
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_mode("generate-async", folders, work_dir, args)
+
+    rows = []
+    try:
+        for mode in modes:
+            requests_before, errors_before = config.requests, config.errors
+            bytes_before = config.response_bytes
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with Recorder(llm_client) as recorder, output:
+                start = time.perf_counter()
+                chapters = run_mode(mode, folders, work_dir, args)
+                wall = time.perf_counter() - start
+            latencies = sorted(recorder.latencies)
+            stub_requests = config.requests - requests_before
+            if stub_requests != len(latencies):
+                # SDK kartojimai būtų nematomi rate_limiter ir iškreiptų kartojimų stulpelį
+                raise RuntimeError(f"benchmark klaida: stub gavo {stub_requests} užklausų, llm_client išsiuntė {len(latencies)}")
+            rows.append({
+                "mode": mode,
+                "chapters": chapters,
+                "wall": wall,
+                "chapters_per_sec": chapters / wall if wall else 0.0,
+                "requests": len(latencies),
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "retries": recorder.failures,
+                "stub_requests": stub_requests,
+                "stub_errors": config.errors - errors_before,
+                "response_kb": (config.response_bytes - bytes_before) / 1024,
+            })
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'režimas':<17}{'skyriai':>8}{'laikas s':>10}{'sk./s':>8}{'užkl.':>7}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'kart.':>7}{'stub kl.':>9}{'KB':>8}")
+    for row in rows:
+        print(f"{row['mode']:<17}{row['chapters']:>8}{row['wall']:>10.2f}{row['chapters_per_sec']:>8.2f}{row['requests']:>7}"
+              f"{row['p50'] * 1000:>9.0f}{row['p95'] * 1000:>9.0f}{row['p99'] * 1000:>9.0f}"
+              f"{row['retries']:>7}{row['stub_errors']:>9}{row['response_kb']:>8.0f}")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Import-time benchmark for the CLI.
+
+Every module is imported in a fresh interpreter several times; the median
+time is compared with its budget and the heavy libraries must not be loaded.
+Exits with code 1 on a regression, so it can guard changes:
+    python src/benchmark_imports.py
+"""
+
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_DIR = Path(__file__).parent
+REPEATS = 5
+
+# Bibliotekos, kurios turi būti importuojamos tik jų reikalaujančiose komandose
+HEAVY_MODULES = ("litellm", "pandas", "matplotlib", "numpy")
+
+# modulis -> leistinas importo laikas sekundėmis
+BUDGETS = {
+    "main": 0.25,
+    "scheduler": 0.25,
+    "llm_generation": 0.25,
+    "llm_evaluation": 0.25,
+    "parser": 0.1,
+    "filter_perfect_questions": 0.1,
+}
+
+PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "elapsed = time.perf_counter() - start\n"
+    "heavy = [m for m in {heavy!r} if m in sys.modules]\n"
+    "print(elapsed, ','.join(heavy))\n"
+)
+
+
+def measure(module):
+    """Returns: (median seconds, heavy modules loaded by the import)"""
+    times = []
+    heavy = set()
+    for _ in range(REPEATS):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        ).stdout.split()
+        times.append(float(output[0]))
+        if len(output) > 1:
+            heavy.update(output[1].split(","))
+    return statistics.median(times), sorted(heavy)
+
+
+def main():
+    failed = False
+    for module, budget in BUDGETS.items():
+        seconds, heavy = measure(module)
+        status = "OK"
+        if seconds > budget or heavy:
+            status = "REGRESIJA"
+            failed = True
+        loaded = f" (importuota: {', '.join(heavy)})" if heavy else ""
+        print(f"{module:<28} {seconds * 1000:8.1f} ms  / {budget * 1000:.0f} ms  {status}{loaded}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
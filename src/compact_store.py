@@ -0,0 +1,284 @@
+"""
+Compact storage of finished result shards.
+
+A shard directory (one per (model, book), see layout) of per-chapter JSON files
+is packed into a single compressed JSONL file next to it:
+    results/questions/{author}/klausimai_{Book}.jsonl.gz
+    results/evaluations/{evaluator}_vertina_{author}/{Book}_evaluations.jsonl.gz
+(.jsonl.zst when the zstandard package is installed and chosen). The first
+line is a header with the dictionaries of repeated strings - chapters and
+models - and every following line is one question or evaluation whose
+"model"/"chapter" values are indices into them:
+    {"format": "compact", "version": 1, "kind": "questions", "chapters": [...], "models": [...]}
+    {"id": "Mk_1_001", "question": "...", ..., "model": 0, "chapter": 0}
+
+results_index (and through it stats and filter_perfect_questions),
+parser.json_to_csv and the scheduler read shards and JSON files alike; a
+chapter present in both is taken from its JSON file, which is newer work.
+
+    python src/main.py compact [--codec zstd] [--remove-json]
+"""
+
+import gzip
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import file_io
+import layout
+
+FORMAT = "compact"
+VERSION = 1
+CODECS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+SUFFIXES = tuple(CODECS.values())
+
+
+def is_shard(path):
+    return str(path).endswith(SUFFIXES)
+
+
+def shard_path(directory, codec="gzip"):
+    directory = Path(directory)
+    return directory.with_name(directory.name + CODECS[codec])
+
+
+def find_shard(directory):
+    """The existing shard file of a shard directory, or None"""
+    for codec in CODECS:
+        path = shard_path(directory, codec)
+        if path.exists():
+            return path
+    return None
+
+
+def shard_directory(path):
+    """results/questions/a/klausimai_Mk.jsonl.gz -> results/questions/a/klausimai_Mk"""
+    name = Path(path).name
+    for suffix in SUFFIXES:
+        if name.endswith(suffix):
+            return Path(path).with_name(name[:-len(suffix)])
+    return Path(path)
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("compact_store klaida: .jsonl.zst failams reikia paketo zstandard (pip install zstandard)")
+    return zstandard
+
+
+def open_text(path, mode="r"):
+    """Open a shard as text for reading ("r") or writing ("w"), by its suffix"""
+    path = str(path)
+    if path.endswith(CODECS["zstd"]):
+        zstandard = _zstandard()
+        if mode == "r":
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True), encoding="utf-8")
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb"), closefd=True), encoding="utf-8")
+    return gzip.open(path, mode + "t", encoding="utf-8")
+
+
+def read_header(path):
+    with open_text(path) as f:
+        header = json.loads(f.readline())
+    if header.get("format") != FORMAT or header.get("version") != VERSION:
+        raise ValueError(f"compact_store klaida: {path} nėra {FORMAT} v{VERSION} failas")
+    return header
+
+
+def shard_chapters(path):
+    """Chapters stored in a shard, from its header only"""
+    return read_header(path)["chapters"]
+
+
+def _iter_records(path):
+    with open_text(path) as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError(f"compact_store klaida: {path} nėra {FORMAT} v{VERSION} failas")
+        for line in f:
+            if line.strip():
+                yield header, json.loads(line)
+
+
+def iter_questions(path):
+    """Yield (chapter, question) from a questions shard, with model/chapter decoded"""
+    for header, record in _iter_records(path):
+        chapter = header["chapters"][record["chapter"]]
+        record["chapter"] = chapter
+        if isinstance(record.get("model"), int):
+            record["model"] = header["models"][record["model"]]
+        yield chapter, record
+
+
+def _chapter_metadata(header, chapter):
+    metadata = dict(header.get("metadata", {}).get(chapter) or {})
+    if isinstance(metadata.get("evaluator_model"), int):
+        metadata["evaluator_model"] = header["models"][metadata["evaluator_model"]]
+    return metadata
+
+
+def read_evaluations(path):
+    """
+    Returns: {chapter: {"metadata": {...}, "results": [...]}} from an evaluations shard, in stored order.
+    Every chapter of the header is present, also one stored with no results.
+    """
+    header = read_header(path)
+    chapters = {chapter: {"metadata": _chapter_metadata(header, chapter), "results": []} for chapter in header["chapters"]}
+    for header, record in _iter_records(path):
+        chapter = header["chapters"][record.pop("chapter")]
+        chapters[chapter]["results"].append(record)
+    return chapters
+
+
+def read_questions(path):
+    """Returns: {chapter: [questions]} from a questions shard, in stored order (empty chapters included)"""
+    chapters = {chapter: [] for chapter in shard_chapters(path)}
+    for chapter, question in iter_questions(path):
+        chapters[chapter].append(question)
+    return chapters
+
+
+def _encode(value, index):
+    if value not in index:
+        index[value] = len(index)
+    return index[value]
+
+
+def write_shard(path, kind, chapters):
+    """
+    Atomically write a shard.
+    kind: "questions" (chapters = {chapter: [questions]}) or
+    "evaluations" (chapters = {chapter: {"metadata", "results"}}).
+    """
+    path = Path(path)
+    ordered = sorted(chapters, key=layout.chapter_key)
+    chapter_index = {chapter: i for i, chapter in enumerate(ordered)}
+    models = {}
+    lines = []
+    metadata = {}
+    for chapter in ordered:
+        if kind == "questions":
+            for question in chapters[chapter]:
+                record = dict(question)
+                record["chapter"] = chapter_index[chapter]
+                if isinstance(record.get("model"), str):
+                    record["model"] = _encode(record["model"], models)
+                lines.append(record)
+        else:
+            chapter_metadata = dict(chapters[chapter].get("metadata") or {})
+            if isinstance(chapter_metadata.get("evaluator_model"), str):
+                chapter_metadata["evaluator_model"] = _encode(chapter_metadata["evaluator_model"], models)
+            metadata[chapter] = chapter_metadata
+            for result in chapters[chapter].get("results") or []:
+                lines.append({"chapter": chapter_index[chapter], **result})
+
+    header = {"format": FORMAT, "version": VERSION, "kind": kind, "chapters": ordered, "models": list(models)}
+    if kind == "evaluations":
+        header["metadata"] = metadata
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=path.name[path.name.index("."):])
+    os.close(fd)
+    try:
+        with open_text(tmp_path, "w") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for record in lines:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def compact_directory(directory, kind, codec="gzip", remove_json=False):
+    """
+    Pack one shard directory into its shard file, merging with an existing shard
+    (JSON files win). Returns: (json files packed, bytes before, bytes after)
+    """
+    directory = Path(directory)
+    if kind == "questions":
+        files = layout.question_chapters(directory)
+    else:
+        files = layout.evaluation_chapters(directory)
+    existing = find_shard(directory)
+    if not files:
+        return 0, 0, 0
+
+    chapters = {}
+    before = 0
+    if existing is not None:
+        chapters = read_questions(existing) if kind == "questions" else read_evaluations(existing)
+        before += existing.stat().st_size
+    for chapter, path in files.items():
+        before += path.stat().st_size
+        with open(path, "r", encoding="utf-8") as f:
+            chapters[chapter] = json.load(f)
+
+    target = shard_path(directory, codec)
+    write_shard(target, kind, chapters)
+    if existing is not None and existing != target:
+        existing.unlink()
+    if remove_json:
+        for path in files.values():
+            path.unlink()
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
+    return len(files), before, target.stat().st_size
+
+
+def iter_shard_directories(results_dir):
+    """Yield (directory, kind) for every questions/evaluations shard directory or shard file"""
+    results_dir = Path(results_dir)
+    for kind, marker in (("questions", "klausimai_"), ("evaluations", "_evaluations")):
+        root = results_dir / kind
+        if not root.exists():
+            continue
+        for model_dir in sorted(root.iterdir()):
+            if not model_dir.is_dir():
+                continue
+            directories = {shard_directory(path) for path in model_dir.iterdir() if marker in path.name}
+            for directory in sorted(directories):
+                yield directory, kind
+
+
+def compact_results(results_dir, codec="gzip", remove_json=False):
+    """Pack every shard directory under results_dir. Returns (json files packed, bytes before, bytes after)"""
+    if codec == "zstd":
+        _zstandard()
+    packed = before = after = 0
+    for directory, kind in iter_shard_directories(results_dir):
+        files, size_before, size_after = compact_directory(directory, kind, codec, remove_json)
+        if files:
+            print(f"compact_store: {directory.relative_to(results_dir)}: {files} failų, {size_before / 1024:.0f} KB -> {size_after / 1024:.0f} KB")
+        packed += files
+        before += size_before
+        after += size_after
+    print(f"compact_store: supakuota {packed} JSON failų, {before / 1024:.0f} KB -> {after / 1024:.0f} KB.")
+    return packed, before, after
+
+
+def stored_chapters(directory, kind):
+    """Chapters of a shard directory stored either as JSON files or in its shard"""
+    files = layout.question_chapters(directory) if kind == "questions" else layout.evaluation_chapters(directory)
+    shard = find_shard(directory)
+    return set(files) | set(shard_chapters(shard) if shard is not None else ())
+
+
+def restore_chapter(directory, kind, chapter, target):
+    """Write one chapter from a directory's shard back to its JSON file. Returns True if the shard had it"""
+    shard = find_shard(directory)
+    if shard is None or chapter not in shard_chapters(shard):
+        return False
+    if kind == "questions":
+        data = read_questions(shard).get(chapter, [])
+    else:
+        data = read_evaluations(shard).get(chapter, {"metadata": {}, "results": []})
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    file_io.save_json_file(data, target, indent=2 if kind == "questions" else 4)
+    return True
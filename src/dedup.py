@@ -0,0 +1,154 @@
+"""
+Near-duplicate question detection between generation and evaluation.
+
+Questions of one chapter (from every author model and every verse window) are
+turned into sets of character n-grams of their normalized text + options.
+MinHash signatures with LSH banding give candidate pairs in near-linear time;
+candidates are confirmed with the exact Jaccard similarity and only merged if
+their correct answers are the same text. Clusters are built with union-find.
+
+The scheduler (run_matrix(dedup=True)) then lets each evaluator grade a single
+representative per cluster and fans the grade out to the other members.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+NGRAM = 5
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+# Mažiausias Jaccard panašumas, kad klausimai būtų laikomi dublikatais
+SIMILARITY_THRESHOLD = 0.7
+SEED = 1729
+
+# Pirminis skaičius, didesnis už 2^32 (crc32 reikšmių sritis)
+_PRIME = 4294967311
+_rng = np.random.default_rng(SEED)
+_A = _rng.integers(1, 2 ** 31, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize(text):
+    return " ".join(_PUNCTUATION.sub(" ", str(text).casefold()).split())
+
+
+def question_text(question):
+    options = question.get("options") or {}
+    if isinstance(options, dict):
+        options = [options[key] for key in sorted(options)]
+    return normalize(" ".join([str(question.get("question", ""))] + [str(option) for option in options]))
+
+
+def correct_text(question):
+    options = question.get("options") or {}
+    correct = str(question.get("correct", "")).lower()
+    if isinstance(options, dict):
+        return normalize(options.get(correct, correct))
+    return correct
+
+
+def shingles(text, n=NGRAM):
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def minhash(shingle_set):
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((np.outer(_A, hashes) + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def _find(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def cluster_questions(questions, threshold=SIMILARITY_THRESHOLD):
+    """
+    questions: list of question dicts (id, question, options, correct).
+    Returns: list of clusters, each a sorted list of indices into questions.
+    """
+    sets = [shingles(question_text(question)) for question in questions]
+    answers = [correct_text(question) for question in questions]
+    parents = list(range(len(questions)))
+
+    buckets = {}
+    for i, shingle_set in enumerate(sets):
+        signature = minhash(shingle_set)
+        for band in range(BANDS):
+            key = (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            buckets.setdefault(key, []).append(i)
+
+    checked = set()
+    for members in buckets.values():
+        for i in members[1:]:
+            first = members[0]
+            pair = (first, i)
+            if pair in checked or _find(parents, first) == _find(parents, i):
+                continue
+            checked.add(pair)
+            if answers[first] == answers[i] and jaccard(sets[first], sets[i]) >= threshold:
+                parents[_find(parents, i)] = _find(parents, first)
+
+    clusters = {}
+    for i in range(len(questions)):
+        clusters.setdefault(_find(parents, i), []).append(i)
+    return sorted(clusters.values())
+
+
+def choose_representatives(questions_by_author, threshold=SIMILARITY_THRESHOLD):
+    """
+    Cluster the questions of several authors for one chapter.
+    questions_by_author: {author: [questions]}
+    Returns: {(author, question_id): (representative_author, representative_id)}.
+    The representative is the first member in author order, so it is stable
+    between runs.
+    """
+    refs = []
+    questions = []
+    for author in sorted(questions_by_author):
+        for question in questions_by_author[author]:
+            refs.append((author, question.get("id")))
+            questions.append(question)
+
+    representatives = {}
+    for cluster in cluster_questions(questions, threshold):
+        representative = refs[cluster[0]]
+        for i in cluster:
+            representatives[refs[i]] = representative
+    return representatives
+
+
+def fan_out(questions_by_author, representatives, graded):
+    """
+    Give every question the grade of its cluster representative.
+    graded: {(author, question_id): evaluation item} for the representatives.
+    Returns: {author: [evaluation items]} in question order.
+    """
+    results = {}
+    for author, questions in questions_by_author.items():
+        items = []
+        for question in questions:
+            key = (author, question.get("id"))
+            representative = representatives.get(key, key)
+            item = graded.get(representative)
+            if item is None:
+                continue
+            if representative != key:
+                item = dict(item, id=question.get("id"), representative=f"{representative[0]}:{representative[1]}")
+            items.append(item)
+        results[author] = items
+    return results
@@ -0,0 +1,185 @@
+"""
+Streaming export of questions and their evaluations.
+
+Rows are produced one at a time - from a SQLite cursor over results_index for
+the full cross-evaluation matrix, or from a merged JSON file in
+parser.json_to_csv - and written incrementally, so memory use does not grow
+with the corpus. The output format follows the file suffix:
+    .csv      csv module (always available)
+    .xlsx     openpyxl in write-only mode (optional)
+    .parquet  pyarrow, written in row groups of BATCH_ROWS (optional)
+
+    python src/main.py export matrica.csv [--books Mt Mk]
+"""
+
+import csv
+import json
+import os
+from pathlib import Path
+
+COLUMNS = ["Klausimo ID", "Skyrius", "Autorius", "Klausimas", "Teisingas", "Variantai", "Vertintojas", "Įvertinimas", "Komentaras", "Būsena"]
+# Būsena: tuščia - vertintojo įvertinimas; kitaip - kodėl įvertinimo nėra arba jį davė ne vertintojas
+STATUS_SKIPPED = "praleista"
+STATUS_PRESCREEN = "automatinė patikra"
+BATCH_ROWS = 10_000
+FORMATS = {".csv": "csv", ".xlsx": "xlsx", ".parquet": "parquet"}
+
+MATRIX_QUERY = """
+SELECT q.question_id, q.chapter, COALESCE(q.model, q.author), q.question, q.correct, q.options,
+       COALESCE(e.evaluator_model, e.evaluator), e.grade, e.comment, e.skipped, e.prescreen
+FROM questions q
+LEFT JOIN evaluations e
+    ON e.question_id = q.question_id AND e.author = q.author AND e.gospel = q.gospel
+{where}
+ORDER BY q.author, q.gospel, q.path, q.position, e.evaluator
+"""
+
+
+def options_text(options):
+    """{"a": "x", "b": "y"} -> "a: x; b: y;" """
+    if isinstance(options, str):
+        try:
+            options = json.loads(options)
+        except json.JSONDecodeError:
+            return options
+    if not isinstance(options, dict):
+        return ""
+    return "".join(f"{key}: {value}; " for key, value in options.items()).strip()
+
+
+def evaluation_status(skipped, prescreen):
+    """Būsenos stulpelis: praleistas nuoseklaus vertinimo ar vietinės patikros įvertintas klausimas"""
+    if skipped:
+        return STATUS_SKIPPED
+    if prescreen:
+        return STATUS_PRESCREEN
+    return None
+
+
+def _csv_writer(path):
+    f = open(path, "w", encoding="utf-8", newline="")
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    return writer.writerow, f.close
+
+
+def _xlsx_writer(path):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("exporter klaida: .xlsx failams reikia paketo openpyxl (pip install openpyxl)")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Vertinimai")
+    sheet.append(COLUMNS)
+    return sheet.append, lambda: workbook.save(path)
+
+
+def _parquet_writer(path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("exporter klaida: .parquet failams reikia paketo pyarrow (pip install pyarrow)")
+    schema = pa.schema([(column, pa.int64() if column == "Įvertinimas" else pa.string()) for column in COLUMNS])
+    writer = pq.ParquetWriter(path, schema)
+    batch = []
+
+    def flush():
+        if batch:
+            columns = list(zip(*batch))
+            writer.write_table(pa.Table.from_arrays([pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema))
+            batch.clear()
+
+    def write(row):
+        grade = row[7]
+        batch.append(tuple(row[:7]) + (int(grade) if isinstance(grade, (int, float)) else None,) + tuple(row[8:]))
+        if len(batch) >= BATCH_ROWS:
+            flush()
+
+    def close():
+        flush()
+        writer.close()
+
+    return write, close
+
+
+_WRITERS = {"csv": _csv_writer, "xlsx": _xlsx_writer, "parquet": _parquet_writer}
+
+
+def write_rows(rows, output_path, fmt=None):
+    """
+    Write rows (iterables in COLUMNS order) to output_path as they arrive.
+    fmt defaults to the format of the file suffix. The file is created only once
+    the first row is known, so no rows leave no file (not a header-only one).
+    Returns the number of rows written.
+    """
+    output_path = Path(output_path)
+    fmt = fmt or FORMATS.get(output_path.suffix.lower())
+    if fmt not in _WRITERS:
+        raise ValueError(f"exporter klaida: nežinomas formatas '{output_path.suffix}' (galimi: {', '.join(FORMATS)})")
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    os.makedirs(output_path.parent, exist_ok=True)
+    write, close = _WRITERS[fmt](output_path)
+    count = 0
+    try:
+        write(first)
+        count += 1
+        for row in rows:
+            write(row)
+            count += 1
+    finally:
+        close()
+    return count
+
+
+def question_rows(questions):
+    """Rows of merged question objects (question + "evaluations" list), as read by parser.json_to_csv"""
+    for question in questions:
+        common = [
+            question.get("question_id", question.get("id")),
+            question.get("chapter"),
+            question.get("question_creator_model", question.get("model")),
+            question.get("question"),
+            question.get("correct_answer_key", question.get("correct")),
+            options_text(question.get("options", {})),
+        ]
+        evaluations = question.get("evaluations") or []
+        if not evaluations:
+            yield common + [None, None, None, None]
+            continue
+        for evaluation in evaluations:
+            yield common + [
+                evaluation.get("evaluator_model"), evaluation.get("grade"), evaluation.get("comment"),
+                evaluation_status(evaluation.get("skipped"), evaluation.get("prescreen")),
+            ]
+
+
+def matrix_rows(connection, books=None):
+    """Every question joined with every evaluation of it, streamed from the results index"""
+    where, parameters = "", []
+    if books:
+        where = f"WHERE q.gospel IN ({', '.join('?' * len(books))})"
+        parameters = list(books)
+    cursor = connection.execute(MATRIX_QUERY.format(where=where), parameters)
+    for question_id, chapter, author, question, correct, options, evaluator, grade, comment, skipped, prescreen in cursor:
+        yield [
+            question_id, chapter, author, question, correct, options_text(options), evaluator, grade, comment,
+            evaluation_status(skipped, prescreen),
+        ]
+
+
+def export_matrix(output_path, books=None, fmt=None):
+    """One row per (question, evaluation) of the whole results/ tree - JSON files and compact shards alike"""
+    import results_index
+
+    print(f"exporter: eksportuojama vertinimų matrica į {output_path}...")
+    try:
+        count = write_rows(matrix_rows(results_index.open_index(), books), output_path, fmt)
+    except (RuntimeError, ValueError) as e:
+        print(e)
+        return 0
+    print(f"exporter: įrašyta {count} eilučių į {output_path}.")
+    return count
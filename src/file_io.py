@@ -2,6 +2,8 @@ import json
 from pathlib import Path
 import os
 import re
+import tempfile
+import verse_index
 
 def add_important_parameters_to_evaluations(evaluations_json, model, source_text_path):
     updated_json = {
@@ -14,9 +16,20 @@ def add_important_parameters_to_evaluations(evaluations_json, model, source_text
 
     return updated_json
 
-def save_json_file(json_obj, filepath):
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(json_obj, f, ensure_ascii=False, indent=4)
+def save_json_file(json_obj, filepath, indent=4):
+    # įrašoma į laikiną failą ir pervadinama, kad nutrūkus programai neliktų pusiau įrašyto failo
+    filepath = Path(filepath)
+    fd, tmp_path = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(json_obj, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 def read_and_save_API_keys(api_keys_path):
     if api_keys_path := Path(api_keys_path):
@@ -26,14 +39,14 @@ def read_and_save_API_keys(api_keys_path):
                     key, value = line.strip().split("=", 1)
                     os.environ[key.strip()] = value.strip()
 
-def calculate_questions_number(bible_text):
-    verse_numbers = re.findall(r'\d+', bible_text)
-    
-    if verse_numbers:
-        last_verse = int(verse_numbers[-1])
-        questions_number = max(1, last_verse // 3)
+def calculate_questions_number(bible_text, chapter_name=None):
+    # eilučių skaičius imamas iš verse_index; tekstas skenuojamas tik skyriams, kurių indekse nėra
+    if chapter_name is not None and chapter_name in verse_index.open_index():
+        last_verse = verse_index.open_index().verse_count(chapter_name)
     else:
-        questions_number = 1
+        verse_numbers = re.findall(r'\d+', bible_text)
+        last_verse = int(verse_numbers[-1]) if verse_numbers else 0
+    questions_number = max(1, last_verse // 3)
     
     print(f"file_io: apskaičiuotas klausimų skaičius: {questions_number}")
     return str(questions_number)
@@ -0,0 +1,118 @@
+"""
+Append-only JSONL journal of chapter jobs.
+
+Every generation/evaluation job of the scheduler (scheduler.run_matrix) writes
+one line per state change:
+    queued -> sent -> received -> parsed -> written   (or failed)
+Lines are buffered and written with one fsync per batch (see record), and the
+buffer is flushed when a run ends and at exit. A crash can lose at most the last
+FLUSH_INTERVAL seconds of entries; such a job just looks unfinished, and rerunning
+it finds its result file, records it as "written" and stops there. main.py --resume reruns the jobs that
+never reached "written". Only the scheduler writes the journal: the older
+per-model loops in llm_generation/llm_evaluation are not covered by --resume.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+JOURNAL_PATH = Path(__file__).parent.parent / "results" / "job_journal.jsonl"
+STATES = ("queued", "sent", "received", "parsed", "written", "failed")
+
+# Įrašai kaupiami ir rašomi kartu, kad įvykių ciklas nelauktų fsync kiekvienam perėjimui
+FLUSH_INTERVAL = 1.0
+FLUSH_LINES = 256
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = {}
+
+
+def generation_job_id(author, chapter):
+    return f"generate:{author}:{chapter}"
+
+
+def evaluation_job_id(evaluator, author, chapter):
+    return f"evaluate:{evaluator}:{author}:{chapter}"
+
+
+def _append(journal_path, lines):
+    """Write buffered lines with a single write and fsync"""
+    Path(journal_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def flush(journal_path=None):
+    """Write the buffered entries of journal_path (or of every journal) to disk"""
+    with _lock:
+        paths = [str(journal_path)] if journal_path is not None else list(_pending)
+        for path in paths:
+            lines = "".join(_pending.pop(path, []))
+            _last_flush[path] = time.monotonic()
+            if lines:
+                _append(path, lines)
+
+
+def record(job_id, state, journal_path=JOURNAL_PATH, **details):
+    """
+    Append one state change of job_id to the journal. Entries are buffered and written
+    together every FLUSH_INTERVAL seconds or FLUSH_LINES entries, so the event loop does
+    not fsync on every transition.
+    """
+    if job_id is None:
+        return
+    if state not in STATES:
+        raise ValueError(f"job_journal klaida: nežinoma būsena '{state}'")
+    entry = {"time": time.time(), "job": job_id, "state": state, **details}
+    line = json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+    path = str(journal_path)
+    with _lock:
+        lines = _pending.setdefault(path, [])
+        lines.append(line)
+        due = len(lines) >= FLUSH_LINES or time.monotonic() - _last_flush.get(path, 0.0) >= FLUSH_INTERVAL
+    if due:
+        flush(path)
+
+
+def record_many(job_ids, state, journal_path=JOURNAL_PATH):
+    """Append the same state for many jobs and write them at once (e.g. queuing a whole matrix)"""
+    if state not in STATES:
+        raise ValueError(f"job_journal klaida: nežinoma būsena '{state}'")
+    now = time.time()
+    lines = [json.dumps({"time": now, "job": job_id, "state": state}, ensure_ascii=False) + "\n" for job_id in job_ids]
+    if not lines:
+        return
+    with _lock:
+        _pending.setdefault(str(journal_path), []).extend(lines)
+    flush(journal_path)
+
+
+atexit.register(flush)
+
+
+def last_states(journal_path=JOURNAL_PATH):
+    """Replay the journal. Returns: {job_id: last_state}"""
+    flush(journal_path)
+    states = {}
+    if not Path(journal_path).exists():
+        return states
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # paskutinė eilutė gali būti nutrūkusi, jei programa sustojo rašant
+                continue
+            states[entry["job"]] = entry["state"]
+    return states
+
+
+def unfinished_jobs(journal_path=JOURNAL_PATH):
+    """Job ids whose last recorded state is not "written" """
+    return {job_id for job_id, state in last_states(journal_path).items() if state != "written"}
@@ -0,0 +1,110 @@
+"""
+Book/chapter-aware layout of source_text/ and results/.
+
+Outputs are sharded by book: every (model, book) pair gets its own directory,
+    results/questions/{author}/klausimai_{Book}/questions_{chapter}.json
+    results/evaluations/{evaluator}_vertina_{author}/{Book}_evaluations/{chapter}_evaluations.json
+so a directory never holds more files than the book has chapters (150 for the
+Psalms), however many books are added. Files are matched by chapter name, never
+by position, and listed once per directory with os.scandir in natural order
+(Mt_2 before Mt_10).
+"""
+
+import os
+import re
+from pathlib import Path
+
+QUESTIONS_DIR = Path("results") / "questions"
+EVALUATIONS_DIR = Path("results") / "evaluations"
+
+_CHAPTER = re.compile(r"^(.*?)_?(\d+)$")
+
+
+def chapter_key(chapter):
+    """Natural sort key of a chapter name: "Mt_10" -> ("Mt", 10)"""
+    match = _CHAPTER.match(chapter)
+    if match is None:
+        return (chapter, -1)
+    return (match.group(1), int(match.group(2)))
+
+
+def book_of(chapter):
+    return chapter.split("_")[0]
+
+
+def chapter_files(folder, prefix="", suffix=".txt"):
+    """
+    One os.scandir pass over a shard directory.
+    Returns: {chapter: Path} for files named {prefix}{chapter}{suffix}, in natural chapter order.
+    A missing directory gives an empty dict.
+    """
+    files = {}
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(prefix) and name.endswith(suffix) and entry.is_file():
+                    files[name[len(prefix):len(name) - len(suffix)]] = Path(entry.path)
+    except FileNotFoundError:
+        return {}
+    return {chapter: files[chapter] for chapter in sorted(files, key=chapter_key)}
+
+
+def source_chapters(folder):
+    return chapter_files(folder, suffix=".txt")
+
+
+def question_chapters(folder):
+    return chapter_files(folder, prefix="questions_", suffix=".json")
+
+
+def evaluation_chapters(folder):
+    return chapter_files(folder, suffix="_evaluations.json")
+
+
+def discover_books(source_root):
+    """
+    Map book codes to their source folders, e.g. {"Mt": Path(".../mato_evangelija")}.
+    The code is taken from the chapter file names (Mt_1.txt -> Mt); hidden
+    directories (such as the scraper's .html_cache) are skipped.
+    """
+    books = {}
+    try:
+        with os.scandir(source_root) as entries:
+            folders = sorted(Path(entry.path) for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+    except FileNotFoundError:
+        return books
+    for folder in folders:
+        chapters = source_chapters(folder)
+        if chapters:
+            books[book_of(next(iter(chapters)))] = folder
+    return books
+
+
+def questions_dir(parent_folder, author, book):
+    return Path(parent_folder) / QUESTIONS_DIR / author / f"klausimai_{book}"
+
+
+def questions_path(parent_folder, author, book, chapter):
+    return questions_dir(parent_folder, author, book) / f"questions_{chapter}.json"
+
+
+def evaluations_dir(parent_folder, evaluator, author, book):
+    return Path(parent_folder) / EVALUATIONS_DIR / f"{evaluator}_vertina_{author}" / f"{book}_evaluations"
+
+
+def evaluations_path(parent_folder, evaluator, author, book, chapter):
+    return evaluations_dir(parent_folder, evaluator, author, book) / f"{chapter}_evaluations.json"
+
+
+def pair_chapters(questions_folder, source_folder):
+    """
+    Match question files to source chapters by chapter name.
+    Returns: (pairs, missing) - pairs is [(questions_path, text_path)] in natural
+    chapter order, missing the chapters that have a source but no questions yet.
+    """
+    sources = source_chapters(source_folder)
+    questions = question_chapters(questions_folder)
+    pairs = [(questions[chapter], text_path) for chapter, text_path in sources.items() if chapter in questions]
+    missing = [chapter for chapter in sources if chapter not in questions]
+    return pairs, missing
@@ -0,0 +1,254 @@
+"""
+Single entry point for completion calls made by llm_generation and llm_evaluation.
+Both the sync and the async variant go through the response cache and the
+per-provider rate limiter, and retry transient API errors with backoff.
+stream()/astream() yield the reply text chunk by chunk; only a complete
+reply is cached, and a request is retried only if it failed before its
+first chunk arrived. Every call writes a telemetry span (see telemetry).
+"""
+
+import asyncio
+import time
+import rate_limiter
+import response_cache
+import telemetry
+
+# paskutinis srauto gabalas neša tokenų skaičių, be jo srautinės užklausos neturi kainos
+STREAM_OPTIONS = {"include_usage": True}
+
+# litellm ir OpenAI SDK kartojimai išjungti: jie paslėptų 429 ir Retry-After nuo rate_limiter,
+# laikytų tiekėjo vietą per savo pauzes ir padaugintų bandymų skaičių (kartoja tik _call_with_retries)
+SDK_RETRIES = {"max_retries": 0, "num_retries": 0}
+
+
+# litellm importuojamas tik pirmos užklausos metu - jo importas užtrunka kelias sekundes
+def completion(**kwargs):
+    from litellm import completion as litellm_completion
+    return litellm_completion(**kwargs)
+
+
+async def acompletion(**kwargs):
+    from litellm import acompletion as litellm_acompletion
+    return await litellm_acompletion(**kwargs)
+
+
+def _request_kwargs(response_format):
+    if response_format is not None:
+        return {"response_format": response_format, **SDK_RETRIES}
+    return dict(SDK_RETRIES)
+
+
+def _delta(chunk):
+    if not chunk or not chunk.choices:
+        return ""
+    delta = chunk.choices[0].delta
+    content = delta.get("content") if isinstance(delta, dict) else getattr(delta, "content", None)
+    return content or ""
+
+
+def _content(response):
+    if response and response.choices:
+        return response.choices[0].message["content"]
+    return None
+
+
+class _Span:
+    """Collects latency and retries of one call and writes its telemetry span"""
+
+    def __init__(self, model):
+        self.model = model
+        self.start = time.perf_counter()
+        self.retries = 0
+
+    def finish(self, response=None, cache_hit=False, error=None, empty=False):
+        outcome = "error" if error is not None else "empty" if empty else "ok"
+        telemetry.record_span(
+            self.model, time.perf_counter() - self.start, outcome,
+            retries=self.retries, cache_hit=cache_hit, response=response, error=error,
+        )
+
+
+class _StreamUsage:
+    """Usage of a streamed reply (the last chunk carries it, if the provider sends it)"""
+
+    def __init__(self, usage):
+        self.usage = usage
+
+
+def _lookup(span, model, messages, response_format):
+    """A miss in replay mode raises CacheMissError; its span is written first"""
+    cache = response_cache.get_cache()
+    key = response_cache.make_key(model, messages, response_format)
+    content = cache.get(key)
+    if content is None and cache.mode == "replay":
+        error = response_cache.CacheMissError(f"llm_client: kešuotas atsakymas nerastas ({model}, {key[:12]})")
+        span.finish(error=error)
+        raise error
+    return cache, key, content
+
+
+def _handle_error(error, model, bucket, attempt):
+    """Return the delay before the next attempt, or re-raise if the error is final"""
+    if not rate_limiter.is_retryable(error) or attempt == rate_limiter.MAX_ATTEMPTS - 1:
+        raise error
+    retry_after = rate_limiter.get_retry_after(error)
+    if rate_limiter.is_rate_limit(error):
+        bucket.penalize(retry_after)
+    delay = rate_limiter.backoff_delay(attempt, retry_after)
+    print(f"llm_client: {model} klaida ({type(error).__name__}), bandymas {attempt + 1}, kartojama po {delay:.1f} sek.")
+    return delay
+
+
+def _call_with_retries(span, model, messages, response_format, **kwargs):
+    bucket = rate_limiter.get_bucket(model)
+    for attempt in range(rate_limiter.MAX_ATTEMPTS):
+        bucket.acquire_sync()
+        try:
+            response = completion(model=model, messages=messages, **_request_kwargs(response_format), **kwargs)
+        except Exception as e:
+            time.sleep(_handle_error(e, model, bucket, attempt))
+            span.retries += 1
+            continue
+        bucket.reward()
+        return response
+
+
+async def _acall_with_retries(span, model, messages, response_format, slots=None, **kwargs):
+    """
+    slots (a semaphore, e.g. the scheduler's provider + worker slots) is held only
+    while a request is in flight, never during the backoff sleep, so a throttled
+    provider does not block the others. With stream=True it stays held after a
+    successful attempt and the caller releases it once the stream is consumed.
+    """
+    bucket = rate_limiter.get_bucket(model)
+    for attempt in range(rate_limiter.MAX_ATTEMPTS):
+        await bucket.acquire()
+        if slots is not None:
+            await slots.__aenter__()
+        try:
+            response = await acompletion(model=model, messages=messages, **_request_kwargs(response_format), **kwargs)
+        except BaseException as e:
+            if slots is not None:
+                await slots.__aexit__(None, None, None)
+            if not isinstance(e, Exception):
+                raise
+            await asyncio.sleep(_handle_error(e, model, bucket, attempt))
+            span.retries += 1
+            continue
+        if slots is not None and not kwargs.get("stream"):
+            await slots.__aexit__(None, None, None)
+        bucket.reward()
+        return response
+
+
+def complete(model, messages, response_format=None):
+    """Return the text content of the model's reply, or None if it had no choices"""
+    span = _Span(model)
+    cache, key, content = _lookup(span, model, messages, response_format)
+    if content is not None:
+        print(f"llm_client: atsakymas paimtas iš kešo ({model}).")
+        span.finish(cache_hit=True)
+        return content
+
+    try:
+        response = _call_with_retries(span, model, messages, response_format)
+    except Exception as e:
+        span.finish(error=e)
+        raise
+    content = _content(response)
+    span.finish(response=response, empty=content is None)
+    cache.put(key, model, content)
+    return content
+
+
+async def acomplete(model, messages, response_format=None, slots=None):
+    """Async variant of complete(). slots: semaphore held per attempt (see _acall_with_retries)"""
+    span = _Span(model)
+    cache, key, content = _lookup(span, model, messages, response_format)
+    if content is not None:
+        print(f"llm_client: atsakymas paimtas iš kešo ({model}).")
+        span.finish(cache_hit=True)
+        return content
+
+    try:
+        response = await _acall_with_retries(span, model, messages, response_format, slots)
+    except Exception as e:
+        span.finish(error=e)
+        raise
+    content = _content(response)
+    span.finish(response=response, empty=content is None)
+    cache.put(key, model, content)
+    return content
+
+
+def stream(model, messages, response_format=None):
+    """
+    Yield the model's reply as text chunks while it is being generated.
+    The span is written also if the consumer stops early (error GeneratorExit).
+    """
+    span = _Span(model)
+    cache, key, content = _lookup(span, model, messages, response_format)
+    if content is not None:
+        print(f"llm_client: atsakymas paimtas iš kešo ({model}).")
+        span.finish(cache_hit=True)
+        yield content
+        return
+
+    chunks = []
+    usage = None
+    error = None
+    try:
+        response = _call_with_retries(span, model, messages, response_format, stream=True, stream_options=STREAM_OPTIONS)
+        for chunk in response:
+            usage = getattr(chunk, "usage", None) or usage
+            text = _delta(chunk)
+            if text:
+                chunks.append(text)
+                yield text
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        span.finish(response=_StreamUsage(usage), error=error, empty=not chunks)
+    cache.put(key, model, "".join(chunks))
+
+
+async def astream(model, messages, response_format=None, slots=None):
+    """Async variant of stream(). slots: semaphore held per attempt and while the reply streams"""
+    span = _Span(model)
+    cache, key, content = _lookup(span, model, messages, response_format)
+    if content is not None:
+        print(f"llm_client: atsakymas paimtas iš kešo ({model}).")
+        span.finish(cache_hit=True)
+        yield content
+        return
+
+    try:
+        response = await _acall_with_retries(span, model, messages, response_format, slots, stream=True, stream_options=STREAM_OPTIONS)
+    except BaseException as e:
+        span.finish(error=e)
+        raise
+    chunks = []
+    usage = None
+    error = None
+    try:
+        async for chunk in response:
+            usage = getattr(chunk, "usage", None) or usage
+            text = _delta(chunk)
+            if text:
+                chunks.append(text)
+                yield text
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        # paliktas neišskaitytas generatorius irgi atlaisvina vietą ir įrašo span
+        if slots is not None:
+            await slots.__aexit__(None, None, None)
+        span.finish(response=_StreamUsage(usage), error=error, empty=not chunks)
+    cache.put(key, model, "".join(chunks))
+
+
+def discard(model, messages, response_format=None):
+    """Drop a cached reply that turned out to be unusable, so a retry calls the API again"""
+    response_cache.get_cache().delete(response_cache.make_key(model, messages, response_format))
@@ -1,93 +1,443 @@
-from litellm import completion
+import hashlib
 import json
 import file_io
+import job_journal
+import llm_client
+import parser
+import prescreen
+import providers
+import layout
+import response_cache
+import telemetry
+import verse_index
 from pathlib import Path
-import sys
 
-        
+# Kiek kartų per tą patį paleidimą nepavykę skyriai grąžinami į eilę po pagrindinio praėjimo
+# (API klaidas jau kartoja llm_client, čia - atsakymai be tinkamų įvertinimų)
+REQUEUE_ROUNDS = 1
+
+EVALUATION_SYSTEM_PROMPT = (
+    "Tu esi Šv. Rašto ekspertas. Tavo užduotis - įvertinti klausimų ir atsakymų kokybę (grade).\n"
+    "Vertinimo skalė:\n"
+    "0 - Visiškai netinkamas (neaiškus arba kliedesys)\n"
+    "1 - Aiškus, bet faktiškai klaidingas (prieštarauja šaltiniui).\n"
+    "2 - Faktiškai teisingas, bet turi didelių turinio trūkumų (neteisingi atsakymai, klaidinanti logika).\n"
+    "3 - Teisingas, bet yra techninių/formos klaidų (gramatika, citavimo tikslumas)\n"
+    "4 - Puikus turinys ir technika, bet stilius/formuluotė galėtų būti geresni.\n"
+    "5 - Idealus visais aspektais (turinys, logika, gramatika, didaktinė vertė)\n"
+
+    "Vertink griežtai hierarchiškai: jei klausimas faktiškai neteisingas, jis negali gauti daugiau nei 1 balo,\n"
+    "net jei jo gramatika ideali. Jei klausimas teisingas, bet neaiškus, jis negali gauti daugiau nei 4 balų.\n"
+
+    "Atsakymą pateik tik JSON formatu kaip sąrašą objektų, atitinkančių šią struktūrą:\n"
+    "[\n"
+    "  {\n"
+    "    \"id\": \"klausimo_id\",\n"
+    "    \"grade\": įvertinimas\n"
+    "    \"comment\": \"1-2 sakinių vertinimo paaiškinimas\"\n"
+    "  }\n"
+    "]"
+)
+
+# Kiek kartų papildomai klausiama tik trūkstamų ar netinkamų įvertinimų
+REPAIR_ROUNDS = 2
+MIN_GRADE, MAX_GRADE = 0, 5
+
+# Apytikslis simbolių skaičius vienam tokenui (naudojamas paketų dydžiui įvertinti)
+CHARS_PER_TOKEN = 3.5
+DEFAULT_BATCH_TOKEN_BUDGET = 24000
+
 def formulate_evaluation_message(questions_list, text):
     if not questions_list or not text:
         return None
     
     questions_json_str = json.dumps(questions_list, indent=2, ensure_ascii=False)
-
-    system_prompt = (
-        "Tu esi Šv. Rašto ekspertas. Tavo užduotis - įvertinti klausimų ir atsakymų kokybę (grade).\n"
-        "Vertinimo skalė:\n"
-        "0 - Visiškai netinkamas (neaiškus arba kliedesys)\n"
-        "1 - Aiškus, bet faktiškai klaidingas (prieštarauja šaltiniui).\n"
-        "2 - Faktiškai teisingas, bet turi didelių turinio trūkumų (neteisingi atsakymai, klaidinanti logika).\n"
-        "3 - Teisingas, bet yra techninių/formos klaidų (gramatika, citavimo tikslumas)\n"
-        "4 - Puikus turinys ir technika, bet stilius/formuluotė galėtų būti geresni.\n"
-        "5 - Idealus visais aspektais (turinys, logika, gramatika, didaktinė vertė)\n"
-
-        "Vertink griežtai hierarchiškai: jei klausimas faktiškai neteisingas, jis negali gauti daugiau nei 1 balo,\n"
-        "net jei jo gramatika ideali. Jei klausimas teisingas, bet neaiškus, jis negali gauti daugiau nei 4 balų.\n"
-
-        "Atsakymą pateik tik JSON formatu kaip sąrašą objektų, atitinkančių šią struktūrą:\n"
-        "[\n"
-        "  {\n"
-        "    \"id\": \"klausimo_id\",\n"
-        "    \"grade\": įvertinimas\n"
-        "    \"comment\": \"1-2 sakinių vertinimo paaiškinimas\"\n"
-        "  }\n"
-        "]"
-    )
     
     user_prompt = f"Biblijos ištrauka:\n{text}\n\nKlausimai vertinimui:\n{questions_json_str}" 
     
     return [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": EVALUATION_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def formulate_batch_evaluation_message(chapters):
+    """
+    One prompt for several chapters.
+    chapters: list of (chapter_name, text, questions_list)
+    """
+    if not chapters:
+        return None
+
+    parts = []
+    for chapter_name, text, questions_list in chapters:
+        questions_json_str = json.dumps(questions_list, indent=2, ensure_ascii=False)
+        parts.append(
+            f"=== Skyrius {chapter_name} ===\n"
+            f"Biblijos ištrauka:\n{text}\n\nKlausimai vertinimui:\n{questions_json_str}"
+        )
+
+    user_prompt = (
+        "Įvertink visų žemiau pateiktų skyrių klausimus. Kiekvieną klausimą vertink tik pagal jo skyriaus ištrauką "
+        "ir grąžink vieną bendrą sąrašą su visų klausimų id.\n\n" +
+        "\n\n".join(parts)
+    )
+
+    return [
+        {"role": "system", "content": EVALUATION_SYSTEM_PROMPT},
         {"role": "user", "content": user_prompt}
     ]
 
+def estimate_tokens(text):
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def pack_batches(chapters, token_budget=DEFAULT_BATCH_TOKEN_BUDGET):
+    """
+    Greedily group consecutive chapters so that each batch prompt stays within
+    token_budget. A chapter larger than the budget is sent on its own.
+    chapters: list of (chapter_name, text, questions_list)
+    """
+    budget = token_budget - estimate_tokens(EVALUATION_SYSTEM_PROMPT)
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for chapter in chapters:
+        _, text, questions_list = chapter
+        chapter_tokens = estimate_tokens(text) + estimate_tokens(json.dumps(questions_list, indent=2, ensure_ascii=False))
+        if current and current_tokens + chapter_tokens > budget:
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(chapter)
+        current_tokens += chapter_tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+def get_evaluation_items(evaluations_json):
+    """Return the list of evaluation objects, also when the model wrapped it in an object"""
+    if isinstance(evaluations_json, list):
+        return evaluations_json
+    if isinstance(evaluations_json, dict):
+        if "id" in evaluations_json:
+            return [evaluations_json]
+        for value in evaluations_json.values():
+            if isinstance(value, list):
+                return value
+    return []
+
+def split_batch_evaluations(evaluations_json, chapters):
+    """Split a batch response back into {chapter_name: [evaluations]} by question id"""
+    chapter_by_id = {}
+    for chapter_name, _, questions_list in chapters:
+        for question in questions_list:
+            chapter_by_id[question.get("id")] = chapter_name
+
+    results = {chapter_name: [] for chapter_name, _, _ in chapters}
+    for item in get_evaluation_items(evaluations_json):
+        chapter_name = chapter_by_id.get(item.get("id")) if isinstance(item, dict) else None
+        if chapter_name is None:
+            print(f"llm_evaluations klaida: atsakyme nežinomas klausimo id: {item}")
+            continue
+        results[chapter_name].append(item)
+    return results
+
 def evaluate_questions_with_llm(model, message):
     try:
-        response = completion(
+        content = llm_client.complete(
             model=model, 
             messages=message,
             response_format={"type": "json_object"}
         )
         
-        if response and response.choices:
-            content = response.choices[0].message.content
+        if content is not None:
             
-            try:
-                return json.loads(content)
-            except json.JSONDecodeError:
+            evaluations_json = parser.parse_evaluations_json(content)
+            if evaluations_json is None:
                 print("llm_evaluation klaida: Modelis grąžino nevalidų JSON formatą.")
-                return None
+                llm_client.discard(model, message, {"type": "json_object"})
+            return evaluations_json
         else:
             print("llm_evaluation klaida: nerasta atsakymo variantų atsakyme.")
             return None
             
+    # replay režime trūkstamas kešo įrašas turi sustabdyti paleidimą, o ne virsti tuščiu atsakymu
+    except response_cache.CacheMissError:
+        raise
     except Exception as e:
         print(f"llm_evaluation klaida generuojant įvertinimą su modelius {model}: {e}")
         return None
 
-def evaluate_questions(questions_path, model, source_text_path):
+async def async_evaluate_questions_with_llm(model, message, slots=None):
+    try:
+        content = await llm_client.acomplete(
+            model=model,
+            messages=message,
+            response_format={"type": "json_object"},
+            slots=slots
+        )
+
+        if content is not None:
+
+            evaluations_json = parser.parse_evaluations_json(content)
+            if evaluations_json is None:
+                print("llm_evaluation klaida: Modelis grąžino nevalidų JSON formatą.")
+                llm_client.discard(model, message, {"type": "json_object"})
+            return evaluations_json
+        else:
+            print("llm_evaluation klaida: nerasta atsakymo variantų atsakyme.")
+            return None
+
+    except response_cache.CacheMissError:
+        raise
+    except Exception as e:
+        print(f"llm_evaluation klaida generuojant įvertinimą su modelius {model}: {e}")
+        return None
+
+def question_hash(question):
+    """Content hash of a question (text + options + correct), stored with its grade to detect edits"""
+    content = json.dumps([question.get("question"), question.get("options"), question.get("correct")], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+def pending_questions(questions_path, evaluations_path, text_path=None, keep_skipped=True):
+    """
+    Questions of a chapter that need (re)evaluation against an existing evaluations file.
+    Returns: (pending, kept) - pending questions (new, changed since their grade, or
+    without a grade, e.g. left missing by an earlier partial response), and the still
+    valid evaluation items. Items without a hash (saved before hashes existed, see
+    stamp_existing_hashes) are valid unless the questions file is newer than them.
+    Pending questions that fail the local pre-screen (see prescreen; grounded in the
+    chapter at text_path, if given) are not sent anywhere: their deterministic grade
+    items are added to kept. Items of questions skipped by a sequential run are kept as
+    they are; keep_skipped=False (--reevaluate-skipped) makes them pending again.
+    """
+    questions_path, evaluations_path = Path(questions_path), Path(evaluations_path)
+    with open(questions_path, "r", encoding="utf-8") as f:
+        questions_list = json.load(f)
+
+    pending, kept = questions_list, []
+    items = None
+    if evaluations_path.exists():
+        try:
+            with open(evaluations_path, "r", encoding="utf-8") as f:
+                items = get_evaluation_items(json.load(f).get("results"))
+        except (json.JSONDecodeError, AttributeError):
+            items = None
+    if items is not None:
+        questions_changed = questions_path.stat().st_mtime > evaluations_path.stat().st_mtime
+        by_id = {item.get("id"): item for item in items if isinstance(item, dict)}
+        pending = []
+        for question in questions_list:
+            item = by_id.get(question.get("id"))
+            if item is None or (item.get("skipped") and not keep_skipped):
+                pending.append(question)
+            elif item.get("hash", None if questions_changed else question_hash(question)) == question_hash(question):
+                kept.append(item)
+            else:
+                pending.append(question)
+
+    if pending:
+        text = verse_index.read_chapter(text_path) if text_path is not None else None
+        pending, screened = prescreen.split_questions(pending, text)
+        if screened:
+            print(f"llm_evaluations: {len(screened)} klausimai atmesti vietinės patikros, vertintojams nesiunčiami.")
+        kept = kept + screened
+    return pending, kept
+
+def skipped_item(question, reason):
+    """Explicit record of a question the evaluator was not asked about (sequential mode), so it is not read as missing"""
+    return {"id": question.get("id"), "skipped": True, "comment": reason}
+
+def unsaved_local_items(kept):
+    """
+    Items of kept decided without the evaluator (pre-screen grades, sequential-mode
+    skips) that are not in the evaluations file yet - saved items carry a hash.
+    """
+    return [item for item in kept if (item.get("prescreen") or item.get("skipped")) and "hash" not in item]
+
+def save_local_items(questions_path, text_path, evaluations_path, model, kept):
+    """Save a chapter whose pending questions were all decided locally, without calling the evaluator"""
+    evaluations_json = file_io.add_important_parameters_to_evaluations([], model, Path(text_path))
+    evaluations_json = finish_evaluations(evaluations_json, questions_path, kept)
+    Path(evaluations_path).parent.mkdir(parents=True, exist_ok=True)
+    file_io.save_json_file(evaluations_json, evaluations_path)
+
+def finish_evaluations(evaluations_json, questions_path, kept=None):
+    """
+    Stamp every graded item with its question's hash and merge in the kept items of an
+    incremental evaluation, in question order (grades of removed questions are dropped).
+    Questions still without a grade are listed in metadata["missing"], so the next run
+    asks only for them.
+    """
+    with open(questions_path, "r", encoding="utf-8") as f:
+        questions_list = json.load(f)
+    hashes = {question.get("id"): question_hash(question) for question in questions_list}
+    by_id = {item.get("id"): item for item in kept or []}
+    by_id.update((item.get("id"), item) for item in get_evaluation_items(evaluations_json.get("results")) if isinstance(item, dict))
+    items = []
+    for question_id, content_hash in hashes.items():
+        if question_id in by_id:
+            items.append(dict(by_id[question_id], hash=content_hash))
+    evaluations_json["results"] = items
+
+    missing = [question_id for question_id in hashes if question_id not in by_id]
+    metadata = evaluations_json.setdefault("metadata", {})
+    if missing:
+        metadata["missing"] = missing
+        print(f"llm_evaluations: {metadata.get('source', '')} liko neįvertinti {len(missing)} klausimai: {', '.join(map(str, missing))}")
+    else:
+        metadata.pop("missing", None)
+    return evaluations_json
+
+def valid_grade(grade):
+    """Grade as an int in MIN_GRADE..MAX_GRADE, or None ("5" and 5.0 are accepted)"""
+    if isinstance(grade, bool):
+        return None
+    if isinstance(grade, str) and grade.strip().isdigit():
+        grade = int(grade.strip())
+    if isinstance(grade, (int, float)) and float(grade).is_integer() and MIN_GRADE <= grade <= MAX_GRADE:
+        return int(grade)
+    return None
+
+def validate_evaluations(evaluations_json, questions_list):
+    """
+    Diff a response against the submitted questions.
+    Returns: (valid, invalid) - valid: {id: item} for the first well-formed item of every
+    submitted id, with the grade normalized; invalid: the questions without one
+    (skipped, unknown grade, ...), in question order.
+    """
+    submitted = {question.get("id") for question in questions_list}
+    valid = {}
+    for item in get_evaluation_items(evaluations_json):
+        if not isinstance(item, dict) or item.get("id") not in submitted or item["id"] in valid:
+            continue
+        grade = valid_grade(item.get("grade"))
+        if grade is None:
+            continue
+        valid[item["id"]] = dict(item, grade=grade)
+    return valid, [question for question in questions_list if question.get("id") not in valid]
+
+def _ordered(valid, questions_list):
+    return [valid[question.get("id")] for question in questions_list if question.get("id") in valid]
+
+def repair_evaluations(model, evaluations_json, questions_list, text):
+    """
+    Validate a response and re-request only the missing or invalid questions, up to
+    REPAIR_ROUNDS narrow follow-up calls. Returns the valid items in question order.
+    When no item is valid the follow-up equals the original request, so its cached
+    reply is dropped first.
+    """
+    valid, invalid = validate_evaluations(evaluations_json, questions_list)
+    for _ in range(REPAIR_ROUNDS):
+        if not invalid:
+            break
+        print(f"llm_evaluations: {len(invalid)} įvertinimų trūksta arba jie netinkami, klausiama tik jų...")
+        message = formulate_evaluation_message(invalid, text)
+        if not valid:
+            # netinkami visi įvertinimai - prašymas sutampa su pradiniu, o jo blogas atsakymas yra keše
+            llm_client.discard(model, message, {"type": "json_object"})
+        followup = evaluate_questions_with_llm(model, message)
+        repaired, invalid = validate_evaluations(followup, invalid)
+        valid.update(repaired)
+        if invalid:
+            # vis dar nepilnas atsakymas neturi likti keše, kitaip tas pats klausimas gautų tą patį atsakymą
+            llm_client.discard(model, message, {"type": "json_object"})
+    return _ordered(valid, questions_list)
+
+async def async_repair_evaluations(model, evaluations_json, questions_list, text, semaphore):
+    """Async version of repair_evaluations"""
+    valid, invalid = validate_evaluations(evaluations_json, questions_list)
+    for _ in range(REPAIR_ROUNDS):
+        if not invalid:
+            break
+        print(f"llm_evaluations: {len(invalid)} įvertinimų trūksta arba jie netinkami, klausiama tik jų...")
+        message = formulate_evaluation_message(invalid, text)
+        if not valid:
+            # netinkami visi įvertinimai - prašymas sutampa su pradiniu, o jo blogas atsakymas yra keše
+            llm_client.discard(model, message, {"type": "json_object"})
+        followup = await async_evaluate_questions_with_llm(model, message, semaphore)
+        repaired, invalid = validate_evaluations(followup, invalid)
+        valid.update(repaired)
+        if invalid:
+            llm_client.discard(model, message, {"type": "json_object"})
+    return _ordered(valid, questions_list)
+
+def stamp_existing_hashes(evaluation_pairs):
+    """
+    One-off migration: add question hashes to evaluation files written before they
+    existed, where the questions file is not newer than its evaluations (so the grades
+    are known to match). evaluation_pairs: (questions_path, evaluations_path).
+    Returns: (stamped files, skipped files whose questions changed after evaluation)
+    """
+    stamped, skipped = 0, []
+    for questions_path, evaluations_path in evaluation_pairs:
+        if not Path(evaluations_path).exists() or not Path(questions_path).exists():
+            continue
+        with open(evaluations_path, "r", encoding="utf-8") as f:
+            evaluations_json = json.load(f)
+        items = get_evaluation_items(evaluations_json.get("results"))
+        if all(isinstance(item, dict) and "hash" in item for item in items):
+            continue
+        if Path(questions_path).stat().st_mtime > Path(evaluations_path).stat().st_mtime:
+            skipped.append(evaluations_path)
+            continue
+        file_io.save_json_file(finish_evaluations(evaluations_json, questions_path), evaluations_path)
+        stamped += 1
+    return stamped, skipped
+
+def load_evaluation_inputs(questions_path, source_text_path, questions_list=None):
+    """Returns: (questions_list, source_text) for an evaluation prompt, or None if the inputs do not match"""
     # check paths
     if not file_io.paths_exist([questions_path, source_text_path]):
-        return
+        return None
     # check if the Bible chapter match questions chapter
     if not chapters_match(questions_path, source_text_path):
-        return
-    
-    # generate prompt with all questions
-    with open(questions_path, "r", encoding="utf-8") as f:
-        questions_list = json.load(f)
-    with open(source_text_path, "r", encoding="utf-8") as f:
-        source_text = f.read()
-    message = formulate_evaluation_message(questions_list, source_text)
-    # generate evaluation
-    evaluations_json = evaluate_questions_with_llm(model, message)
-    
+        return None
+
+    # all questions (or only the given subset)
+    if questions_list is None:
+        with open(questions_path, "r", encoding="utf-8") as f:
+            questions_list = json.load(f)
+    return questions_list, verse_index.read_chapter(source_text_path)
+
+def prepare_evaluation_message(questions_path, source_text_path, questions_list=None):
+    inputs = load_evaluation_inputs(questions_path, source_text_path, questions_list)
+    if inputs is None:
+        return None
+    return formulate_evaluation_message(*inputs)
+
+def wrap_evaluations(evaluations_json, model, source_text_path):
     if evaluations_json is not None:
         return file_io.add_important_parameters_to_evaluations(evaluations_json, model, source_text_path)
     else:
         print("llm_evaluations klaida: nepavyko gauti JSON klausimų įvertinimų.")
         return
 
+def evaluate_questions(questions_path, model, source_text_path, questions_list=None):
+    inputs = load_evaluation_inputs(questions_path, source_text_path, questions_list)
+    if inputs is None:
+        return
+    questions_list, source_text = inputs
+    # generate evaluation
+    evaluations_json = evaluate_questions_with_llm(model, formulate_evaluation_message(questions_list, source_text))
+    if evaluations_json is not None:
+        evaluations_json = repair_evaluations(model, evaluations_json, questions_list, source_text) or None
+    return wrap_evaluations(evaluations_json, model, source_text_path)
+
+async def evaluate_questions_async(questions_path, model, source_text_path, semaphore, journal_id=None, questions_list=None):
+    inputs = load_evaluation_inputs(questions_path, source_text_path, questions_list)
+    if inputs is None:
+        return
+    questions_list, source_text = inputs
+    # semaforą llm_client laiko tik užklausos metu, ne laukiant prieš kartojimą
+    job_journal.record(journal_id, "sent")
+    evaluations_json = await async_evaluate_questions_with_llm(model, formulate_evaluation_message(questions_list, source_text), semaphore)
+    if evaluations_json is not None:
+        job_journal.record(journal_id, "received")
+        evaluations_json = await async_repair_evaluations(model, evaluations_json, questions_list, source_text, semaphore) or None
+    return wrap_evaluations(evaluations_json, model, source_text_path)
+
 def get_model_from_question_file(question_file):
     try:
         with open(question_file, "r", encoding="utf-8") as qf:
@@ -116,7 +466,61 @@ def chapters_match(questions_path, source_text_path):
         print(f"llm_evaluations klaida lyginant skyrius: {e}")
         return False
 
-def evaluate_questions_with_one_model(folder_path, model, output_path, source_text_path):
+def evaluate_chapters_batched(queue, model, output_path, token_budget=DEFAULT_BATCH_TOKEN_BUDGET):
+    """
+    Evaluate several chapters per request and save one {chapter}_evaluations.json per chapter.
+    Chapters that already have evaluations only send their new or changed questions.
+    queue: list of (questions_path, text_path). Returns the pairs that failed.
+    """
+    chapters = []
+    paths_by_chapter = {}
+    kept_by_chapter = {}
+    for questions_path, text_path in queue:
+        if not chapters_match(questions_path, text_path):
+            continue
+        evaluations_path = output_path / f"{text_path.stem}_evaluations.json"
+        questions_list, kept = pending_questions(questions_path, evaluations_path, text_path)
+        if not questions_list:
+            if unsaved_local_items(kept):
+                save_local_items(questions_path, text_path, evaluations_path, model, kept)
+            else:
+                print(f"llm_evaluations: failas {text_path.stem}_evaluations jau egzistuoja.")
+            continue
+        text = verse_index.read_chapter(text_path)
+        chapters.append((text_path.stem, text, questions_list))
+        paths_by_chapter[text_path.stem] = (questions_path, text_path)
+        kept_by_chapter[text_path.stem] = kept
+
+    failed = []
+    for batch in pack_batches(chapters, token_budget):
+        names = [chapter_name for chapter_name, _, _ in batch]
+        print(f"llm_evaluations: vertinami skyriai {', '.join(names)} viena užklausa...")
+
+        message = formulate_batch_evaluation_message(batch)
+        with telemetry.labels(chapter=",".join(names)):
+            evaluations_json = evaluate_questions_with_llm(model, message)
+        if evaluations_json is None:
+            failed.extend(paths_by_chapter[name] for name in names)
+            continue
+
+        batch_inputs = {chapter_name: (text, questions_list) for chapter_name, text, questions_list in batch}
+        for chapter_name, results in split_batch_evaluations(evaluations_json, batch).items():
+            questions_path, text_path = paths_by_chapter[chapter_name]
+            text, questions_list = batch_inputs[chapter_name]
+            with telemetry.labels(chapter=chapter_name):
+                results = repair_evaluations(model, results, questions_list, text)
+            if not results:
+                print(f"llm_evaluations klaida: atsakyme nėra {chapter_name} įvertinimų, skyrius grąžinamas į eilę.")
+                failed.append((questions_path, text_path))
+                continue
+            evaluations = file_io.add_important_parameters_to_evaluations(results, model, text_path)
+            evaluations = finish_evaluations(evaluations, questions_path, kept_by_chapter[chapter_name])
+            file_io.save_json_file(evaluations, output_path / f"{chapter_name}_evaluations.json")
+            print(f"llm_evaluations: {chapter_name} įvertinimai sėkmingai išsaugoti!")
+
+    return failed
+
+def evaluate_questions_with_one_model(folder_path, model, output_path, source_text_path, batch_token_budget=None):
     # error checks
     if not file_io.paths_exist([folder_path, output_path, source_text_path]): 
         return
@@ -131,31 +535,66 @@ def evaluate_questions_with_one_model(folder_path, model, output_path, source_te
         print("llm_calls klaida: nerastas modelis klausimų faile arba modelis autorius sutampa su vertintoju.")
         return
 
-    question_files_paths = sorted(folder_path.glob("*.json"))
-    source_text_files_paths = sorted(source_text_path.glob("*.txt"))
-    if (len(question_files_paths) != len(source_text_files_paths)):
-        print("llm_evaluations klaida: šaltinių failų kiekis nesutampa su klausimų failų kiekiu.")
+    # skyriai poruojami pagal pavadinimą, ne pagal vietą surūšiuotame sąraše
+    queue, missing = layout.pair_chapters(folder_path, source_text_path)
+    if missing:
+        print(f"llm_evaluations: {len(missing)} skyriai dar neturi klausimų ir praleidžiami: {', '.join(missing)}")
+    if not queue:
+        print(f"llm_evaluations klaida: {folder_path} nėra klausimų, atitinkančių šaltinio skyrius.")
         return
 
     # execution
     print(f"llm_evaluations: pradedamas {question_model} klausimų įvertinimas su {model}...")
 
-    for questions_path, text_path in zip(question_files_paths, source_text_files_paths):
-        evalutions_path = output_path / f"{text_path.stem}_evaluations.json"
-        if Path(evalutions_path).exists():
-            print(f"llm_evaluations: failas {evalutions_path.stem} jau egzistuoja.")
-            continue
+    # žymės - modelių aplankų pavadinimai, kaip ir scheduler
+    with telemetry.labels(stage="evaluate", author=providers.model_name(question_model), evaluator=providers.model_name(model)):
+        failed = _evaluate_queue(queue, model, output_path, batch_token_budget)
 
-        print(f"llm_evaluations: vertinami {text_path.stem} skyriaus klausimai...")
+    if failed:
+        print(f"llm_evaluations klaida: nepavyko įvertinti {len(failed)} skyrių: {', '.join(t.stem for _, t in failed)}")
+        return [t.stem for _, t in failed]
 
-        evaluations_json = evaluate_questions(questions_path, model, text_path)
+    print("llm_evaluations: visi įvertinimai sėkmingai išsaugoti!")
+    return []
 
-        if evaluations_json is not None:
-            file_io.save_json_file(evaluations_json, evalutions_path)
-            print("llm_evaluations: įvertinimai sėkmingai išsaugoti!")
-        else:
-            print("llm_evaluations klaida: gautas JSON None failas. Programa stabdoma.")
-            sys.exit()
+def _evaluate_queue(queue, model, output_path, batch_token_budget):
+    """Evaluation rounds of evaluate_questions_with_one_model. Returns the (questions_path, text_path) pairs that failed"""
+    for round_number in range(REQUEUE_ROUNDS + 1):
+        failed = []
+        if batch_token_budget:
+            failed = evaluate_chapters_batched(queue, model, output_path, batch_token_budget)
+            queue = []
 
-    print("llm_evaluations: visi įvertinimai sėkmingai išsaugoti!")
+        for questions_path, text_path in queue:
+            evalutions_path = output_path / f"{text_path.stem}_evaluations.json"
+            # vertinami tik nauji ar pakeisti klausimai, likę įvertinimai paliekami
+            pending, kept = pending_questions(questions_path, evalutions_path, text_path)
+            if not pending:
+                if unsaved_local_items(kept):
+                    save_local_items(questions_path, text_path, evalutions_path, model, kept)
+                else:
+                    print(f"llm_evaluations: failas {evalutions_path.stem} jau egzistuoja.")
+                continue
+
+            if kept:
+                print(f"llm_evaluations: {text_path.stem} - vertinami {len(pending)} nauji ar pakeisti klausimai...")
+            else:
+                print(f"llm_evaluations: vertinami {text_path.stem} skyriaus klausimai...")
+
+            with telemetry.labels(chapter=text_path.stem):
+                evaluations_json = evaluate_questions(questions_path, model, text_path, pending)
+
+            if evaluations_json is not None:
+                evaluations_json = finish_evaluations(evaluations_json, questions_path, kept)
+                file_io.save_json_file(evaluations_json, evalutions_path)
+                print("llm_evaluations: įvertinimai sėkmingai išsaugoti!")
+            else:
+                print(f"llm_evaluations klaida: gautas JSON None failas, {text_path.stem} grąžinamas į eilę.")
+                failed.append((questions_path, text_path))
 
+        if not failed:
+            break
+        queue = failed
+        if round_number < REQUEUE_ROUNDS:
+            print(f"llm_evaluations: {len(failed)} nepavykę skyriai grąžinami į eilę...")
+    return failed
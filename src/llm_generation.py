@@ -1,132 +1,487 @@
-from litellm import completion
-import time
-import json
+import asyncio
 import parser
+import prescreen
 import file_io
-import sys
+import job_journal
+import layout
+import llm_client
+import providers
+import response_cache
+import telemetry
+import verse_index
+
+# Kiek kartų per tą patį paleidimą nepavykę skyriai grąžinami į eilę po pagrindinio praėjimo.
+# API klaidas jau kartoja llm_client, todėl čia kartojami tik skyriai be tinkamo atsakymo.
+REQUEUE_ROUNDS = 1
+
+# Skaidymas į eilučių langus: ilgesni skyriai generuojami dalimis lygiagrečiai
+CHUNK_MIN_VERSES = 40
+CHUNK_VERSES = 20
+CHUNK_OVERLAP = 3
+
+def formulate_generation_message(bible_text, number_of_questions):
+    system_prompt = (
+        "Naudok taisyklingą lietuvių kalbą. Niekada nepraleisk raidžių."
+    )
+    user_prompt = (
+        "Sukurk " + number_of_questions +  " klausimus su keturiais atsakymų variantais (a, b, c, d) iš pateikto Biblijos teksto. " +
+        "Tik vienas atsakymas turi būti teisingas. " +
+        "Grąžink atsakymą IŠSKIRTINAI JSON formatu. JSON struktūra turi būti tokia:\n" +
+        "{\n" +
+        '  "questions": [\n' +
+        "    {\n" +
+        '      "question_text": "...",\n' +
+        '      "options": {"a": "...", "b": "...", "c": "...", "d": "..."},' +
+        '      "correct_answer": "a"\n' +
+        "    },\n" +
+        "    {... (antras klausimas) ...},\n" +
+        "    {... (trečias klausimas) ...}\n" +
+        "  ]\n" +
+        "}\n" +
+        "Neįtraukite jokių paaiškinimų ar papildamo teksto, tik JSON.\n\n" +
+        bible_text
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
 
 def get_bible_questions_from_llm(model, bible_text, number_of_questions=1):
     try:
         if model is not None and bible_text != "":
-            system_prompt = (
-                "Naudok taisyklingą lietuvių kalbą. Niekada nepraleisk raidžių."
-            )
-            user_prompt = (
-                "Sukurk " + number_of_questions +  " klausimus su keturiais atsakymų variantais (a, b, c, d) iš pateikto Biblijos teksto. " +
-                "Tik vienas atsakymas turi būti teisingas. " +
-                "Grąžink atsakymą IŠSKIRTINAI JSON formatu. JSON struktūra turi būti tokia:\n" +
-                "{\n" +
-                '  "questions": [\n' +
-                "    {\n" +
-                '      "question_text": "...",\n' +
-                '      "options": {"a": "...", "b": "...", "c": "...", "d": "..."},' +
-                '      "correct_answer": "a"\n' +
-                "    },\n" +
-                "    {... (antras klausimas) ...},\n" +
-                "    {... (trečias klausimas) ...}\n" +
-                "  ]\n" +
-                "}\n" +
-                "Neįtraukite jokių paaiškinimų ar papildamo teksto, tik JSON.\n\n" +
-                bible_text
-            )
-            message = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            response = completion(
-                model=model, 
-                messages=message)
-            
-            print(response)
-            
-            if response.choices:
-                return response.choices[0].message["content"]
+            message = formulate_generation_message(bible_text, number_of_questions)
+            return llm_client.complete(model=model, messages=message)
         return None
+    # replay režime trūkstamas kešo įrašas turi sustabdyti paleidimą, o ne virsti tuščiu atsakymu
+    except response_cache.CacheMissError:
+        raise
     except Exception as e:
         print(f"llm_calls klaida: {e}")
         return None
-    
-def generate_questions(model, bible_text, chapter_name, question_file):
-    all_questions = []
-    question_counter = 1
-    
-    print(f"llm_calls: generuojami klausimai naudojant modelį {model}...")
-    number_of_questions = file_io.calculate_questions_number(bible_text)
 
-    max_retries = 3
-    raw_question = None
-    for attempt in range(max_retries):
-        raw_question = get_bible_questions_from_llm(
-            model=model, 
-            bible_text=bible_text, 
-            number_of_questions=number_of_questions
-        )
-        if raw_question is not None: 
-            break
+async def async_get_bible_questions_from_llm(model, bible_text, number_of_questions=1, slots=None):
+    try:
+        if model is not None and bible_text != "":
+            message = formulate_generation_message(bible_text, number_of_questions)
+            return await llm_client.acomplete(model=model, messages=message, slots=slots)
+        return None
+    except response_cache.CacheMissError:
+        raise
+    except Exception as e:
+        print(f"llm_calls klaida: {e}")
+        return None
+
+def stream_bible_questions_from_llm(model, bible_text, number_of_questions=1):
+    """Streaming mode: yields each parsed question as soon as its {...} object is complete"""
+    if model is None or bible_text == "":
+        return
+    message = formulate_generation_message(bible_text, number_of_questions)
+    stream_parser = parser.QuestionStreamParser()
+    for chunk in llm_client.stream(model=model, messages=message):
+        yield from stream_parser.feed(chunk)
+
+async def async_stream_bible_questions_from_llm(model, bible_text, number_of_questions=1, slots=None):
+    """Async variant of stream_bible_questions_from_llm"""
+    if model is None or bible_text == "":
+        return
+    message = formulate_generation_message(bible_text, number_of_questions)
+    stream_parser = parser.QuestionStreamParser()
+    async for chunk in llm_client.astream(model=model, messages=message, slots=slots):
+        for parsed in stream_parser.feed(chunk):
+            yield parsed
+
+def make_question_object(parsed, model, chapter_name, question_number):
+    if not parsed.get('question') or not parsed.get('options'):
+        print(f"llm_calls klaida: praleistas nevalidus klausimas iš modelio {model}.")
+        return None
+
+    return {
+        "id": f"{chapter_name}_{question_number:03d}",
+        "question": parsed.get('question'),
+        "options": parsed.get('options'),
+        "correct": parsed.get('correct'),
+        "model": model,
+        "chapter": chapter_name
+    }
+
+def build_question_objects(raw_question, model, chapter_name):
+    all_questions = []
 
-        if attempt < max_retries - 1:
-            print(f"llm_calls: bandymas {attempt + 1} nepavyko. Po 5 sek. kartojimas...")
-            time.sleep(5)
-    else:
-        print(f"llm_calls klaida: nepavyko gauti klausimų iš modelio {model}.")
-        sys.exit("llm_calls: programa sustabdyta.")
-        
     parsed_list = parser.parse_questions_to_json(raw_question)
-        
+
     for parsed in parsed_list:
-        if not parsed.get('question') or not parsed.get('options'):
-            print(f"llm_calls klaida: praleistas nevalidus klausimas iš modelio {model}.")
-            continue
-        
-        question_id = f"{chapter_name}_{question_counter:03d}"
-        question_counter += 1
-        
-        question_obj = {
-            "id": question_id,
-            "question": parsed.get('question'),
-            "options": parsed.get('options'),
-            "correct": parsed.get('correct'),
-            "model": model,
-            "chapter": chapter_name
-        }
-        all_questions.append(question_obj)
-    
+        question_obj = make_question_object(parsed, model, chapter_name, len(all_questions) + 1)
+        if question_obj is not None:
+            all_questions.append(question_obj)
+
+    return all_questions
+
+def collect_streamed_questions(model, bible_text, chapter_name, number_of_questions, on_question=None):
+    """
+    Generate one chapter in streaming mode. on_question (if given) is called with
+    every finished question object while the rest of the reply is still streaming.
+    Returns the list of question objects, or None if the stream failed.
+    """
+    all_questions = []
+    try:
+        for parsed in stream_bible_questions_from_llm(model, bible_text, number_of_questions):
+            question_obj = make_question_object(parsed, model, chapter_name, len(all_questions) + 1)
+            if question_obj is not None:
+                all_questions.append(question_obj)
+                if on_question is not None:
+                    on_question(question_obj)
+    except response_cache.CacheMissError:
+        raise
+    except Exception as e:
+        print(f"llm_calls klaida: {e}")
+        return None
+    return all_questions
+
+async def async_collect_streamed_questions(model, bible_text, chapter_name, number_of_questions, on_question=None, slots=None):
+    """Async variant of collect_streamed_questions"""
+    all_questions = []
+    try:
+        async for parsed in async_stream_bible_questions_from_llm(model, bible_text, number_of_questions, slots):
+            question_obj = make_question_object(parsed, model, chapter_name, len(all_questions) + 1)
+            if question_obj is not None:
+                all_questions.append(question_obj)
+                if on_question is not None:
+                    on_question(question_obj)
+    except response_cache.CacheMissError:
+        raise
+    except Exception as e:
+        print(f"llm_calls klaida: {e}")
+        return None
+    return all_questions
+
+def save_questions(all_questions, question_file):
     try:
-        with open(question_file, "w", encoding="utf-8") as f:
-            json.dump(all_questions, f, ensure_ascii=False, indent=2)
+        file_io.save_json_file(all_questions, question_file, indent=2)
         print(f"llm_calls: {len(all_questions)} klausimų įrašyta į '{question_file}'.")
+        return True
     except Exception as e:
         print(f"llm_calls klaida: nepavyko išsaugoti: {e}")
+        return False
+
+def generate_questions(model, bible_text, chapter_name, question_file, stream=False, on_question=None, regenerate=True):
+    """
+    A chapter whose questions are mostly structurally broken (see prescreen) is generated once more;
+    on_question then reports the same ids again with their replacement questions.
+    """
+    print(f"llm_calls: generuojami klausimai naudojant modelį {model}...")
+    number_of_questions = file_io.calculate_questions_number(bible_text, chapter_name)
+
+    # API klaidas kartoja llm_client, todėl čia nesėkmė grąžinama iš karto
+    if stream:
+        raw_question = collect_streamed_questions(model, bible_text, chapter_name, number_of_questions, on_question)
+    else:
+        raw_question = get_bible_questions_from_llm(
+            model=model,
+            bible_text=bible_text,
+            number_of_questions=number_of_questions
+        )
+    if raw_question is None:
+        print(f"llm_calls klaida: nepavyko gauti klausimų iš modelio {model}.")
+        return False
+
+    all_questions = raw_question if stream else build_question_objects(raw_question, model, chapter_name)
+    if regenerate and prescreen.needs_regeneration(all_questions):
+        print(f"llm_calls: dauguma {chapter_name} klausimų sugadinti, generuojama iš naujo...")
+        llm_client.discard(model, formulate_generation_message(bible_text, number_of_questions))
+        return generate_questions(model, bible_text, chapter_name, question_file, stream, on_question, regenerate=False)
+    if not all_questions:
+        # netinkamas atsakymas neturi likti keše, o tuščias failas nerašomas - kitas bandymas skyrių pergeneruos
+        llm_client.discard(model, formulate_generation_message(bible_text, number_of_questions))
+        print(f"llm_calls klaida: modelio {model} atsakyme nėra {chapter_name} klausimų.")
+        return False
+    return save_questions(all_questions, question_file)
+
+async def generate_questions_async(model, bible_text, chapter_name, question_file, semaphore, journal_id=None, stream=False, on_question=None, chunked=False, regenerate=True):
+    """
+    With stream=True the reply is parsed while it streams in and on_question
+    is called with each finished question object. A chapter whose questions are
+    mostly structurally broken (see prescreen) is generated once more, and
+    on_question reports the same ids again with their replacements - the last
+    object reported for an id is the one saved.
+    With chunked=True long chapters are generated in verse windows (see verse_windows).
+    """
+    windows = verse_windows(chapter_name) if chunked else None
+    if windows:
+        return await generate_questions_chunked_async(model, chapter_name, question_file, semaphore, windows, journal_id, stream, on_question, regenerate)
+
+    number_of_questions = file_io.calculate_questions_number(bible_text, chapter_name)
+
+    # semaforą llm_client laiko tik užklausos metu, ne laukiant prieš kartojimą
+    print(f"llm_calls: generuojami {chapter_name} klausimai naudojant modelį {model}...")
+    job_journal.record(journal_id, "sent")
+    if stream:
+        raw_question = await async_collect_streamed_questions(
+            model, bible_text, chapter_name, number_of_questions, on_question, slots=semaphore
+        )
+    else:
+        raw_question = await async_get_bible_questions_from_llm(
+            model=model,
+            bible_text=bible_text,
+            number_of_questions=number_of_questions,
+            slots=semaphore
+        )
+    if raw_question is None:
+        print(f"llm_calls klaida: nepavyko gauti {chapter_name} klausimų iš modelio {model}.")
+        job_journal.record(journal_id, "failed")
+        return False
+    job_journal.record(journal_id, "received")
+
+    all_questions = raw_question if stream else build_question_objects(raw_question, model, chapter_name)
+    job_journal.record(journal_id, "parsed", questions=len(all_questions))
+    if regenerate and prescreen.needs_regeneration(all_questions):
+        print(f"llm_calls: dauguma {chapter_name} klausimų sugadinti, generuojama iš naujo...")
+        llm_client.discard(model, formulate_generation_message(bible_text, number_of_questions))
+        return await generate_questions_async(
+            model, bible_text, chapter_name, question_file, semaphore, journal_id, stream, on_question, regenerate=False
+        )
+    if not all_questions:
+        # netinkamas atsakymas neturi likti keše, o tuščias failas nerašomas - kitas bandymas skyrių pergeneruos
+        llm_client.discard(model, formulate_generation_message(bible_text, number_of_questions))
+        print(f"llm_calls klaida: modelio {model} atsakyme nėra {chapter_name} klausimų.")
+        job_journal.record(journal_id, "failed")
+        return False
+    if not save_questions(all_questions, question_file):
+        job_journal.record(journal_id, "failed")
+        return False
+    job_journal.record(journal_id, "written", path=question_file)
+    return True
+
+def verse_windows(chapter_name, chunk_verses=CHUNK_VERSES, overlap=CHUNK_OVERLAP, min_verses=CHUNK_MIN_VERSES):
+    """
+    Split an indexed chapter into overlapping verse windows.
+    Every window owns about chunk_verses verses (owned ranges cover the chapter
+    exactly once; a short tail is merged into the previous window) and its text
+    is extended by overlap verses on both sides for context. The chapter's usual
+    question count (last verse // 3) is shared between windows by owned verses.
+    Returns: [{"first", "last", "questions", "text"}], or None if the chapter is
+    not indexed or too short to be worth splitting.
+    """
+    index = verse_index.open_index()
+    if chapter_name not in index:
+        return None
+    verse_count = index.verse_count(chapter_name)
+    if verse_count < min_verses:
+        return None
+
+    chapter_text = index.chapter_text(chapter_name)
+    total_questions = max(1, verse_count // 3)
+    owned_firsts = list(range(1, verse_count + 1, chunk_verses))
+    if len(owned_firsts) > 1 and verse_count - owned_firsts[-1] + 1 < chunk_verses // 2:
+        owned_firsts.pop()
+
+    windows = []
+    for i, owned_first in enumerate(owned_firsts):
+        owned_last = owned_firsts[i + 1] - 1 if i + 1 < len(owned_firsts) else verse_count
+        questions = round(total_questions * owned_last / verse_count) - round(total_questions * (owned_first - 1) / verse_count)
+        first = max(1, owned_first - overlap)
+        last = min(verse_count, owned_last + overlap)
+        start = index.verse_span(chapter_name, first)["char_start"]
+        end = index.verse_span(chapter_name, last)["char_end"]
+        windows.append({
+            "first": first,
+            "last": last,
+            "questions": max(1, questions),
+            "text": chapter_text[start:end],
+        })
+    return windows
+
+async def async_get_parsed_questions(model, bible_text, number_of_questions, stream=False, slots=None):
+    """One generation request. Returns the parsed questions, or None if the reply was unusable"""
+    if stream:
+        try:
+            parsed_list = [parsed async for parsed in async_stream_bible_questions_from_llm(model, bible_text, number_of_questions, slots)]
+        except response_cache.CacheMissError:
+            raise
+        except Exception as e:
+            print(f"llm_calls klaida: {e}")
+            return None
+    else:
+        raw_question = await async_get_bible_questions_from_llm(model, bible_text, number_of_questions, slots)
+        if raw_question is None:
+            return None
+        parsed_list = parser.parse_questions_to_json(raw_question)
+
+    if not parsed_list:
+        llm_client.discard(model, formulate_generation_message(bible_text, number_of_questions))
+        return None
+    return parsed_list
+
+async def generate_window_async(model, window, chapter_name, semaphore, stream=False):
+    """Generate one verse window; a successful window stays cached, so a rerun only repeats the bad ones"""
+    number_of_questions = str(window["questions"])
+    label = f"{chapter_name}:{window['first']}-{window['last']}"
+
+    print(f"llm_calls: generuojami {label} klausimai naudojant modelį {model}...")
+    parsed_list = await async_get_parsed_questions(model, window["text"], number_of_questions, stream, semaphore)
+    if parsed_list is None:
+        print(f"llm_calls klaida: nepavyko gauti {label} klausimų iš modelio {model}.")
+    return parsed_list
+
+def merge_window_questions(window_results, model, chapter_name):
+    """
+    Merge window results in verse order. Questions repeated in the overlap are
+    dropped and IDs are numbered contiguously (Mt_26_001, Mt_26_002, ...).
+    """
+    all_questions = []
+    seen = set()
+    for parsed_list in window_results:
+        for parsed in parsed_list:
+            key = " ".join(str(parsed.get("question", "")).lower().split())
+            if key in seen:
+                continue
+            question_obj = make_question_object(parsed, model, chapter_name, len(all_questions) + 1)
+            if question_obj is not None:
+                seen.add(key)
+                all_questions.append(question_obj)
+    return all_questions
+
+async def generate_questions_chunked_async(model, chapter_name, question_file, semaphore, windows, journal_id=None, stream=False, on_question=None, regenerate=True):
+    """
+    Chunked mode of generate_questions_async: all windows are generated
+    concurrently. If any window fails the chapter fails, but windows that
+    succeeded are in the response cache, so a rerun only repeats the bad one.
+    on_question is called with every merged question (IDs are known only after
+    merging the windows). A merged chapter that is mostly structurally broken is
+    generated once more, as in generate_questions_async.
+    """
+    job_journal.record(journal_id, "sent", windows=len(windows))
+    window_results = await asyncio.gather(
+        *(generate_window_async(model, window, chapter_name, semaphore, stream) for window in windows)
+    )
+    if any(result is None for result in window_results):
+        job_journal.record(journal_id, "failed")
+        return False
+    job_journal.record(journal_id, "received")
+
+    all_questions = merge_window_questions(window_results, model, chapter_name)
+    job_journal.record(journal_id, "parsed", questions=len(all_questions))
+    if not all_questions:
+        for window in windows:
+            llm_client.discard(model, formulate_generation_message(window["text"], str(window["questions"])))
+        print(f"llm_calls klaida: modelio {model} atsakymuose nėra {chapter_name} klausimų.")
+        job_journal.record(journal_id, "failed")
+        return False
+    if on_question is not None:
+        for question_obj in all_questions:
+            on_question(question_obj)
+    if regenerate and prescreen.needs_regeneration(all_questions):
+        print(f"llm_calls: dauguma {chapter_name} klausimų sugadinti, visi langai generuojami iš naujo...")
+        for window in windows:
+            llm_client.discard(model, formulate_generation_message(window["text"], str(window["questions"])))
+        return await generate_questions_chunked_async(
+            model, chapter_name, question_file, semaphore, windows, journal_id, stream, on_question, regenerate=False
+        )
+    if not save_questions(all_questions, question_file):
+        job_journal.record(journal_id, "failed")
+        return False
+    job_journal.record(journal_id, "written", path=question_file)
+    return True
 
 def process_one_text_file(text_path, model, question_output_path):
     print(f"llm_calls: apdorojamas failas: {text_path.name}")
 
-    text = text_path.read_text(encoding="utf-8")
+    text = verse_index.read_chapter(text_path)
     name = text_path.stem
-    
-    generate_questions(model, text, name, question_output_path)
-    
+
+    with telemetry.labels(stage="generate", chapter=name, author=providers.model_name(model)):
+        if not generate_questions(model, text, name, question_output_path):
+            return False
+
     print(f"llm_calls: {name} apdorotas sėkmingai.")
+    return True
 
 def generate_questions_from_all_text_files(folder_path, model, output_path):
     if folder_path.exists() is False:
         print(f"llm_calls klaida: nurodytas aplankas '{folder_path}' neegzistuoja.")
         return
-    
-    text_files_paths = list(folder_path.glob("*.txt"))
+
+    text_files_paths = list(layout.source_chapters(folder_path).values())
     print(f"main: Rasta {len(text_files_paths)} failų. Pradedamas apdorojimas...")
 
-    for text_path in text_files_paths:
-        try:
-            name = text_path.stem 
-            question_output_path = output_path / f"questions_{name}.json"
+    queue = text_files_paths
+    for round_number in range(REQUEUE_ROUNDS + 1):
+        failed = []
+        for text_path in queue:
+            try:
+                name = text_path.stem
+                question_output_path = output_path / f"questions_{name}.json"
 
-            if question_output_path.exists():
-                print(f"llm_calls: failas '{question_output_path}' jau egzistuoja. Praleidžiama...")
-                continue
+                if question_output_path.exists():
+                    print(f"llm_calls: failas '{question_output_path}' jau egzistuoja. Praleidžiama...")
+                    continue
+
+                if not process_one_text_file(text_path, model, question_output_path):
+                    failed.append(text_path)
+                    continue
+
+                print(f"llm_calls: failas {name} apdorotas sėkmingai.")
+            except response_cache.CacheMissError:
+                raise
+            except Exception as e:
+                print(f"llm_calls: klaida apdorojant {text_path.name}: {e}")
+                failed.append(text_path)
+
+        if not failed:
+            break
+        queue = failed
+        if round_number < REQUEUE_ROUNDS:
+            print(f"llm_calls: {len(failed)} nepavykę skyriai grąžinami į eilę...")
+
+    if failed:
+        print(f"llm_calls klaida: nepavyko sugeneruoti {len(failed)} skyrių: {', '.join(p.stem for p in failed)}")
+    return [p.stem for p in failed]
+
+async def generate_questions_from_all_text_files_async(folder_path, model, output_path, concurrency_limits=None):
+    """
+    Concurrent version of generate_questions_from_all_text_files.
+    Chapters are generated in parallel, bounded by the provider's concurrency
+    limit (providers.PROVIDER_CONCURRENCY, overridable with concurrency_limits).
+    Returns the list of chapter names that failed.
+    """
+    if folder_path.exists() is False:
+        print(f"llm_calls klaida: nurodytas aplankas '{folder_path}' neegzistuoja.")
+        return []
+
+    text_files_paths = list(layout.source_chapters(folder_path).values())
+    print(f"main: Rasta {len(text_files_paths)} failų. Pradedamas lygiagretus apdorojimas...")
 
-            process_one_text_file(text_path, model, question_output_path)
+    semaphore = providers.create_provider_semaphores([model], concurrency_limits)[providers.get_provider(model)]
 
-            print(f"llm_calls: failas {name} apdorotas sėkmingai.")
+    async def process(text_path):
+        name = text_path.stem
+        question_output_path = output_path / f"questions_{name}.json"
+
+        if question_output_path.exists():
+            print(f"llm_calls: failas '{question_output_path}' jau egzistuoja. Praleidžiama...")
+            return None
+
+        try:
+            text = verse_index.read_chapter(text_path)
+            with telemetry.labels(stage="generate", chapter=name, author=providers.model_name(model)):
+                if await generate_questions_async(model, text, name, question_output_path, semaphore):
+                    print(f"llm_calls: failas {name} apdorotas sėkmingai.")
+                    return None
+        except response_cache.CacheMissError:
+            raise
         except Exception as e:
-            print(f"llm_calls: klaida apdorojant {text_path.name}: {e}")
\ No newline at end of file
+            print(f"llm_calls: klaida apdorojant {text_path.name}: {e}")
+        return name
+
+    queue = text_files_paths
+    for round_number in range(REQUEUE_ROUNDS + 1):
+        results = await asyncio.gather(*(process(text_path) for text_path in queue))
+        failed = [name for name in results if name is not None]
+        if not failed:
+            break
+        queue = [text_path for text_path in queue if text_path.stem in failed]
+        if round_number < REQUEUE_ROUNDS:
+            print(f"llm_calls: {len(failed)} nepavykę skyriai grąžinami į eilę...")
+
+    if failed:
+        print(f"llm_calls klaida: nepavyko sugeneruoti {len(failed)} skyrių: {', '.join(failed)}")
+    return failed
@@ -1,50 +1,178 @@
+"""
+Komandinės eilutės įrankis:
+    python src/main.py generate [--books Mk Lk] [--models gemini-2.5-flash] [--dry-run]
+    python src/main.py evaluate [--resume] [--dedup | --sequential] [--reevaluate-skipped]
+    python src/main.py stats [--plot]
+    python src/main.py filter [--min-evaluators 2] [--min-grade 5]
+    python src/main.py export matrica.csv [--books Mt]    # visa vertinimų matrica
+    python src/main.py export rezultatas.json rezultatas.csv
+    python src/main.py costs
+    python src/main.py compact [--remove-json]
+    python src/main.py stamp-hashes
+Be komandos paleidžiamas visas generavimo ir vertinimo ciklas (kaip anksčiau),
+pvz. python src/main.py --resume.
+
+Sunkios bibliotekos (litellm, pandas, matplotlib) importuojamos tik tų komandų
+viduje, kurioms jų reikia, todėl --help ar --dry-run paleidžiami akimirksniu.
+"""
+
+import argparse
+import asyncio
 from pathlib import Path
-import file_io 
-import llm_generation
-import llm_evaluation
-
-def main():
-    parent_folder = Path(__file__).parent.parent
-
-    klausimu_autorius = "mistral-small"
-    vertintojas = "gemini-2.5-flash"
-    evangelija = "mato_evangelija"
-    rezultatai = "Mt_evaluations"
-    klausimai = "klausimai_Mt"
-
-    api_keys_path = parent_folder / "API_keys.txt"
-    source_text_path = parent_folder / "source_text" / evangelija
-    output_path = parent_folder / "results/evaluations" / f"{vertintojas}_vertina_{klausimu_autorius}" / rezultatai
-    questions_path = parent_folder / "results/questions" / klausimu_autorius / klausimai
-
-
-    file_io.read_and_save_API_keys(api_keys_path)
-    
-    models = [
-        f"gemini/{vertintojas}",
-        #f"mistral/{vertintojas}-2508"
-        #f"mistral/{vertintojas}-2506"
-    ]
-    
-    # llm_generation.generate_questions_from_all_text_files(
-    #    folder_path=folder_path,
-    #    model=models[0],
-    #    output_path=output_path)
-
-    # llm_generation.process_one_text_file(
-    #     model="mistral/mistral-small-2506", 
-    #     question_output_path= parent_folder / "results/questions/mistral-small/klausimai_Mk/questions_Mk_3.json",
-    #     text_path= parent_folder / "source_text/morkaus_evangelija/Mk_3.txt"
-    #     )
-    
-    llm_evaluation.evaluate_questions_with_one_model(
-        folder_path=questions_path, 
-        model=models[0], 
-        output_path=output_path, 
-        source_text_path=source_text_path
-    )
-
-    
+import file_io
+import filter_perfect_questions
+import providers
+import scheduler
+
+PARENT_FOLDER = Path(__file__).parent.parent
+
+
+def run_pipeline(args, stages):
+    if not args.dry_run:
+        file_io.read_and_save_API_keys(PARENT_FOLDER / "API_keys.txt")
+
+    # None - visi modeliai (providers.MODELS) ir visos evangelijos (source_text)
+    models = {name: providers.MODELS[name] for name in args.models} if args.models else None
+    asyncio.run(scheduler.run_matrix(
+        PARENT_FOLDER,
+        models=models,
+        books=args.books,
+        max_workers=args.max_workers,
+        resume=args.resume,
+        stream=args.stream,
+        chunked=args.chunked,
+        dedup_questions=args.dedup,
+        stages=stages,
+        dry_run=args.dry_run,
+        sequential=args.sequential,
+        evaluator_order=args.evaluator_order,
+        reevaluate_skipped=args.reevaluate_skipped,
+    ))
+
+
+def run_stats(args):
+    import stats
+
+    stats.print_statistics()
+    print("\n")
+    stats.print_cross_evaluation_statistics()
+    if args.plot:
+        print("\n")
+        stats.plot_cross_evaluation_charts()
+
+
+def run_filter(args):
+    filter_perfect_questions.filter_perfect_questions(min_evaluators=args.min_evaluators, min_grade=args.min_grade)
+
+
+def run_export(args):
+    if len(args.paths) == 1:
+        import exporter
+
+        exporter.export_matrix(args.paths[0], books=args.books)
+        return
+    import parser
+
+    parser.json_to_csv(*args.paths)
+
+
+def run_costs(args):
+    import telemetry
+
+    telemetry.print_summary(args.path)
+
+
+def run_compact(args):
+    import compact_store
+
+    compact_store.compact_results(PARENT_FOLDER / "results", codec=args.codec, remove_json=args.remove_json)
+
+
+def run_stamp_hashes(args):
+    models = {name: providers.MODELS[name] for name in args.models} if args.models else None
+    scheduler.stamp_question_hashes(PARENT_FOLDER, models=models, books=args.books)
+
+
+def add_pipeline_arguments(arg_parser, defaults=True):
+    """
+    The options are accepted both before and after the command. The command's copy is
+    added with defaults=False (argparse.SUPPRESS), so it only sets what was given and
+    does not overwrite values given before the command (main.py --resume generate).
+    """
+    default = {} if defaults else {"default": argparse.SUPPRESS}
+    arg_parser.add_argument("--models", nargs="+", choices=sorted(providers.MODELS), help="klausimų autoriai ir vertintojai (numatyta: visi)", **default)
+    arg_parser.add_argument("--books", nargs="+", help="evangelijų kodai, pvz. Mt Mk (numatyta: visos)", **default)
+    arg_parser.add_argument("--max-workers", type=int, **(default if not defaults else {"default": scheduler.DEFAULT_MAX_WORKERS}))
+    arg_parser.add_argument("--resume", action="store_true", help="tęsti tik žurnale nebaigtus planuoklio darbus", **default)
+    arg_parser.add_argument("--stream", action="store_true", help="generuoti srautiniu režimu", **default)
+    arg_parser.add_argument("--chunked", action="store_true", help="ilgus skyrius generuoti eilučių langais", **default)
+    evaluation_mode = arg_parser.add_mutually_exclusive_group()
+    evaluation_mode.add_argument("--dedup", action="store_true", help="vertinti po vieną beveik vienodų klausimų atstovą", **default)
+    evaluation_mode.add_argument("--sequential", action="store_true", help="vertintojai iš eilės, toliau siunčiami tik dar galintys būti tobuli klausimai", **default)
+    arg_parser.add_argument("--evaluator-order", nargs="+", choices=sorted(providers.MODELS), help="vertintojų tvarka su --sequential (numatyta: pigiausias pirmas)", **default)
+    arg_parser.add_argument("--reevaluate-skipped", action="store_true", help="vėl vertinti nuosekliu vertinimu praleistus klausimus", **default)
+    arg_parser.add_argument("--dry-run", action="store_true", help="tik parodyti, kurie darbai laukia", **default)
+
+
+def build_parser():
+    arg_parser = argparse.ArgumentParser(description="Klausimų generavimas ir kryžminis vertinimas")
+    add_pipeline_arguments(arg_parser)
+    subparsers = arg_parser.add_subparsers(dest="command")
+
+    generate = subparsers.add_parser("generate", help="generuoti trūkstamus klausimus")
+    add_pipeline_arguments(generate, defaults=False)
+    generate.set_defaults(handler=lambda args: run_pipeline(args, ("generate",)))
+
+    evaluate = subparsers.add_parser("evaluate", help="įvertinti jau sugeneruotus klausimus")
+    add_pipeline_arguments(evaluate, defaults=False)
+    evaluate.set_defaults(handler=lambda args: run_pipeline(args, ("evaluate",)))
+
+    stats = subparsers.add_parser("stats", help="spausdinti vertinimų statistiką")
+    stats.add_argument("--plot", action="store_true", help="taip pat išsaugoti diagramas")
+    stats.set_defaults(handler=run_stats)
+
+    filter_parser = subparsers.add_parser("filter", help="atrinkti tobulus klausimus")
+    filter_parser.add_argument("--min-evaluators", type=int, default=filter_perfect_questions.MIN_EVALUATORS)
+    filter_parser.add_argument("--min-grade", type=int, default=filter_perfect_questions.MIN_GRADE)
+    filter_parser.set_defaults(handler=run_filter)
+
+    export = subparsers.add_parser("export", help="eksportuoti vertinimus į CSV / XLSX / Parquet (pagal failo plėtinį)")
+    export.add_argument("paths", nargs="+", metavar="[input] output",
+                        help="vienas kelias - visa vertinimų matrica; du - konvertuoti sujungtą JSON failą")
+    export.add_argument("--books", nargs="+", default=argparse.SUPPRESS, help="tik šios evangelijos (matricai)")
+    export.set_defaults(handler=run_export)
+
+    costs = subparsers.add_parser("costs", help="žetonai, kaina ir vėlinimas pagal autorių/vertintoją ir evangeliją")
+    costs.add_argument("--path", default=None, help="telemetrijos failas (numatyta: results/telemetry.jsonl)")
+    costs.set_defaults(handler=run_costs)
+
+    compact = subparsers.add_parser("compact", help="supakuoti rezultatus į vieną suspaustą JSONL failą kiekvienam (modelis, knyga)")
+    compact.add_argument("--codec", choices=("gzip", "zstd"), default="gzip", help="zstd reikalauja paketo zstandard")
+    compact.add_argument("--remove-json", action="store_true", help="ištrinti supakuotus JSON failus")
+    compact.set_defaults(handler=run_compact)
+
+    stamp = subparsers.add_parser("stamp-hashes", help="pridėti klausimų turinio maišus seniems įvertinimams (vienkartinė migracija)")
+    stamp.add_argument("--models", nargs="+", choices=sorted(providers.MODELS), default=argparse.SUPPRESS)
+    stamp.add_argument("--books", nargs="+", default=argparse.SUPPRESS)
+    stamp.set_defaults(handler=run_stamp_hashes)
+
+    return arg_parser
+
+
+def main(argv=None):
+    arg_parser = build_parser()
+    args = arg_parser.parse_args(argv)
+    if args.command == "export" and len(args.paths) > 2:
+        arg_parser.error("export: nurodykite išvesties failą arba įvesties ir išvesties failus")
+    if getattr(args, "dedup", False) and getattr(args, "sequential", False):
+        # parinktys gali būti prieš ir po komandos, todėl grupės draudimas čia tikrinamas dar kartą
+        arg_parser.error("--dedup ir --sequential negali būti naudojami kartu")
+    if args.command is None:
+        # be komandos - visas ciklas, kaip anksčiau
+        run_pipeline(args, scheduler.STAGES)
+        return
+    args.handler(args)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
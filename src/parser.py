@@ -1,106 +1,286 @@
 import json
 import re
-import os
-import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# tik JSON struktūrai reikšmingi simboliai - visa kita praleidžiama vienu regex šuoliu
+_TOKENS = re.compile(r'[{}\[\]"\\]')
+
+def loads(text):
+    """json.loads through orjson when it is installed; both raise ValueError on invalid input"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def scan_json_spans(text):
+    """
+    Single left-to-right pass over text.
+    Returns: (spans, truncated) - spans are (start, end) of every complete top-level
+    {...} or [...] value, truncated is the start of a value still open when the text
+    ends (None if there is none). Quotes only count inside a value, so prose and
+    code fences around the payload are skipped.
+    """
+    spans = []
+    depth = 0
+    start = None
+    in_string = False
+    skip = -1
+    for match in _TOKENS.finditer(text):
+        i = match.start()
+        if i < skip:
+            continue
+        char = text[i]
+        if depth == 0:
+            if char in "{[":
+                start = i
+                depth = 1
+            continue
+        if in_string:
+            if char == "\\":
+                skip = i + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                spans.append((start, i + 1))
+    return spans, (start if depth else None)
+
+def _array_items(text, position):
+    """Complete {...} elements of the array whose "[" ends right before position; stops at its "]" or at the end of text"""
+    items = []
+    depth = 0
+    object_start = None
+    in_string = False
+    skip = -1
+    for match in _TOKENS.finditer(text, position):
+        i = match.start()
+        if i < skip:
+            continue
+        char = text[i]
+        if in_string:
+            if char == "\\":
+                skip = i + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            if depth == 0 and char == "{":
+                object_start = i
+            depth += 1
+        elif char in "}]":
+            if depth == 0:
+                break
+            depth -= 1
+            if depth == 0 and object_start is not None:
+                try:
+                    items.append(loads(text[object_start:i + 1]))
+                except ValueError:
+                    pass
+                object_start = None
+    return items
+
+def salvage_array_items(text, key=None):
+    """
+    Every complete object of a JSON array, also when the reply was cut off inside it.
+    key: name of the array ("questions"); without it the first array of the unfinished (or first) payload is used.
+    Returns: list of parsed objects (empty if there is no such array)
+    """
+    if not text:
+        return []
+    if key is not None:
+        match = re.search(r'"%s"\s*:\s*\[' % re.escape(key), text)
+    else:
+        spans, truncated = scan_json_spans(text)
+        if truncated is None and spans:
+            truncated = spans[0][0]
+        match = re.compile(r"\[").search(text, truncated) if truncated is not None else None
+    if match is None:
+        return []
+    return _array_items(text, match.end())
+
+def normalize_question(item):
+    """Vieno modelio klausimo objektą paverčia {question, options, correct}; None, jei trūksta laukų"""
+    if not isinstance(item, dict):
+        return None
+    if not all(key in item for key in ["question_text", "options", "correct_answer"]):
+        return None
+    return {
+        "question": item["question_text"],
+        "options": item["options"],
+        "correct": str(item["correct_answer"]).lower(),
+    }
+
+class QuestionStreamParser:
+    """
+    Incremental parser for a streamed {"questions": [{...}, ...]} reply (or a bare [{...}, ...] list).
+    feed() takes the next text chunk and returns the questions whose {...}
+    object closed in it, so each question is available as soon as the model
+    has finished writing it. Every character is scanned once.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.in_array = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+
+    def _find_array(self):
+        match = re.search(r'"questions"\s*:\s*\[', self.buffer)
+        if match is None:
+            # kaip parse_questions_to_json, priimamas ir plikas klausimų masyvas [{...}, ...]
+            match = re.search(r"[{\[]", self.buffer)
+            if match is None or match.group() != "[":
+                return False
+        self.in_array = True
+        self.position = match.end()
+        return True
+
+    def feed(self, chunk):
+        if self.finished or not chunk:
+            return []
+        self.buffer += chunk
+        if not self.in_array and not self._find_array():
+            return []
+
+        questions = []
+        buffer = self.buffer
+        for i in range(self.position, len(buffer)):
+            char = buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0 and char == "{":
+                    self.object_start = i
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    # masyvas "questions" baigėsi
+                    self.finished = True
+                    break
+                self.depth -= 1
+                if self.depth == 0 and self.object_start is not None:
+                    try:
+                        question = normalize_question(json.loads(buffer[self.object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        question = None
+                    if question is not None:
+                        questions.append(question)
+                    else:
+                        print("Parser klaida: praleistas nevalidus klausimo objektas.")
+                    self.object_start = None
+        self.position = len(buffer)
+        return questions
 
 def parse_questions_to_json(raw_text):
+    """
+    Model reply -> [{question, options, correct}].
+    The payload may be wrapped in code fences or prose; if the reply was cut off,
+    every complete question of the "questions" array is kept. Returns "" if none can be read.
+    """
     if raw_text is None:
         print("Parser klaida: tuščias tekstas.")
         return []
 
-    try:
-        cleaned_text = re.sub(r'^\s*```json\s*|\s*```\s*$', '', raw_text, flags=re.DOTALL)
-        
-        data = json.loads(cleaned_text)
-        
-        if "questions" in data and isinstance(data["questions"], list):
-            
-            parsed_questions = []
-            for item in data["questions"]:
-                if all(key in item for key in ["question_text", "options", "correct_answer"]):
-                    parsed_questions.append({
-                        "question": item["question_text"],
-                        "options": item["options"],
-                        "correct": item["correct_answer"].lower(),
-                    })
-            return parsed_questions
-
-        print("Parser klaida: JSON formatas neatitinka struktūros.")
-        return ""
-    except Exception as e:
-        print(f"Parser klaida: {e}")
-        return ""
-    
+    data = extract_json_from_text(raw_text)
+    if isinstance(data, dict) and isinstance(data.get("questions"), list):
+        items = data["questions"]
+    elif isinstance(data, list):
+        items = data
+    else:
+        # nutrūkęs atsakymas - išsaugomi visi pilnai parašyti klausimai
+        items = salvage_array_items(raw_text, "questions")
+        if not items:
+            print("Parser klaida: JSON formatas neatitinka struktūros.")
+            return ""
+        print(f"Parser: atsakymas nepilnas, išsaugota {len(items)} pilnų klausimų.")
+
+    parsed_questions = []
+    for item in items:
+        question = normalize_question(item)
+        if question is not None:
+            parsed_questions.append(question)
+    return parsed_questions
+
 def json_to_csv(input_json_path: str, output_csv_path: str):
+    """
+    Export a merged questions JSON (or a compact question shard) row by row; .xlsx/.parquet by output suffix.
+    A compact shard is streamed line by line, but a merged JSON file is still read whole with
+    json.load - only the output is written incrementally. No rows - no output file.
+    """
     print(f"Parser: pradedamas konvertavimas į csv...")
-    
+    import exporter
+
     try:
-        with open(input_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if str(input_json_path).endswith(('.jsonl.gz', '.jsonl.zst')):
+            # supakuotas klausimų šardas (compact_store) skaitomas eilutė po eilutės
+            import compact_store
+            data = (question for _, question in compact_store.iter_questions(input_json_path))
+        else:
+            with open(input_json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        count = exporter.write_rows(exporter.question_rows(data), output_csv_path)
     except FileNotFoundError:
         print(f"Parser klaida: failas '{input_json_path}' nerastas.")
         return
     except json.JSONDecodeError:
         print(f"Parser klaida: Nepavyko dekoduoti JSON failo '{input_json_path}'.")
         return
+    except Exception as e:
+        print(f"Klaida: {e}")
+        return
 
-    records = []
-    for question in data:
-        common_data = {
-            'Klausimo ID': question.get('question_id'),
-            'Skyrius': question.get('chapter'),
-            'Autorius': question.get('question_creator_model'),
-            'Klausimas': question.get('question'),
-            'Teisingas': question.get('correct_answer_key'),
-        }
-
-        options_str = ""
-        options = question.get('options', {})
-        for key, value in options.items():
-            options_str += f"{key}: {value}; "
-        common_data['Variantai'] = options_str.strip()
-
-        evaluations = question.get('evaluations', [])
-        
-        if not evaluations:
-            records.append(common_data)
-            continue
-
-        for evaluation in evaluations:
-            record = common_data.copy()
-            record.update({
-                'Vertintojas': evaluation.get('evaluator_model'),
-                'Įvertinimas': evaluation.get('grade'),
-                'Komentaras': evaluation.get('comment')
-            })
-            records.append(record)
-
-    if not records:
+    if not count:
         print("Ispėjimas: nėra jokių įrašų.")
         return
-        
-    df = pd.DataFrame(records)
-    
-    try:
-        os.makedirs(os.path.dirname(output_csv_path) or '.', exist_ok=True)
-        df.to_csv(output_csv_path, index=False, encoding='utf-8')
-        print(f"INFO: failas {output_csv_path} sėkmingai išsaugotas.")
-    except Exception as e:
-        print(f"Klaida: {e}")
+    print(f"INFO: failas {output_csv_path} sėkmingai išsaugotas.")
 
 def extract_json_from_text(text):
+    """
+    The JSON payload of a model reply, or None.
+    Tries the whole text first, then the complete top-level values found by
+    scan_json_spans, longest first - so fences, prose and trailing text are ignored.
+    """
     if not text:
         return None
     try:
-        return json.loads(text)
-    except Exception:
+        return loads(text)
+    except ValueError:
         pass
-    m = re.search(r"(\{[\s\S]*\})", text)
-    if m:
-        candidate = m.group(1)
+    spans, _ = scan_json_spans(text)
+    for start, end in sorted(spans, key=lambda span: span[0] - span[1]):
         try:
-            return json.loads(candidate)
-        except Exception:
-            return None
+            return loads(text[start:end])
+        except ValueError:
+            continue
+    return None
 
-    return None
\ No newline at end of file
+def parse_evaluations_json(raw_text):
+    """Evaluation reply -> JSON value; a truncated reply keeps its complete evaluations. None if nothing is usable"""
+    data = extract_json_from_text(raw_text)
+    if data is not None:
+        return data
+    items = salvage_array_items(raw_text)
+    if items:
+        print(f"Parser: vertinimo atsakymas nepilnas, išsaugota {len(items)} pilnų įvertinimų.")
+        return items
+    return None
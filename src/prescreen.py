@@ -0,0 +1,141 @@
+"""
+Local pre-screen of generated questions, before any evaluator is paid for them.
+
+Structural checks: a non-empty question, options a-d all present, non-empty and
+distinct (after folding), and a correct answer that is one of a-d.
+Grounding check: the correct option has to appear in the chapter. Both are
+diacritic-folded ("Šventąją" -> "sventaja") and cut into character trigrams, so
+inflected forms still match; the share of the option's trigrams found in the
+chapter's trigram set (built once per chapter, a single set intersection per
+question) must reach GROUNDING_THRESHOLD. Numbers are left out (the translation
+spells them out), and questions about what the text does NOT say ("Kuris
+nepaminėtas...") are exempt. On the current results the threshold flags no
+question the evaluators graded 5; it is meant for answers made up from nothing.
+
+A question that fails gets a deterministic grade as its evaluation item
+(STRUCTURE_GRADE or UNGROUNDED_GRADE, marked "prescreen": true) instead of
+evaluator calls; a generated chapter where more than REGENERATE_SHARE of the
+questions are structurally broken is generated again once.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+OPTION_KEYS = ("a", "b", "c", "d")
+STRUCTURE_GRADE = 0
+UNGROUNDED_GRADE = 1
+NGRAM = 3
+GROUNDING_THRESHOLD = 0.3
+REGENERATE_SHARE = 0.5
+
+TOKEN = re.compile(r"[^\W\d_]+|\d+")
+# neiginiai klausimai: teisingas atsakymas tyčia nėra tekste
+NEGATION = re.compile(r"\b(ne[a-z]+|nera|nebuvo|isskyrus|nepaminet\w*)\b")
+
+
+def fold(text):
+    """Lowercase and strip diacritics: "Šventąją" -> "sventaja" """
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokens(text):
+    return TOKEN.findall(fold(text))
+
+
+def ngrams(text, n=NGRAM):
+    """Character n-grams of every folded word (numbers skipped), padded with spaces so short words count too"""
+    grams = set()
+    for token in tokens(text):
+        if token.isdigit():
+            continue
+        padded = f" {token} "
+        grams.update(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+
+@lru_cache(maxsize=64)
+def chapter_ngrams(chapter_text):
+    return frozenset(ngrams(chapter_text))
+
+
+def check_structure(question):
+    """Returns: the structural problems of a question (empty list if it is well formed)"""
+    problems = []
+    if not str(question.get("question") or "").strip():
+        problems.append("tuščias klausimas")
+    options = question.get("options")
+    if not isinstance(options, dict):
+        return problems + ["nėra atsakymų variantų"]
+
+    missing = [key for key in OPTION_KEYS if not str(options.get(key) or "").strip()]
+    if missing:
+        problems.append(f"trūksta variantų: {', '.join(missing)}")
+    extra = sorted(str(key) for key in options if key not in OPTION_KEYS)
+    if extra:
+        problems.append(f"nežinomi variantai: {', '.join(extra)}")
+    correct = str(question.get("correct") or "").strip().lower()
+    if correct not in OPTION_KEYS:
+        problems.append(f"teisingas atsakymas '{correct}' nėra a-d")
+
+    folded = [" ".join(tokens(options[key])) for key in OPTION_KEYS if key not in missing]
+    if len(set(folded)) < len(folded):
+        problems.append("pasikartojantys variantai")
+    return problems
+
+
+def grounding(question, chapter_text):
+    """Share of the correct option's trigrams found in the chapter (1.0 if there is nothing to look up)"""
+    answer = ngrams(question["options"][str(question["correct"]).strip().lower()])
+    if not answer:
+        return 1.0
+    return len(answer & chapter_ngrams(chapter_text)) / len(answer)
+
+
+def screen(question, chapter_text=None):
+    """
+    Returns: None if the question may go to the evaluators, otherwise
+    {"grade": ..., "reasons": [...]}. Without chapter_text only the structure is checked.
+    """
+    problems = check_structure(question)
+    if problems:
+        return {"grade": STRUCTURE_GRADE, "reasons": problems}
+    if chapter_text is None or NEGATION.search(fold(question.get("question", ""))):
+        return None
+    coverage = grounding(question, chapter_text)
+    if coverage < GROUNDING_THRESHOLD:
+        return {"grade": UNGROUNDED_GRADE, "reasons": [f"teisingo atsakymo skyriuje nėra ({coverage:.0%} sutapimas)"]}
+    return None
+
+
+def evaluation_item(question, result):
+    return {
+        "id": question.get("id"),
+        "grade": result["grade"],
+        "comment": "Automatinė patikra: " + "; ".join(result["reasons"]) + ".",
+        "prescreen": True,
+    }
+
+
+def split_questions(questions, chapter_text=None):
+    """
+    Returns: (passed, screened) - passed are the questions that go to the evaluators,
+    screened the deterministic evaluation items of the others, both in question order.
+    """
+    passed, screened = [], []
+    for question in questions:
+        result = screen(question, chapter_text)
+        if result is None:
+            passed.append(question)
+        else:
+            screened.append(evaluation_item(question, result))
+    return passed, screened
+
+
+def needs_regeneration(questions):
+    """True if more than REGENERATE_SHARE of a generated chapter is structurally broken"""
+    if not questions:
+        return False
+    broken = sum(1 for question in questions if check_structure(question))
+    return broken / len(questions) > REGENERATE_SHARE
@@ -0,0 +1,90 @@
+"""
+Provider helpers shared by the generation and evaluation pipelines.
+
+A provider is the litellm model prefix ("gemini/...", "mistral/...").
+Concurrency limits are applied per provider, because API quotas are
+per provider account, not per model.
+"""
+
+import asyncio
+
+# Modelio aplanko pavadinimas (results/questions/{model}) -> litellm modelio pavadinimas
+MODELS = {
+    "gemini-2.5-flash": "gemini/gemini-2.5-flash",
+    "mistral-medium": "mistral/mistral-medium-2508",
+    "mistral-small": "mistral/mistral-small-2506",
+}
+
+# Nuoseklaus vertinimo tvarka: pigiausias vertintojas pirmas (pagal kainą už žetoną)
+EVALUATOR_ORDER = ["mistral-small", "gemini-2.5-flash", "mistral-medium"]
+
+# Kiek vienu metu siunčiamų užklausų leidžiama kiekvienam tiekėjui
+PROVIDER_CONCURRENCY = {
+    "gemini": 4,
+    "mistral": 2,
+}
+DEFAULT_CONCURRENCY = 1
+
+
+def get_provider(model):
+    """Return the provider prefix of a litellm model name"""
+    if "/" in model:
+        return model.split("/", 1)[0]
+    return model
+
+
+def model_name(model):
+    """Folder name of a litellm model name ("mistral/mistral-small-2506" -> "mistral-small"); unknown names are returned as is"""
+    for name, litellm_model in MODELS.items():
+        if litellm_model == model:
+            return name
+    return model
+
+
+def get_concurrency_limit(model, limits=None):
+    """Return the allowed number of in-flight requests for the model's provider"""
+    limits = {**PROVIDER_CONCURRENCY, **(limits or {})}
+    return max(1, int(limits.get(get_provider(model), DEFAULT_CONCURRENCY)))
+
+
+def create_provider_semaphores(models, limits=None):
+    """
+    Create one asyncio.Semaphore per provider of the given models.
+    Must be called inside a running event loop.
+    Returns: {provider: asyncio.Semaphore}
+    """
+    semaphores = {}
+    for model in models:
+        provider = get_provider(model)
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(get_concurrency_limit(model, limits))
+    return semaphores
+
+
+class CombinedSemaphore:
+    """
+    Several semaphores acquired together as one reusable async context manager.
+    Semaphores are acquired in the given order and released in reverse, so
+    pass the provider semaphore first and the shared worker pool last: a job
+    then only occupies a pool slot once its provider has capacity.
+    """
+
+    def __init__(self, *semaphores):
+        self.semaphores = semaphores
+
+    async def __aenter__(self):
+        acquired = []
+        try:
+            for semaphore in self.semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in reversed(acquired):
+                semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for semaphore in reversed(self.semaphores):
+            semaphore.release()
+        return False
@@ -0,0 +1,166 @@
+"""
+Adaptive per-provider rate limiting and retry backoff.
+
+Every provider prefix ("gemini/", "mistral/") gets one token bucket shared by
+the whole process, sync and async callers alike. A 429 halves the provider's
+request rate and blocks the bucket for the Retry-After period; each success
+raises the rate again by a small step, up to the configured maximum. Under
+quota pressure throughput therefore degrades gradually instead of every
+request failing at once.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+
+import providers
+
+# Leidžiamas užklausų skaičius per minutę kiekvienam tiekėjui
+PROVIDER_REQUESTS_PER_MINUTE = {
+    "gemini": 60,
+    "mistral": 60,
+}
+DEFAULT_REQUESTS_PER_MINUTE = 30
+MIN_REQUESTS_PER_MINUTE = 2
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 2.0
+MAX_DELAY = 60.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError",
+    "APIConnectionError",
+    "Timeout",
+    "ServiceUnavailableError",
+    "InternalServerError",
+    "BadGatewayError",
+}
+
+
+class TokenBucket:
+    def __init__(self, requests_per_minute, burst=None):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = min(self.max_rate, MIN_REQUESTS_PER_MINUTE / 60.0)
+        self.rate = self.max_rate
+        self.capacity = burst or max(1.0, requests_per_minute / 10.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token if available; otherwise return how long to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire_sync(self):
+        while (wait := self._reserve()) > 0:
+            time.sleep(wait)
+
+    async def acquire(self):
+        while (wait := self._reserve()) > 0:
+            await asyncio.sleep(wait)
+
+    def penalize(self, retry_after=None):
+        """Called on a rate-limit response: halve the rate and honour Retry-After"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def reward(self):
+        """Called on success: recover the rate additively"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(model, requests_per_minute=None):
+    """Return the shared token bucket of the model's provider"""
+    provider = providers.get_provider(model)
+    with _buckets_lock:
+        if provider not in _buckets:
+            rpm = (requests_per_minute or {}).get(provider) or PROVIDER_REQUESTS_PER_MINUTE.get(provider, DEFAULT_REQUESTS_PER_MINUTE)
+            _buckets[provider] = TokenBucket(rpm)
+        return _buckets[provider]
+
+
+def configure(requests_per_minute):
+    """Reset the buckets with new per-provider limits, e.g. {"gemini": 10}"""
+    with _buckets_lock:
+        _buckets.clear()
+    PROVIDER_REQUESTS_PER_MINUTE.update(requests_per_minute)
+
+
+def get_status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_after(error):
+    """Read Retry-After (seconds or HTTP date) from an API error, if present"""
+    headers = getattr(error, "headers", None)
+    if not headers:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = None
+    for name in ("retry-after", "Retry-After", "x-ratelimit-reset-after"):
+        try:
+            value = headers.get(name)
+        except AttributeError:
+            return None
+        if value:
+            break
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limit(error):
+    return get_status_code(error) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error):
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return get_status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Exponential backoff with full jitter; Retry-After wins when the server sends one"""
+    if retry_after is not None:
+        return min(MAX_DELAY, retry_after) + random.uniform(0, 1)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
@@ -0,0 +1,158 @@
+"""
+Content-addressed on-disk cache for LLM completions.
+
+Responses are keyed by a SHA-256 hash of (model, messages, response_format) and
+stored one file per response under CACHE_DIR/{key[:2]}/{key}.json. The cache
+is bounded in size; the least recently used entries (by file mtime, refreshed
+on every hit) are evicted first.
+
+Modes (LLM_CACHE_MODE environment variable or configure()):
+    "readwrite" - serve hits from disk, store every new response (default)
+    "replay"    - serve hits from disk only; a miss raises CacheMissError
+                  instead of calling the API (offline reruns, CI)
+    "off"       - bypass the cache completely
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).parent.parent / ".llm_cache"
+DEFAULT_MAX_MB = 500
+MODES = ("readwrite", "replay", "off")
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a prompt has no recorded response"""
+
+
+def make_key(model, messages, response_format=None):
+    payload = json.dumps(
+        {"model": model, "messages": messages, "response_format": response_format},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, mode="readwrite"):
+        if mode not in MODES:
+            raise ValueError(f"response_cache klaida: nežinomas režimas '{mode}', galimi: {', '.join(MODES)}")
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._total_bytes = None
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        if not self.cache_dir.exists():
+            return []
+        return [p for p in self.cache_dir.glob("*/*.json") if p.is_file()]
+
+    def get(self, key):
+        """Return the cached content for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # LRU: paskutinio panaudojimo laikas saugomas failo mtime
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry.get("content")
+
+    def put(self, key, model, content):
+        if self.mode != "readwrite" or content is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {"model": model, "created": time.time(), "content": content}
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+
+        if self._total_bytes is None:
+            self._total_bytes = sum(p.stat().st_size for p in self._entries())
+        else:
+            self._total_bytes += path.stat().st_size - old_size
+
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def delete(self, key):
+        if self.mode != "readwrite":
+            return
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        if self._total_bytes is not None:
+            self._total_bytes -= size
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes"""
+        entries = []
+        for p in self._entries():
+            stat = p.stat()
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+        if removed:
+            print(f"response_cache: pašalinta {removed} seniausių įrašų.")
+
+    def clear(self):
+        for p in self._entries():
+            p.unlink()
+        self._total_bytes = 0
+
+
+_cache = None
+
+
+def configure(mode=None, cache_dir=None, max_mb=None):
+    """Replace the shared cache; arguments default to the LLM_CACHE_* environment variables"""
+    global _cache
+    _cache = ResponseCache(
+        cache_dir=cache_dir or os.environ.get("LLM_CACHE_DIR", CACHE_DIR),
+        max_bytes=int(float(max_mb or os.environ.get("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+        mode=mode or os.environ.get("LLM_CACHE_MODE", "readwrite"),
+    )
+    return _cache
+
+
+def get_cache():
+    if _cache is None:
+        return configure()
+    return _cache
@@ -0,0 +1,273 @@
+"""
+Incremental SQLite index of the results/ JSON tree.
+
+Questions and evaluations are ingested once into results/results_index.sqlite,
+keyed by (question_id, author, evaluator, gospel, chapter). On every refresh
+only files whose mtime/size changed are re-hashed, and only files whose
+content hash changed are re-parsed, so stats.py and filter_perfect_questions.py
+can query the store instead of walking and parsing the whole tree.
+Compact shards (see compact_store) are ingested like one big file; chapters that
+also have a JSON file in the shard directory are taken from the JSON file.
+Evaluation items skipped by the sequential mode are stored with skipped = 1 and
+no grade, so they are not mistaken for missing evaluations. Items graded by the
+local pre-screen (see prescreen) are stored with prescreen = 1, so they are not
+counted as the evaluator's grades.
+"""
+
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+import compact_store
+import layout
+
+RESULTS_DIR = Path(__file__).parent.parent / "results"
+INDEX_PATH = RESULTS_DIR / "results_index.sqlite"
+
+# Pakeitus lentelių struktūrą indeksas perkuriamas iš naujo
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS questions (
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    question_id TEXT,
+    author TEXT NOT NULL,
+    gospel TEXT NOT NULL,
+    chapter TEXT,
+    model TEXT,
+    question TEXT,
+    options TEXT,
+    correct TEXT,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    question_id TEXT,
+    author TEXT NOT NULL,
+    evaluator TEXT NOT NULL,
+    evaluator_model TEXT,
+    gospel TEXT NOT NULL,
+    chapter TEXT NOT NULL,
+    grade,
+    comment TEXT,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    prescreen INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS questions_path ON questions(path);
+CREATE INDEX IF NOT EXISTS questions_key ON questions(author, gospel, question_id);
+CREATE INDEX IF NOT EXISTS evaluations_path ON evaluations(path);
+CREATE INDEX IF NOT EXISTS evaluations_key ON evaluations(question_id, author, evaluator, gospel, chapter);
+"""
+
+# Aplankai, kurie neįtraukiami į statistiką
+IGNORED_DIRS = {"testing_questions", "testing_evaluations"}
+
+
+def _file_hash(path):
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def iter_question_files(results_dir=RESULTS_DIR):
+    """
+    Yield (path, author, gospel) for results/questions/{author}/klausimai_{gospel}/questions_*.json
+    and for the compact shards results/questions/{author}/klausimai_{gospel}.jsonl.gz
+    """
+    questions_dir = Path(results_dir) / "questions"
+    if not questions_dir.exists():
+        return
+    for model_dir in sorted(questions_dir.iterdir()):
+        if not model_dir.is_dir() or model_dir.name in IGNORED_DIRS:
+            continue
+        for gospel_dir in sorted(model_dir.iterdir()):
+            if compact_store.is_shard(gospel_dir):
+                yield gospel_dir, model_dir.name, compact_store.shard_directory(gospel_dir).name.replace("klausimai_", "")
+                continue
+            if not gospel_dir.is_dir():
+                continue
+            gospel = gospel_dir.name.replace("klausimai_", "")
+            for json_file in layout.question_chapters(gospel_dir).values():
+                yield json_file, model_dir.name, gospel
+
+
+def iter_evaluation_files(results_dir=RESULTS_DIR):
+    """
+    Yield (path, evaluator, author, gospel) for results/evaluations/{evaluator}_vertina_{author}/{gospel}_evaluations/*.json
+    and for the compact shards results/evaluations/{evaluator}_vertina_{author}/{gospel}_evaluations.jsonl.gz
+    """
+    evaluations_dir = Path(results_dir) / "evaluations"
+    if not evaluations_dir.exists():
+        return
+    for eval_dir in sorted(evaluations_dir.iterdir()):
+        if not eval_dir.is_dir() or eval_dir.name in IGNORED_DIRS:
+            continue
+        parts = eval_dir.name.split("_vertina_")
+        if len(parts) != 2:
+            continue
+        evaluator, author = parts
+        for gospel_dir in sorted(eval_dir.iterdir()):
+            if compact_store.is_shard(gospel_dir):
+                yield gospel_dir, evaluator, author, compact_store.shard_directory(gospel_dir).name.replace("_evaluations", "")
+                continue
+            if not gospel_dir.is_dir() or "_evaluations" not in gospel_dir.name:
+                continue
+            gospel = gospel_dir.name.replace("_evaluations", "")
+            for json_file in layout.evaluation_chapters(gospel_dir).values():
+                yield json_file, evaluator, author, gospel
+
+
+def _question_rows(path, author, gospel):
+    with open(path, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    for position, q in enumerate(questions):
+        yield (
+            str(path), position, q.get("id"), author, gospel, q.get("chapter"), q.get("model"),
+            q.get("question"), json.dumps(q.get("options"), ensure_ascii=False), q.get("correct"),
+            json.dumps(q, ensure_ascii=False),
+        )
+
+
+def _evaluation_rows(path, evaluator, author, gospel):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if "results" not in data:
+        return
+    evaluator_model = data.get("metadata", {}).get("evaluator_model")
+    chapter = path.stem.replace("_evaluations", "")
+    for position, result in enumerate(data["results"]):
+        yield (
+            str(path), position, result.get("id"), author, evaluator, evaluator_model,
+            gospel, chapter, result.get("grade"), result.get("comment"),
+            int(bool(result.get("skipped"))), int(bool(result.get("prescreen"))),
+        )
+
+
+def _overridden_chapters(shard, kind):
+    """Chapters of a shard that also have a JSON file in its directory (the JSON file wins)"""
+    directory = compact_store.shard_directory(shard)
+    files = layout.question_chapters(directory) if kind == "question" else layout.evaluation_chapters(directory)
+    return sorted(files, key=layout.chapter_key)
+
+
+def _question_shard_rows(path, author, gospel, skip):
+    position = 0
+    for chapter, q in compact_store.iter_questions(path):
+        if chapter in skip:
+            continue
+        yield (
+            str(path), position, q.get("id"), author, gospel, q.get("chapter"), q.get("model"),
+            q.get("question"), json.dumps(q.get("options"), ensure_ascii=False), q.get("correct"),
+            json.dumps(q, ensure_ascii=False),
+        )
+        position += 1
+
+
+def _evaluation_shard_rows(path, evaluator, author, gospel, skip):
+    position = 0
+    for chapter, data in compact_store.read_evaluations(path).items():
+        if chapter in skip:
+            continue
+        evaluator_model = data["metadata"].get("evaluator_model")
+        for result in data["results"]:
+            yield (
+                str(path), position, result.get("id"), author, evaluator, evaluator_model,
+                gospel, chapter, result.get("grade"), result.get("comment"),
+                int(bool(result.get("skipped"))), int(bool(result.get("prescreen"))),
+            )
+            position += 1
+
+
+def _ingest(connection, path, kind, rows):
+    table, columns = ("questions", 11) if kind == "question" else ("evaluations", 12)
+    connection.execute(f"DELETE FROM {table} WHERE path = ?", (str(path),))
+    placeholders = ", ".join("?" * columns)
+    connection.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+
+
+def refresh(connection, results_dir=RESULTS_DIR):
+    """Bring the index up to date with the results/ tree. Returns the number of re-parsed files"""
+    known = {
+        row[0]: row[1:]
+        for row in connection.execute("SELECT path, mtime, size, hash FROM files")
+    }
+    seen = set()
+    changed = 0
+
+    candidates = [(path, "question", (author, gospel)) for path, author, gospel in iter_question_files(results_dir)]
+    candidates += [(path, "evaluation", (evaluator, author, gospel)) for path, evaluator, author, gospel in iter_evaluation_files(results_dir)]
+
+    for path, kind, key in candidates:
+        path_str = str(path)
+        seen.add(path_str)
+        stat = path.stat()
+        previous = known.get(path_str)
+        # šarde esantys skyriai, kurie turi ir JSON failą - jiems pasikeitus šardas perskaitomas iš naujo
+        skip = _overridden_chapters(path, kind) if compact_store.is_shard(path) else []
+        overrides = ",".join(skip)
+        if previous and previous[0] == stat.st_mtime and previous[1] == stat.st_size and previous[2].partition("|")[2] == overrides:
+            continue
+
+        file_hash = _file_hash(path) + "|" + overrides
+        if previous and previous[2] == file_hash:
+            connection.execute("UPDATE files SET mtime = ?, size = ? WHERE path = ?", (stat.st_mtime, stat.st_size, path_str))
+            continue
+
+        try:
+            if compact_store.is_shard(path):
+                shard_rows = _question_shard_rows if kind == "question" else _evaluation_shard_rows
+                rows = list(shard_rows(path, *key, set(skip)))
+            elif kind == "question":
+                rows = list(_question_rows(path, *key))
+            else:
+                rows = list(_evaluation_rows(path, *key))
+        except Exception as e:
+            print(f"results_index klaida: nepavyko nuskaityti {path}: {e}")
+            rows = []
+
+        _ingest(connection, path, kind, rows)
+        connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+            (path_str, kind, stat.st_mtime, stat.st_size, file_hash),
+        )
+        changed += 1
+
+    for path_str in set(known) - seen:
+        connection.execute("DELETE FROM questions WHERE path = ?", (path_str,))
+        connection.execute("DELETE FROM evaluations WHERE path = ?", (path_str,))
+        connection.execute("DELETE FROM files WHERE path = ?", (path_str,))
+        changed += 1
+
+    connection.commit()
+    if changed:
+        print(f"results_index: atnaujinta {changed} failų.")
+    return changed
+
+
+_connections = {}
+
+
+def open_index(index_path=INDEX_PATH, results_dir=RESULTS_DIR):
+    """
+    Open (and on first use in this process, refresh) the index.
+    The connection is reused, so repeated analytics calls do not rescan the tree.
+    """
+    key = (str(index_path), str(results_dir))
+    if key not in _connections:
+        Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(index_path)
+        if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            connection.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS questions; DROP TABLE IF EXISTS evaluations;")
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        connection.executescript(SCHEMA)
+        refresh(connection, results_dir)
+        _connections[key] = connection
+    return _connections[key]
@@ -0,0 +1,488 @@
+"""
+Cross-examination matrix scheduler.
+
+Enumerates every (author, evaluator != author, book, chapter) job from
+source_text and results/questions, and runs them concurrently: question
+generation for a chapter runs first, evaluations of that chapter start as soon
+as its questions file exists. Outputs are sharded per (model, book), see layout:
+    results/questions/{author}/klausimai_{Book}/questions_{chapter}.json
+    results/evaluations/{evaluator}_vertina_{author}/{Book}_evaluations/{chapter}_evaluations.json
+Planning lists every shard directory once, so it stays fast with the whole
+Bible (~1300 chapters) and tens of thousands of output files.
+"""
+
+import asyncio
+import json
+from pathlib import Path
+
+import compact_store
+import filter_perfect_questions
+import file_io
+import job_journal
+import layout
+import llm_evaluation
+import llm_generation
+import providers
+import rate_limiter
+import telemetry
+import verse_index
+
+DEFAULT_MAX_WORKERS = 8
+# kiek kartų nepavykęs darbas grąžinamas į eilę tame pačiame paleidime (API klaidas kartoja llm_client)
+REQUEUE_ROUNDS = 1
+STAGES = ("generate", "evaluate")
+
+
+def plan_jobs(parent_folder, models=None, books=None):
+    """
+    Build the job graph.
+    Returns: (generation_jobs, evaluation_jobs), where generation jobs are keyed
+    by (author, chapter) and every evaluation job names the generation job it
+    depends on in "depends_on". Jobs are in book / natural chapter order and
+    "done" tells whether the output existed at planning time.
+    """
+    parent_folder = Path(parent_folder)
+    models = models or providers.MODELS
+    source_books = layout.discover_books(parent_folder / "source_text")
+    if books:
+        source_books = {book: folder for book, folder in source_books.items() if book in books}
+
+    generation_jobs = {}
+    evaluation_jobs = []
+
+    for book, folder in source_books.items():
+        # vienas katalogo nuskaitymas kiekvienai skeveldrai, o ne exists() kiekvienam darbui
+        existing_questions = {author: compact_store.stored_chapters(layout.questions_dir(parent_folder, author, book), "questions") for author in models}
+        existing_evaluations = {
+            (evaluator, author): compact_store.stored_chapters(layout.evaluations_dir(parent_folder, evaluator, author, book), "evaluations")
+            for author in models for evaluator in models if evaluator != author
+        }
+        for chapter, text_path in layout.source_chapters(folder).items():
+            for author in models:
+                questions_path = layout.questions_path(parent_folder, author, book, chapter)
+                generation_jobs[(author, chapter)] = {
+                    "id": job_journal.generation_job_id(author, chapter),
+                    "author": author,
+                    "model": models[author],
+                    "book": book,
+                    "chapter": chapter,
+                    "text_path": text_path,
+                    "questions_path": questions_path,
+                    "done": chapter in existing_questions[author],
+                }
+
+                for evaluator in models:
+                    if evaluator == author:
+                        continue
+                    evaluation_jobs.append({
+                        "id": job_journal.evaluation_job_id(evaluator, author, chapter),
+                        "author": author,
+                        "evaluator": evaluator,
+                        "model": models[evaluator],
+                        "book": book,
+                        "chapter": chapter,
+                        "text_path": text_path,
+                        "questions_path": questions_path,
+                        "evaluations_path": layout.evaluations_path(parent_folder, evaluator, author, book, chapter),
+                        "depends_on": (author, chapter),
+                        "done": chapter in existing_evaluations[(evaluator, author)],
+                    })
+
+    return generation_jobs, evaluation_jobs
+
+
+def record_existing_output(job, path=None):
+    """
+    Mark a job whose output already exists as "written", if the journal still has
+    it open: queued by this run, or left unfinished by an interrupted one (--resume
+    would otherwise rerun it every time). Finished jobs add no journal lines.
+    """
+    if not job["done"] or job.get("unfinished"):
+        job_journal.record(job["id"], "written", path=path)
+
+
+async def run_generation_job(job, slots, stream=False, chunked=False):
+    if job["questions_path"].exists():
+        record_existing_output(job, job["questions_path"])
+        return True
+    # supakuotame šarde esantys klausimai grąžinami į JSON failą vertinimams
+    if job["done"] and compact_store.restore_chapter(job["questions_path"].parent, "questions", job["chapter"], job["questions_path"]):
+        record_existing_output(job, job["questions_path"])
+        return True
+
+    job["questions_path"].parent.mkdir(parents=True, exist_ok=True)
+    text = verse_index.read_chapter(job["text_path"])
+    for round_number in range(REQUEUE_ROUNDS + 1):
+        with telemetry.labels(stage="generate", author=job["author"], book=job["book"], chapter=job["chapter"]):
+            generated = await llm_generation.generate_questions_async(
+                job["model"], text, job["chapter"], job["questions_path"], slots, journal_id=job["id"], stream=stream, chunked=chunked
+            )
+        if generated:
+            return True
+        if round_number < REQUEUE_ROUNDS:
+            # laukiama be užimtų vietų, kad kiti darbai tęstųsi
+            print(f"scheduler: {job['chapter']} ({job['author']}) generavimas grąžinamas į eilę.")
+            await asyncio.sleep(rate_limiter.backoff_delay(round_number + 2))
+    return False
+
+
+async def evaluate_job(job, slots, questions_list=None):
+    """
+    Evaluate one job's questions (or the given subset). Returns the wrapped evaluations or None.
+    Transient API errors are retried by llm_client; a job whose reply still has no usable
+    evaluations is requeued up to REQUEUE_ROUNDS times.
+    """
+    print(f"scheduler: {job['evaluator']} vertina {job['author']} {job['chapter']} klausimus...")
+    for round_number in range(REQUEUE_ROUNDS + 1):
+        with telemetry.labels(stage="evaluate", author=job["author"], evaluator=job["evaluator"], book=job["book"], chapter=job["chapter"]):
+            evaluations_json = await llm_evaluation.evaluate_questions_async(
+                job["questions_path"], job["model"], job["text_path"], slots, journal_id=job["id"], questions_list=questions_list
+            )
+        if evaluations_json is not None:
+            job_journal.record(job["id"], "parsed", evaluations=len(evaluations_json.get("results", [])))
+            return evaluations_json
+        if round_number < REQUEUE_ROUNDS:
+            print(f"scheduler: {job['chapter']} ({job['evaluator']}_vertina_{job['author']}) grąžinamas į eilę.")
+            await asyncio.sleep(rate_limiter.backoff_delay(round_number + 2))
+
+    print(f"scheduler klaida: nepavyko įvertinti {job['chapter']} ({job['evaluator']}_vertina_{job['author']}).")
+    job_journal.record(job["id"], "failed")
+    return None
+
+
+async def run_evaluation_job(job, generation_task, slots, eligible=None, reevaluate_skipped=False):
+    """
+    eligible (sequential mode): question -> None to evaluate it, or the reason it is
+    skipped; skipped questions are saved as explicit "skipped" items. Items skipped
+    by an earlier sequential run are kept, unless reevaluate_skipped is set.
+    """
+    if job["done"] and not job["evaluations_path"].exists():
+        # įvertinimai tik supakuotame šarde
+        record_existing_output(job)
+        return True
+
+    # evaluation depends on the generated questions
+    if not await generation_task:
+        if job["evaluations_path"].exists():
+            record_existing_output(job, job["evaluations_path"])
+            return True
+        print(f"scheduler: {job['chapter']} ({job['author']}) klausimų nėra, vertinimas praleidžiamas.")
+        return False
+
+    # vertinami tik nauji ar pakeisti klausimai (pagal turinio maišą)
+    pending, kept = llm_evaluation.pending_questions(
+        job["questions_path"], job["evaluations_path"], job["text_path"], keep_skipped=not reevaluate_skipped
+    )
+    if eligible is not None:
+        forwarded = []
+        for question in pending:
+            reason = eligible(question)
+            if reason is None:
+                forwarded.append(question)
+            else:
+                kept.append(llm_evaluation.skipped_item(question, reason))
+        if len(forwarded) < len(pending):
+            print(f"scheduler: {job['evaluator']} praleidžia {len(pending) - len(forwarded)} {job['author']} {job['chapter']} klausimus, kurie jau negali būti tobuli.")
+        pending = forwarded
+    if not pending:
+        local = llm_evaluation.unsaved_local_items(kept)
+        if local:
+            # visi klausimai nuspręsti vietoje (patikra ar praleidimas) - vertintojas nekviečiamas
+            llm_evaluation.save_local_items(job["questions_path"], job["text_path"], job["evaluations_path"], job["model"], kept)
+            job_journal.record(job["id"], "written", path=job["evaluations_path"], skipped=sum(1 for item in local if item.get("skipped")))
+        else:
+            record_existing_output(job, job["evaluations_path"])
+        return True
+    if len(kept) > len(llm_evaluation.unsaved_local_items(kept)):
+        print(f"scheduler: {job['evaluator']} pervertina {len(pending)} naujus ar pakeistus {job['author']} {job['chapter']} klausimus.")
+
+    evaluations_json = await evaluate_job(job, slots, pending if kept else None)
+    if evaluations_json is None:
+        return False
+    evaluations_json = llm_evaluation.finish_evaluations(evaluations_json, job["questions_path"], kept)
+
+    job["evaluations_path"].parent.mkdir(parents=True, exist_ok=True)
+    file_io.save_json_file(evaluations_json, job["evaluations_path"])
+    job_journal.record(job["id"], "written", path=job["evaluations_path"])
+    return True
+
+
+async def run_deduplicated_evaluations(jobs, generation_tasks, slots, reevaluate_skipped=False):
+    """
+    Evaluate all authors' questions of one chapter for one evaluator, grading
+    only one representative per near-duplicate cluster (see dedup) and fanning
+    its grade out to the other members. As in run_evaluation_job, only questions
+    that are new or changed since their grade (llm_evaluation.pending_questions)
+    are clustered and graded; the still valid grades are kept.
+    Returns: {job id: True/False}
+    """
+    import dedup  # numpy reikalingas tik šiam režimui
+
+    # įvertinimai tik supakuotame šarde
+    outcome = {}
+    for job in jobs:
+        if job["done"] and not job["evaluations_path"].exists():
+            record_existing_output(job)
+            outcome[job["id"]] = True
+    pending = []
+    questions_by_author = {}
+    kept_by_author = {}
+    for job in jobs:
+        if job["id"] in outcome:
+            continue
+        if not await generation_tasks[job["depends_on"]]:
+            if job["evaluations_path"].exists():
+                record_existing_output(job, job["evaluations_path"])
+                outcome[job["id"]] = True
+                continue
+            print(f"scheduler: {job['chapter']} ({job['author']}) klausimų nėra, vertinimas praleidžiamas.")
+            outcome[job["id"]] = False
+            continue
+        # kaip ir run_evaluation_job: klasterizuojami tik nauji ar pakeisti (pagal maišą) klausimai,
+        # vietinės patikros atmesti klausimai jau yra kept
+        questions, kept = llm_evaluation.pending_questions(
+            job["questions_path"], job["evaluations_path"], job["text_path"], keep_skipped=not reevaluate_skipped
+        )
+        if not questions:
+            if llm_evaluation.unsaved_local_items(kept):
+                llm_evaluation.save_local_items(job["questions_path"], job["text_path"], job["evaluations_path"], job["model"], kept)
+                job_journal.record(job["id"], "written", path=job["evaluations_path"])
+            else:
+                record_existing_output(job, job["evaluations_path"])
+            outcome[job["id"]] = True
+            continue
+        pending.append(job)
+        questions_by_author[job["author"]] = questions
+        kept_by_author[job["author"]] = kept
+    if not pending:
+        return outcome
+
+    graded = {}
+    representatives = dedup.choose_representatives(questions_by_author)
+
+    async def evaluate_representatives(job):
+        own = [
+            question for question in questions_by_author[job["author"]]
+            if representatives.get((job["author"], question.get("id"))) == (job["author"], question.get("id"))
+        ]
+        if not own:
+            return {"results": []}
+        return await evaluate_job(job, slots, own)
+
+    results = await asyncio.gather(*(evaluate_representatives(job) for job in pending))
+    evaluated_authors = set()
+    for job, evaluations_json in zip(pending, results):
+        if evaluations_json is None:
+            continue
+        evaluated_authors.add(job["author"])
+        for item in llm_evaluation.get_evaluation_items(evaluations_json.get("results")):
+            if isinstance(item, dict):
+                graded[(job["author"], item.get("id"))] = item
+
+    fanned_out = dedup.fan_out(questions_by_author, representatives, graded)
+    for job in pending:
+        # darbas pavyksta tik jei įvertinti visi jo klausimų atstovai
+        needed_authors = {
+            representatives.get((job["author"], question.get("id")), (job["author"], None))[0]
+            for question in questions_by_author[job["author"]]
+        }
+        if not needed_authors <= evaluated_authors:
+            if job["author"] in evaluated_authors:
+                job_journal.record(job["id"], "failed")
+            outcome[job["id"]] = False
+            continue
+
+        items = fanned_out[job["author"]]
+        shared = sum(1 for item in items if "representative" in item)
+        evaluations_json = file_io.add_important_parameters_to_evaluations(items, job["model"], job["text_path"])
+        evaluations_json = llm_evaluation.finish_evaluations(evaluations_json, job["questions_path"], kept_by_author[job["author"]])
+        job["evaluations_path"].parent.mkdir(parents=True, exist_ok=True)
+        file_io.save_json_file(evaluations_json, job["evaluations_path"])
+        job_journal.record(job["id"], "written", path=job["evaluations_path"], shared=shared)
+        outcome[job["id"]] = True
+    return outcome
+
+
+def _chapter_results(job):
+    """Evaluation items of a job's chapter, from its JSON file or, once packed, from its shard"""
+    if job["evaluations_path"].exists():
+        with open(job["evaluations_path"], "r", encoding="utf-8") as f:
+            return llm_evaluation.get_evaluation_items(json.load(f).get("results"))
+    shard = compact_store.find_shard(job["evaluations_path"].parent)
+    if shard is None:
+        return []
+    chapter = compact_store.read_evaluations(shard).get(job["chapter"])
+    return chapter["results"] if chapter else []
+
+
+async def run_sequential_evaluations(jobs, generation_task, slots_for, min_evaluators=filter_perfect_questions.MIN_EVALUATORS, min_grade=filter_perfect_questions.MIN_GRADE, reevaluate_skipped=False):
+    """
+    Evaluate one (author, chapter) with its evaluators one after another, in the
+    order of jobs (cheapest first). A question goes on to the next evaluator only
+    while it can still get min_evaluators grades >= min_grade (the perfect-question
+    rule); the later evaluators record it as "skipped" instead. With reevaluate_skipped
+    the questions skipped by an earlier run are checked against the rule again.
+    Returns: {job id: True/False}
+    """
+    outcome = {}
+    rejected = {}
+    required = min(min_evaluators, len(jobs))
+
+    def eligible(question):
+        # vertintojų, kurie klausimo dar neatmetė, turi likti bent tiek, kiek reikia sutarimui
+        rejected_by = rejected.get(question.get("id"), [])
+        if len(jobs) - len(rejected_by) >= required:
+            return None
+        return f"Nevertinta: {', '.join(rejected_by)} įvertino žemiau {min_grade} arba praleido."
+
+    for job in jobs:
+        outcome[job["id"]] = await run_evaluation_job(job, generation_task, slots_for(job["model"]), eligible, reevaluate_skipped)
+        if not outcome[job["id"]]:
+            continue
+        for item in _chapter_results(job):
+            if not isinstance(item, dict):
+                continue
+            grade = llm_evaluation.valid_grade(item.get("grade"))
+            if item.get("skipped") or (grade is not None and grade < min_grade):
+                rejected.setdefault(item.get("id"), []).append(job["evaluator"])
+    return outcome
+
+
+def stamp_question_hashes(parent_folder, models=None, books=None):
+    """Add question hashes to the existing evaluation files of the matrix (see llm_evaluation.stamp_existing_hashes)"""
+    _, evaluation_jobs = plan_jobs(parent_folder, models, books)
+    stamped, skipped = llm_evaluation.stamp_existing_hashes(
+        (job["questions_path"], job["evaluations_path"]) for job in evaluation_jobs
+    )
+    print(f"scheduler: maišai pridėti {stamped} įvertinimų failams.")
+    for path in skipped:
+        print(f"  klausimai pakeisti po vertinimo, bus pervertinti: {path}")
+    return stamped, skipped
+
+
+def select_jobs(generation_jobs, evaluation_jobs, job_ids):
+    """Keep only the given job ids, plus the generation jobs the kept evaluations depend on"""
+    evaluation_jobs = [job for job in evaluation_jobs if job["id"] in job_ids]
+    needed = {job["depends_on"] for job in evaluation_jobs}
+    generation_jobs = {
+        key: job for key, job in generation_jobs.items()
+        if job["id"] in job_ids or key in needed
+    }
+    return generation_jobs, evaluation_jobs
+
+
+async def run_matrix(parent_folder, models=None, books=None, max_workers=DEFAULT_MAX_WORKERS, concurrency_limits=None, resume=False, stream=False, chunked=False, dedup_questions=False, stages=STAGES, dry_run=False, sequential=False, evaluator_order=None, reevaluate_skipped=False):
+    """
+    Run the whole generation + cross-evaluation matrix.
+    At most max_workers requests are in flight overall, and each provider is
+    additionally capped by its concurrency limit.
+    With resume=True only the jobs that the journal shows as unfinished are run;
+    stream=True generates questions in streaming mode (no on_question callback:
+    evaluations of a chapter wait for its complete questions file), chunked=True splits long
+    chapters into verse windows generated concurrently, and dedup_questions=True
+    grades one representative per near-duplicate cluster per evaluator.
+    sequential=True runs the evaluators of each chapter one after another in
+    evaluator_order (default providers.EVALUATOR_ORDER, cheapest first) and only
+    forwards the questions that can still be perfect (see run_sequential_evaluations).
+    Questions skipped that way stay skipped in later runs of any mode, unless
+    reevaluate_skipped=True sends them to their evaluators again.
+    stages limits the run to "generate" and/or "evaluate" (evaluation alone only
+    covers chapters whose questions already exist); dry_run only reports what
+    is pending.
+    Returns: (failed_generation_jobs, failed_evaluation_jobs)
+    """
+    generation_jobs, evaluation_jobs = plan_jobs(parent_folder, models, books)
+    if resume:
+        unfinished = job_journal.unfinished_jobs()
+        generation_jobs, evaluation_jobs = select_jobs(generation_jobs, evaluation_jobs, unfinished)
+        for job in [*generation_jobs.values(), *evaluation_jobs]:
+            job["unfinished"] = job["id"] in unfinished
+        print(f"scheduler: tęsiami {len(unfinished)} nebaigti darbai iš žurnalo.")
+    if "evaluate" not in stages:
+        evaluation_jobs = []
+    if "generate" not in stages:
+        generation_jobs = {key: job for key, job in generation_jobs.items() if job["done"]}
+        evaluation_jobs = [job for job in evaluation_jobs if job["depends_on"] in generation_jobs]
+
+    all_models = {job["model"] for job in generation_jobs.values()} | {job["model"] for job in evaluation_jobs}
+    provider_semaphores = providers.create_provider_semaphores(all_models, concurrency_limits)
+    worker_pool = asyncio.Semaphore(max_workers)
+
+    def slots_for(model):
+        return providers.CombinedSemaphore(provider_semaphores[providers.get_provider(model)], worker_pool)
+
+    pending_generation = sum(1 for job in generation_jobs.values() if not job["done"])
+    pending_evaluation = sum(1 for job in evaluation_jobs if not job["done"])
+    print(f"scheduler: {pending_generation} generavimo ir {pending_evaluation} vertinimo darbų laukia vykdymo.")
+    if dry_run:
+        for job in generation_jobs.values():
+            if not job["done"]:
+                print(f"  generuoti: {job['author']} {job['chapter']}")
+        for job in evaluation_jobs:
+            if not job["done"]:
+                print(f"  vertinti: {job['evaluator']}_vertina_{job['author']} {job['chapter']}")
+        return [], []
+    job_journal.record_many(
+        [job["id"] for job in generation_jobs.values() if not job["done"]]
+        + [job["id"] for job in evaluation_jobs if not job["done"]],
+        "queued",
+    )
+
+    generation_tasks = {
+        key: asyncio.create_task(run_generation_job(job, slots_for(job["model"]), stream, chunked))
+        for key, job in generation_jobs.items()
+    }
+    if dedup_questions:
+        groups = {}
+        for job in evaluation_jobs:
+            groups.setdefault((job["evaluator"], job["chapter"]), []).append(job)
+        group_tasks = {
+            key: asyncio.create_task(run_deduplicated_evaluations(jobs, generation_tasks, slots_for(jobs[0]["model"]), reevaluate_skipped))
+            for key, jobs in groups.items()
+        }
+
+        async def job_outcome(job):
+            return (await group_tasks[(job["evaluator"], job["chapter"])])[job["id"]]
+
+        evaluation_tasks = [asyncio.create_task(job_outcome(job)) for job in evaluation_jobs]
+    elif sequential:
+        rank = {name: position for position, name in enumerate(evaluator_order or providers.EVALUATOR_ORDER)}
+        chains = {}
+        for job in evaluation_jobs:
+            chains.setdefault(job["depends_on"], []).append(job)
+        chain_tasks = {
+            key: asyncio.create_task(run_sequential_evaluations(
+                sorted(jobs, key=lambda job: rank.get(job["evaluator"], len(rank))), generation_tasks[key], slots_for,
+                reevaluate_skipped=reevaluate_skipped,
+            ))
+            for key, jobs in chains.items()
+        }
+
+        async def chain_outcome(job):
+            return (await chain_tasks[job["depends_on"]])[job["id"]]
+
+        evaluation_tasks = [asyncio.create_task(chain_outcome(job)) for job in evaluation_jobs]
+    else:
+        evaluation_tasks = [
+            asyncio.create_task(run_evaluation_job(
+                job, generation_tasks[job["depends_on"]], slots_for(job["model"]), reevaluate_skipped=reevaluate_skipped
+            ))
+            for job in evaluation_jobs
+        ]
+
+    generation_results = await asyncio.gather(*generation_tasks.values(), return_exceptions=True)
+    evaluation_results = await asyncio.gather(*evaluation_tasks, return_exceptions=True)
+    job_journal.flush()
+
+    failed_generation = [job for job, ok in zip(generation_jobs.values(), generation_results) if ok is not True]
+    failed_evaluation = [job for job, ok in zip(evaluation_jobs, evaluation_results) if ok is not True]
+
+    for job, result in zip(generation_jobs.values(), generation_results):
+        if isinstance(result, Exception):
+            print(f"scheduler klaida: {job['chapter']} ({job['author']}) generavimas: {result}")
+    for job, result in zip(evaluation_jobs, evaluation_results):
+        if isinstance(result, Exception):
+            print(f"scheduler klaida: {job['chapter']} ({job['evaluator']}_vertina_{job['author']}): {result}")
+
+    print(f"scheduler: baigta. Nepavyko {len(failed_generation)} generavimo ir {len(failed_evaluation)} vertinimo darbų.")
+    return failed_generation, failed_evaluation
@@ -1,191 +1,208 @@
 # Sugeneruota su Gemini-2.5-flash
 
-import json
 from collections import defaultdict
 from pathlib import Path
-import matplotlib.pyplot as plt
-import numpy as np
+import pandas as pd
+import results_index
+
+# Spausdinami įvertinimai nuo 5 iki 1
+GRADES = [5, 4, 3, 2, 1]
+
+_tables = None
+
+def load_tables(refresh=False):
+    """Vieną kartą užkrauna klausimų ir įvertinimų lenteles iš rezultatų indekso"""
+    global _tables
+    if _tables is None or refresh:
+        connection = results_index.open_index()
+        questions = pd.read_sql_query("SELECT author, gospel, chapter, question_id FROM questions", connection)
+        evaluations = pd.read_sql_query(
+            "SELECT author, evaluator, gospel, chapter, question_id, grade, skipped, prescreen FROM evaluations", connection
+        )
+        _tables = (questions, evaluations)
+    return _tables
+
+def _grade_key(grade):
+    if pd.isna(grade):
+        return None
+    if isinstance(grade, float) and grade.is_integer():
+        return int(grade)
+    return grade
+
+def evaluator_grades():
+    """Tik vertintojų duoti įvertinimai: be nuosekliai praleistų ir vietinės patikros įvertintų klausimų"""
+    _, evaluations = load_tables()
+    return evaluations[(evaluations["skipped"] == 0) & (evaluations["prescreen"] == 0)]
+
+def grade_counts():
+    """
+    Įvertinimų pasiskirstymas: eilutės (vertinamas modelis, vertintojas),
+    stulpeliai - įvertinimai (visada yra 5..1), papildomai 'total'
+    """
+    # praleisti ir vietinės patikros klausimai nėra vertintojo įvertinimai (žr. skipped_counts, prescreen_counts)
+    evaluations = evaluator_grades()
+    counts = (
+        evaluations.groupby(["author", "evaluator", "grade"], dropna=False)
+        .size()
+        .unstack("grade", fill_value=0)
+    )
+    counts.columns = [_grade_key(grade) for grade in counts.columns]
+    counts["total"] = counts.sum(axis=1)
+    for grade in GRADES:
+        if grade not in counts.columns:
+            counts[grade] = 0
+    return counts
+
+def skipped_counts():
+    """Kiek klausimų kiekvienas vertintojas praleido nuosekliu vertinimu (ne trūkstami duomenys)"""
+    _, evaluations = load_tables()
+    return evaluations[evaluations["skipped"] == 1].groupby(["author", "evaluator"]).size()
+
+def prescreen_counts():
+    """Kiek kiekvieno modelio klausimų įvertino vietinė patikra (tas pats įrašas yra kiekvieno vertintojo faile)"""
+    _, evaluations = load_tables()
+    screened = evaluations[evaluations["prescreen"] == 1]
+    return screened.drop_duplicates(["author", "gospel", "question_id"]).groupby("author").size()
+
+def grade_percentages(counts):
+    """Įvertinimų 5..1 procentai nuo 'total' (0, jei įvertinimų nėra)"""
+    totals = counts["total"].where(counts["total"] > 0)
+    return counts[GRADES].div(totals, axis=0).mul(100).fillna(0)
+
+def perfect_from_both_counts():
+    """Kiek kiekvieno modelio klausimų gavo 5 iš abiejų vertintojų"""
+    evaluations = evaluator_grades()
+    fives = evaluations[evaluations["grade"] == 5].drop_duplicates(["author", "question_id", "evaluator"])
+    fives = fives.groupby(["author", "question_id"], dropna=False).size()
+    return (fives == 2).groupby(level="author").sum()
+
+def model_summary():
+    """Suvestinė pagal vertinamą modelį: sugeneruota, įvertinta, praleista, atmesta patikros, 5 įvertinimai, 5 iš abiejų"""
+    questions, _ = load_tables()
+    counts = grade_counts().groupby(level="author").sum()
+    summary = pd.DataFrame({
+        "generated": questions.groupby("author").size(),
+        "evaluated": counts["total"],
+        "skipped": skipped_counts().groupby(level="author").sum(),
+        "prescreened": prescreen_counts(),
+        "grade_5": counts[5],
+        "perfect_from_both": perfect_from_both_counts(),
+    }).reindex(counts.index).fillna(0).astype(int)
+    totals = summary["evaluated"].where(summary["evaluated"] > 0)
+    summary["grade_5_percentage"] = summary["grade_5"].div(totals).mul(100).fillna(0)
+    return summary
 
 def get_stats():
-    """Suskaičiuoja pagrindinę statistiką"""
-    questions_dir = Path(__file__).parent.parent / "results/questions"
-    evaluations_dir = Path(__file__).parent.parent / "results/evaluations"
+    """Suskaičiuoja pagrindinę statistiką iš rezultatų indekso (results_index)"""
+    questions, _ = load_tables()
+    counts = grade_counts()
     
     # Sugeneruoti klausimai pagal modelį
-    generated_by_model = defaultdict(int)
-    total_questions = 0
-    models = set()
+    generated_by_model = defaultdict(int, questions.groupby("author").size().to_dict())
+    total_questions = len(questions)
+    models = set(generated_by_model.keys())
     
-    for model_dir in questions_dir.iterdir():
-        if model_dir.is_dir() and model_dir.name != "testing_questions":
-            models.add(model_dir.name)
-            model_name = model_dir.name
-            for gospel_dir in model_dir.iterdir():
-                if gospel_dir.is_dir():
-                    for json_file in gospel_dir.glob("questions_*.json"):
-                        try:
-                            with open(json_file, 'r', encoding='utf-8') as f:
-                                count = len(json.load(f))
-                                generated_by_model[model_name] += count
-                                total_questions += count
-                        except:
-                            pass
-    
-    # Įvertinimai pagal modelį (kiek gavo, ne kiek davė)
+    # Įvertinimai pagal modelį (kiek gavo, ne kiek davė) ir pagal vertintoją
     grades_by_model = defaultdict(lambda: defaultdict(int))
     evaluated_by_model = defaultdict(int)
+    grades_by_evaluated_and_evaluator = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
     
-    # Sekti grade 5 skaičius iš kiekvieno vertintojo
-    grade5_by_model_and_evaluator = defaultdict(lambda: defaultdict(int))
-    
-    for eval_dir in evaluations_dir.iterdir():
-        if eval_dir.is_dir() and eval_dir.name != "testing_evaluations":
-            parts = eval_dir.name.split("_vertina_")
-            if len(parts) == 2:
-                evaluator_model = parts[0]  # Modelis kuris vertina
-                evaluated_model = parts[1]  # Modelis kurį vertino
-                
-                for gospel_dir in eval_dir.iterdir():
-                    if gospel_dir.is_dir() and "_evaluations" in gospel_dir.name:
-                        for json_file in gospel_dir.glob("*_evaluations.json"):
-                            try:
-                                with open(json_file, 'r', encoding='utf-8') as f:
-                                    data = json.load(f)
-                                    if "results" in data:
-                                        for result in data["results"]:
-                                            grade = result.get("grade")
-                                            question_id = result.get("id")
-                                            grades_by_model[evaluated_model][grade] += 1
-                                            evaluated_by_model[evaluated_model] += 1
-                                            
-                                            if grade == 5:
-                                                grade5_by_model_and_evaluator[evaluated_model][question_id] += 1
-                            except:
-                                pass
+    grade_columns = [column for column in counts.columns if column != "total"]
+    long_counts = counts[grade_columns].stack()
+    for (evaluated_model, evaluator_model, grade), count in long_counts[long_counts > 0].items():
+        grades_by_model[evaluated_model][grade] += int(count)
+        grades_by_evaluated_and_evaluator[evaluated_model][evaluator_model][grade] += int(count)
+    for evaluated_model, count in counts["total"].groupby(level="author").sum().items():
+        evaluated_by_model[evaluated_model] = int(count)
     
     # Bendras įvertinimų skaičius
-    total_grades = sum(sum(grades.values()) for grades in grades_by_model.values())
+    total_grades = int(counts["total"].sum())
     
     # Suskaičiuoti klausimus, kurie gavo 5 iš abiejų vertintojų
-    perfect_from_both = {}
-    for model in grades_by_model.keys():
-        count = sum(1 for question_id, count in grade5_by_model_and_evaluator[model].items() if count == 2)
-        perfect_from_both[model] = count
-    
-    # Statistika: kiek kokių įvertinimų gavo modelis iš kiekvieno vertintojo
-    grades_by_evaluated_and_evaluator = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-    
-    for eval_dir in evaluations_dir.iterdir():
-        if eval_dir.is_dir() and eval_dir.name != "testing_evaluations":
-            parts = eval_dir.name.split("_vertina_")
-            if len(parts) == 2:
-                evaluator_model = parts[0]  # Modelis kuris vertina
-                evaluated_model = parts[1]  # Modelis kurį vertino
-                
-                for gospel_dir in eval_dir.iterdir():
-                    if gospel_dir.is_dir() and "_evaluations" in gospel_dir.name:
-                        for json_file in gospel_dir.glob("*_evaluations.json"):
-                            try:
-                                with open(json_file, 'r', encoding='utf-8') as f:
-                                    data = json.load(f)
-                                    if "results" in data:
-                                        for result in data["results"]:
-                                            grade = result.get("grade")
-                                            grades_by_evaluated_and_evaluator[evaluated_model][evaluator_model][grade] += 1
-                            except:
-                                pass
+    perfect_from_both = {model: 0 for model in grades_by_model.keys()}
+    perfect_from_both.update({model: int(count) for model, count in perfect_from_both_counts().items()})
     
     return len(models), total_questions, total_grades, grades_by_model, generated_by_model, evaluated_by_model, perfect_from_both, grades_by_evaluated_and_evaluator
 
 def print_statistics():
-    num_models, total_questions, total_grades, grades_by_model, generated_by_model, evaluated_by_model, perfect_from_both, grades_by_evaluated_and_evaluator = get_stats()
+    questions, _ = load_tables()
+    summary = model_summary()
     
-    print(f"Modelių skaičius: {num_models}")
-    print(f"Bendra sugeneruotų klausimų suma: {total_questions}")
-    print(f"Bendra vertintų klausimų suma: {total_grades}")
+    print(f"Modelių skaičius: {questions['author'].nunique()}")
+    print(f"Bendra sugeneruotų klausimų suma: {len(questions)}")
+    print(f"Bendra vertintų klausimų suma: {summary['evaluated'].sum()}")
     print()
     
-    for model in sorted(grades_by_model.keys()):
-        generated = generated_by_model.get(model, 0)
-        evaluated = evaluated_by_model.get(model, 0)
-        grade_5_count = grades_by_model[model].get(5, 0)
-        total_model_grades = sum(grades_by_model[model].values())
-        percentage = (grade_5_count / total_model_grades * 100) if total_model_grades > 0 else 0
-        perfect_both = perfect_from_both.get(model, 0)
-        print(f"{model}:")
-        print(f"  Sugeneravo: {generated} klausimų")
-        print(f"  Įvertino: {evaluated} klausimų")
-        print(f"  Gavo įvertinimą 5: {percentage:.1f}% ({grade_5_count}/{total_model_grades})")
-        print(f"  Gavo 5 iš abiejų vertintojų: {perfect_both}")
+    for row in summary.sort_index().itertuples():
+        print(f"{row.Index}:")
+        print(f"  Sugeneravo: {row.generated} klausimų")
+        print(f"  Įvertino: {row.evaluated} klausimų")
+        if row.skipped:
+            print(f"  Praleista nuosekliu vertinimu: {row.skipped} klausimų")
+        if row.prescreened:
+            print(f"  Atmesta vietinės patikros (vertintojams nesiųsta): {row.prescreened} klausimų")
+        print(f"  Gavo įvertinimą 5: {row.grade_5_percentage:.1f}% ({row.grade_5}/{row.evaluated})")
+        print(f"  Gavo 5 iš abiejų vertintojų: {row.perfect_from_both}")
         print()
 
 def print_cross_evaluation_statistics():
     """Spausdina detalizuotą statistiką: kiek kokių įvertinimų gavo modelis iš kiekvieno vertintojo"""
-    num_models, total_questions, total_grades, grades_by_model, generated_by_model, evaluated_by_model, perfect_from_both, grades_by_evaluated_and_evaluator = get_stats()
+    counts = grade_counts().sort_index()
+    skipped = skipped_counts()
+    percentages = grade_percentages(counts)
+    model_counts = counts.groupby(level="author").sum()
+    model_percentages = grade_percentages(model_counts)
     
     print("=" * 80)
     print("DETALIZUOTA MODELIŲ VERTINIMO STATISTIKA")
     print("=" * 80)
     print()
     
-    for evaluated_model in sorted(grades_by_evaluated_and_evaluator.keys()):
+    for evaluated_model in model_counts.index:
         print(f"\n{evaluated_model} - GAUTAS VERTINIMAS:")
         print("-" * 80)
         
-        evaluator_data = grades_by_evaluated_and_evaluator[evaluated_model]
-        
-        for evaluator_model in sorted(evaluator_data.keys()):
-            grades_distribution = evaluator_data[evaluator_model]
-            total_grades_from_evaluator = sum(grades_distribution.values())
+        for evaluator_model in counts.loc[evaluated_model].index:
+            row = counts.loc[(evaluated_model, evaluator_model)]
+            row_percentages = percentages.loc[(evaluated_model, evaluator_model)]
             
             print(f"\n  Iš {evaluator_model}:")
-            print(f"    Iš viso vertintų: {total_grades_from_evaluator}")
+            print(f"    Iš viso vertintų: {row['total']}")
+            if skipped.get((evaluated_model, evaluator_model), 0):
+                print(f"    Praleista nuosekliu vertinimu: {skipped[(evaluated_model, evaluator_model)]}")
             
-            # Spausdinti įvertinimus nuo 5 iki 1
-            for grade in range(5, 0, -1):
-                count = grades_distribution.get(grade, 0)
-                percentage = (count / total_grades_from_evaluator * 100) if total_grades_from_evaluator > 0 else 0
-                print(f"      Įvertinimas {grade}: {count} ({percentage:.1f}%)")
+            for grade in GRADES:
+                print(f"      Įvertinimas {grade}: {row[grade]} ({row_percentages[grade]:.1f}%)")
         
         # Bendras šio modelio vertinimas
         print(f"\n  IŠ VISO:")
-        total_for_model = sum(sum(evaluator_data[e].values()) for e in evaluator_data)
-        all_grades_dist = defaultdict(int)
-        for grades_dist in evaluator_data.values():
-            for grade, count in grades_dist.items():
-                all_grades_dist[grade] += count
-        
-        for grade in range(5, 0, -1):
-            count = all_grades_dist.get(grade, 0)
-            percentage = (count / total_for_model * 100) if total_for_model > 0 else 0
-            print(f"    Įvertinimas {grade}: {count} ({percentage:.1f}%)")
+        for grade in GRADES:
+            print(f"    Įvertinimas {grade}: {model_counts.loc[evaluated_model, grade]} ({model_percentages.loc[evaluated_model, grade]:.1f}%)")
         print()
 
 def plot_cross_evaluation_charts():
     """Sukuria 3 atskiras stulpelines diagramas, rodančias kaip kiekvienas modelis buvo vertas"""
-    num_models, total_questions, total_grades, grades_by_model, generated_by_model, evaluated_by_model, perfect_from_both, grades_by_evaluated_and_evaluator = get_stats()
+    # matplotlib reikalingas tik diagramoms, todėl importuojamas čia
+    import matplotlib.pyplot as plt
+    import numpy as np
+
+    counts = grade_counts().sort_index()
     
     # Spalvos kiekvienam įvertinimui
     grade_colors = {5: '#2ecc71', 4: '#3498db', 3: '#f39c12', 2: '#e74c3c', 1: '#c0392b'}
     grade_labels = {5: 'Puiku (5)', 4: 'Gerai (4)', 3: 'Vidutiniškai (3)', 2: 'Blogai (2)', 1: 'Labai blogai (1)'}
     
-    models_list = sorted(grades_by_evaluated_and_evaluator.keys())
+    models_list = counts.index.get_level_values("author").unique()
     
     for idx, evaluated_model in enumerate(models_list):
         # Sukurti atskirą figūrą kiekvienai diagramai
         fig, ax = plt.subplots(figsize=(10, 6))
         fig.suptitle(f'{evaluated_model}', fontsize=14, fontweight='bold')
         
-        evaluator_data = grades_by_evaluated_and_evaluator[evaluated_model]
-        evaluators = sorted(evaluator_data.keys())
-        
-        # Pasiruošti duomenis
-        grades_data = {evaluator: [] for evaluator in evaluators}
-        
-        for evaluator in evaluators:
-            grades_dist = evaluator_data[evaluator]
-            for grade in range(1, 6):
-                grades_data[evaluator].append(grades_dist.get(grade, 0))
+        # Pasiruošti duomenis: eilutė kiekvienam vertintojui, stulpeliai 1..5
+        evaluator_data = counts.loc[evaluated_model, list(range(1, 6))]
+        evaluators = list(evaluator_data.index)
+        grades_data = {evaluator: evaluator_data.loc[evaluator].to_numpy() for evaluator in evaluators}
         
         # Sukurti diagramą
         x = np.arange(1, 6)
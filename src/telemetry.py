@@ -0,0 +1,161 @@
+"""
+Per-call telemetry for LLM requests.
+
+llm_client writes one span per completion call to results/telemetry.jsonl:
+model, stage, author, evaluator, chapter, prompt/completion tokens, cost,
+latency, retries, cache hit and outcome. Callers attach the labels with
+    with telemetry.labels(stage="evaluate", chapter="Mt_26", author=..., evaluator=...):
+        ...
+The labels live in a ContextVar, so concurrent asyncio jobs keep their own.
+
+    python src/telemetry.py    # tokens, cost and latency per author/evaluator pair and per gospel
+
+Set LLM_TELEMETRY=off to disable the sink.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+TELEMETRY_PATH = Path(__file__).parent.parent / "results" / "telemetry.jsonl"
+
+_labels = contextvars.ContextVar("telemetry_labels", default={})
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def labels(**values):
+    """Add labels (stage, chapter, author, evaluator, ...) to every span recorded inside the block"""
+    token = _labels.set({**_labels.get(), **{key: value for key, value in values.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def enabled():
+    return os.environ.get("LLM_TELEMETRY", "on").lower() not in ("off", "0", "false")
+
+
+def usage_tokens(response):
+    """Returns: (prompt_tokens, completion_tokens), None where the response has no usage"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """USD cost from litellm's price table; None if the model or the usage is unknown"""
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    try:
+        from litellm import cost_per_token
+        prompt_cost, completion_cost = cost_per_token(
+            model=model, prompt_tokens=prompt_tokens or 0, completion_tokens=completion_tokens or 0
+        )
+        return prompt_cost + completion_cost
+    except Exception:
+        return None
+
+
+def record_span(model, latency, outcome, retries=0, cache_hit=False, response=None, error=None, path=None):
+    """Append one span for a finished completion call"""
+    if not enabled():
+        return
+    prompt_tokens, completion_tokens = usage_tokens(response)
+    span = {
+        "time": time.time(),
+        "model": model,
+        **_labels.get(),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": 0.0 if cache_hit else estimate_cost(model, prompt_tokens, completion_tokens),
+        "latency": round(latency, 4),
+        "retries": retries,
+        "cache_hit": cache_hit,
+        "outcome": outcome,
+    }
+    if error is not None:
+        span["error"] = type(error).__name__
+    line = json.dumps(span, ensure_ascii=False) + "\n"
+    path = Path(path or TELEMETRY_PATH)
+    with _lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def load_spans(path=TELEMETRY_PATH):
+    spans = []
+    if not Path(path).exists():
+        return spans
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def _book(span):
+    chapter = span.get("chapter") or ""
+    return chapter.split("_")[0] if chapter else "?"
+
+
+def _pair(span):
+    if span.get("stage") == "generate":
+        return f"{span.get('author', span['model'])} (generavimas)"
+    return f"{span.get('evaluator', span['model'])}_vertina_{span.get('author', '?')}"
+
+
+def summarize(spans, key):
+    """Aggregate spans by key(span). Returns: {group: totals}; "latency" sums live calls only, not cache hits"""
+    groups = {}
+    for span in spans:
+        totals = groups.setdefault(key(span), {
+            "calls": 0, "cache_hits": 0, "errors": 0, "retries": 0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latency": 0.0,
+        })
+        totals["calls"] += 1
+        totals["cache_hits"] += bool(span.get("cache_hit"))
+        totals["errors"] += span.get("outcome") != "ok"
+        totals["retries"] += span.get("retries") or 0
+        totals["prompt_tokens"] += span.get("prompt_tokens") or 0
+        totals["completion_tokens"] += span.get("completion_tokens") or 0
+        totals["cost"] += span.get("cost") or 0.0
+        if not span.get("cache_hit"):
+            # kešo atsakymai neįskaičiuojami - vidurkis dalijamas tik iš tikrų užklausų
+            totals["latency"] += span.get("latency") or 0.0
+    return groups
+
+
+def print_summary(path=None):
+    path = path or TELEMETRY_PATH
+    spans = load_spans(path)
+    if not spans:
+        print(f"telemetry: įrašų nėra ({path}).")
+        return
+    for title, key in (("PAGAL AUTORIŲ / VERTINTOJĄ", _pair), ("PAGAL EVANGELIJĄ", _book)):
+        print("=" * 100)
+        print(title)
+        print("=" * 100)
+        print(f"{'grupė':<45}{'užkl.':>7}{'kešas':>7}{'klaid.':>7}{'kart.':>7}{'įvest. tok.':>13}{'išvest. tok.':>13}{'USD':>10}{'vid. s':>8}")
+        groups = summarize(spans, key)
+        for group, totals in sorted(groups.items(), key=lambda item: -item[1]["cost"]):
+            live_calls = totals["calls"] - totals["cache_hits"]
+            average = totals["latency"] / live_calls if live_calls else 0.0
+            print(f"{group:<45}{totals['calls']:>7}{totals['cache_hits']:>7}{totals['errors']:>7}{totals['retries']:>7}"
+                  f"{totals['prompt_tokens']:>13}{totals['completion_tokens']:>13}{totals['cost']:>10.4f}{average:>8.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    print_summary()
@@ -0,0 +1,223 @@
+"""
+Verse-level index of the chapter files in source_text/<book folder>/*.txt.
+
+Chapter files have verse numbers glued to the text ("1Pradžioje buvo Žodis."),
+sometimes several verses on one line. The index is built once into .verse_index/:
+    corpus.bin    - UTF-8 text of every chapter, concatenated
+    verses.bin    - one fixed-size record per verse (see RECORD)
+    chapters.json - book -> chapter -> (first record, verse count, byte span),
+                    plus the stat of every source file, to detect stale indexes
+Both .bin files are memory-mapped, so looking up a chapter's text, a verse span
+or a verse count is O(1) and no consumer re-reads or regex-scans the raw files.
+"""
+
+import json
+import mmap
+import re
+import struct
+import threading
+from pathlib import Path
+
+import layout
+
+SOURCE_ROOT = Path(__file__).parent.parent / "source_text"
+INDEX_DIR = Path(__file__).parent.parent / ".verse_index"
+INDEX_VERSION = 2
+
+# verse, char_start, char_end (chapter-relative), byte_start, byte_end (corpus-absolute),
+# token_start, token_end (chapter-relative word count)
+RECORD = struct.Struct("<7I")
+
+# Eilutės numeris prilipęs prie teksto: "10Jis", "2„Iš tiesų"
+VERSE_NUMBER = re.compile(r"\d+(?=[^\d\s])")
+TOKEN = re.compile(r"\S+")
+# Kai kurių eilučių vertime nėra (pvz. Jn 5, 4), todėl leidžiamas nedidelis tarpas
+MAX_VERSE_GAP = 2
+
+
+def parse_verses(text):
+    """
+    Split a chapter into verses.
+    Returns: [(verse, char_start, char_end)] for verses 1..last. Only numbers just
+    after the previous verse are accepted, so numbers inside the verse text are not
+    mistaken for verses; verses missing from the translation get an empty span.
+    """
+    starts = []
+    expected = 1
+    for match in VERSE_NUMBER.finditer(text):
+        verse = int(match.group())
+        if expected <= verse <= expected + MAX_VERSE_GAP:
+            starts.append((verse, match.start()))
+            expected = verse + 1
+    verses = []
+    for i, (verse, start) in enumerate(starts):
+        end = starts[i + 1][1] if i + 1 < len(starts) else len(text.rstrip())
+        previous = verses[-1][0] if verses else 0
+        verses.extend((missing, start, start) for missing in range(previous + 1, verse))
+        verses.append((verse, start, end))
+    return verses
+
+
+def iter_source_files(source_root=SOURCE_ROOT):
+    """Yield (book_folder, chapter_path) for every chapter file, in natural chapter order"""
+    for folder in layout.discover_books(source_root).values():
+        for text_path in layout.source_chapters(folder).values():
+            yield folder.name, text_path
+
+
+def _source_stats(source_root):
+    return {
+        str(text_path): [text_path.stat().st_mtime, text_path.stat().st_size]
+        for _, text_path in iter_source_files(source_root)
+    }
+
+
+def build(source_root=SOURCE_ROOT, index_dir=INDEX_DIR):
+    """Parse every chapter and write the index files. Returns the number of verse records"""
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    books = {}
+    corpus = bytearray()
+    records = bytearray()
+    record_count = 0
+
+    for folder_name, text_path in iter_source_files(source_root):
+        text = text_path.read_text(encoding="utf-8")
+        encoded = text.encode("utf-8")
+        chapter_offset = len(corpus)
+        corpus += encoded
+
+        # simbolių poslinkiai -> baitų ir žodžių poslinkiai vienu praėjimu
+        verses = parse_verses(text)
+        token_starts = [match.start() for match in TOKEN.finditer(text)]
+        token_position = 0
+        first_record = record_count
+        for verse, char_start, char_end in verses:
+            byte_start = chapter_offset + len(text[:char_start].encode("utf-8"))
+            byte_end = byte_start + len(text[char_start:char_end].encode("utf-8"))
+            while token_position < len(token_starts) and token_starts[token_position] < char_start:
+                token_position += 1
+            token_start = token_position
+            while token_position < len(token_starts) and token_starts[token_position] < char_end:
+                token_position += 1
+            records += RECORD.pack(verse, char_start, char_end, byte_start, byte_end, token_start, token_position)
+            record_count += 1
+
+        book = text_path.stem.split("_")[0]
+        books.setdefault(book, {"folder": folder_name, "chapters": {}})
+        books[book]["chapters"][text_path.stem] = {
+            "first_record": first_record,
+            "verse_count": len(verses),
+            "byte_start": chapter_offset,
+            "byte_end": len(corpus),
+            "tokens": len(token_starts),
+        }
+
+    (index_dir / "corpus.bin").write_bytes(bytes(corpus))
+    (index_dir / "verses.bin").write_bytes(bytes(records))
+    manifest = {
+        "version": INDEX_VERSION,
+        "source_root": str(Path(source_root).resolve()),
+        "sources": _source_stats(source_root),
+        "books": books,
+    }
+    (index_dir / "chapters.json").write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    print(f"verse_index: sukurtas indeksas ({sum(len(b['chapters']) for b in books.values())} skyrių, {record_count} eilučių).")
+    return record_count
+
+
+def _is_stale(index_dir, source_root):
+    manifest_path = Path(index_dir) / "chapters.json"
+    if not manifest_path.exists() or not (Path(index_dir) / "verses.bin").exists():
+        return True
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return True
+    return manifest.get("version") != INDEX_VERSION or manifest.get("sources") != _source_stats(source_root)
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class VerseIndex:
+    def __init__(self, index_dir=INDEX_DIR):
+        index_dir = Path(index_dir)
+        manifest = json.loads((index_dir / "chapters.json").read_text(encoding="utf-8"))
+        self.source_root = Path(manifest["source_root"])
+        self.books = manifest["books"]
+        self.chapters = {
+            chapter: dict(info, book=book)
+            for book, book_info in self.books.items()
+            for chapter, info in book_info["chapters"].items()
+        }
+        self._corpus = _map(index_dir / "corpus.bin")
+        self._verses = _map(index_dir / "verses.bin")
+
+    def __contains__(self, chapter):
+        return chapter in self.chapters
+
+    def book_chapters(self, book):
+        """Chapter names of a book, e.g. book_chapters("Mt") -> ["Mt_1", "Mt_10", ...]"""
+        return list(self.books[book]["chapters"])
+
+    def chapter_text(self, chapter):
+        info = self.chapters[chapter]
+        return self._corpus[info["byte_start"]:info["byte_end"]].decode("utf-8")
+
+    def verse_count(self, chapter):
+        return self.chapters[chapter]["verse_count"]
+
+    def token_count(self, chapter):
+        return self.chapters[chapter]["tokens"]
+
+    def verse_span(self, chapter, verse):
+        """
+        Returns: {"verse", "char_start", "char_end", "byte_start", "byte_end", "token_start", "token_end"}
+        Character and token offsets are relative to the chapter text.
+        """
+        info = self.chapters[chapter]
+        if not 1 <= verse <= info["verse_count"]:
+            raise KeyError(f"verse_index klaida: {chapter} neturi {verse} eilutės")
+        fields = RECORD.unpack_from(self._verses, (info["first_record"] + verse - 1) * RECORD.size)
+        return dict(zip(("verse", "char_start", "char_end", "byte_start", "byte_end", "token_start", "token_end"), fields))
+
+    def verse_text(self, chapter, verse):
+        span = self.verse_span(chapter, verse)
+        return self._corpus[span["byte_start"]:span["byte_end"]].decode("utf-8")
+
+    def verses(self, chapter):
+        """All verse spans of a chapter, in order"""
+        return [self.verse_span(chapter, verse) for verse in range(1, self.verse_count(chapter) + 1)]
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def open_index(source_root=SOURCE_ROOT, index_dir=INDEX_DIR):
+    """Open the index, (re)building it first if any source file changed. Memoized per process"""
+    key = (str(source_root), str(index_dir))
+    with _lock:
+        if key not in _indexes:
+            if _is_stale(index_dir, source_root):
+                build(source_root, index_dir)
+            _indexes[key] = VerseIndex(index_dir)
+        return _indexes[key]
+
+
+def read_chapter(text_path):
+    """
+    Chapter text for a source_text path, served from the index.
+    Paths outside the indexed corpus are read from disk as before.
+    """
+    text_path = Path(text_path)
+    index = open_index()
+    if text_path.stem in index and text_path.resolve().parent.parent == index.source_root:
+        return index.chapter_text(text_path.stem)
+    return text_path.read_text(encoding="utf-8")
@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import job_journal
+import providers
+import rate_limiter
+import response_cache
+
+
+class Message(dict):
+    """Attribute access like litellm's response objects: response.choices[0].message["content"]"""
+    __getattr__ = dict.get
+
+
+def completion_response(content):
+    return Message(choices=[Message(message={"content": content})])
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    """No telemetry, a fresh response cache and journal in tmp_path, and token buckets that never throttle"""
+    monkeypatch.setenv("LLM_TELEMETRY", "off")
+    monkeypatch.setattr(response_cache, "_cache", None)
+    response_cache.configure(mode="readwrite", cache_dir=tmp_path / "cache")
+    monkeypatch.setattr(rate_limiter, "_buckets", {})
+    for provider in providers.PROVIDER_CONCURRENCY:
+        monkeypatch.setitem(rate_limiter.PROVIDER_REQUESTS_PER_MINUTE, provider, 600_000)
+    journal_path = tmp_path / "job_journal.jsonl"
+    monkeypatch.setattr(job_journal.record, "__defaults__", (journal_path,))
+    monkeypatch.setattr(job_journal.record_many, "__defaults__", (journal_path,))
+    monkeypatch.setattr(job_journal.last_states, "__defaults__", (journal_path,))
+    monkeypatch.setattr(job_journal.unfinished_jobs, "__defaults__", (journal_path,))
+    return tmp_path
+
+
+def stream_response(content, chunk_chars=7):
+    """A streamed reply: chunks whose choices[0].delta carries content piece by piece"""
+    return iter([Message(choices=[Message(delta={"content": content[i:i + chunk_chars]})]) for i in range(0, len(content), chunk_chars)])
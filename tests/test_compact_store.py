@@ -0,0 +1,62 @@
+import json
+
+import compact_store
+import file_io
+
+QUESTIONS = {
+    "Zz_1": [
+        {"id": "Zz_1_001", "question": "Kas buvo pradžioje?", "options": {"a": "Žodis", "b": "Šviesa", "c": "Tamsa", "d": "Vanduo"}, "correct": "a", "model": "mistral-small", "chapter": "Zz_1"},
+        {"id": "Zz_1_002", "question": "Pas ką buvo Žodis?", "options": {"a": "Mozę", "b": "Dievą", "c": "Joną", "d": "Petrą"}, "correct": "b", "model": "mistral-small", "chapter": "Zz_1"},
+    ],
+    "Zz_2": [],
+    "Zz_10": [
+        {"id": "Zz_10_001", "question": "Kas yra gerasis ganytojas?", "options": {"a": "Jėzus", "b": "Jonas", "c": "Petras", "d": "Andriejus"}, "correct": "a", "model": "mistral-small", "chapter": "Zz_10"},
+    ],
+}
+
+EVALUATIONS = {
+    "Zz_1": {
+        "metadata": {"evaluator_model": "gemini-2.5-flash", "missing": []},
+        "results": [{"id": "Zz_1_001", "grade": 5, "comment": "Gerai."}, {"id": "Zz_1_002", "grade": 4, "comment": "Neblogai."}],
+    },
+    # skyrius be įvertinimų (pvz., visi klausimai praleisti) turi išlikti su savo metaduomenimis
+    "Zz_2": {"metadata": {"evaluator_model": "gemini-2.5-flash", "missing": ["Zz_2_001"]}, "results": []},
+}
+
+
+def _write_directory(directory, chapters, file_name):
+    directory.mkdir(parents=True)
+    for chapter, data in chapters.items():
+        file_io.save_json_file(data, directory / file_name(chapter))
+
+
+def test_questions_round_trip_keeps_empty_chapters(tmp_path):
+    directory = tmp_path / "klausimai_Zz"
+    _write_directory(directory, QUESTIONS, lambda chapter: f"questions_{chapter}.json")
+
+    packed, _, _ = compact_store.compact_directory(directory, "questions", remove_json=True)
+    shard = compact_store.find_shard(directory)
+
+    assert packed == 3
+    assert not directory.exists()
+    assert compact_store.read_questions(shard) == QUESTIONS
+    assert list(compact_store.read_questions(shard)) == ["Zz_1", "Zz_2", "Zz_10"]
+
+    target = directory / "questions_Zz_2.json"
+    assert compact_store.restore_chapter(directory, "questions", "Zz_2", target)
+    assert json.loads(target.read_text(encoding="utf-8")) == []
+
+
+def test_evaluations_round_trip_keeps_empty_chapters(tmp_path):
+    directory = tmp_path / "Zz_evaluations"
+    _write_directory(directory, EVALUATIONS, lambda chapter: f"{chapter}_evaluations.json")
+
+    compact_store.compact_directory(directory, "evaluations", codec="gzip", remove_json=True)
+    shard = compact_store.find_shard(directory)
+
+    assert compact_store.read_evaluations(shard) == EVALUATIONS
+
+    target = directory / "Zz_2_evaluations.json"
+    assert compact_store.restore_chapter(directory, "evaluations", "Zz_2", target)
+    assert json.loads(target.read_text(encoding="utf-8")) == EVALUATIONS["Zz_2"]
+    assert not compact_store.restore_chapter(directory, "evaluations", "Zz_3", directory / "Zz_3_evaluations.json")
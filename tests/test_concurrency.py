@@ -0,0 +1,135 @@
+"""
+Concurrency of the scheduler's request slots, with llm_client.acompletion stubbed by a delay.
+
+The slots are built like scheduler.run_matrix builds them: one semaphore per
+provider (providers.PROVIDER_CONCURRENCY) combined with a shared worker pool.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+
+import pytest
+
+import llm_client
+import providers
+import rate_limiter
+import response_cache
+from conftest import completion_response
+
+DELAY = 0.1
+CALLS_PER_MODEL = 6
+
+
+@pytest.fixture(autouse=True)
+def offline_client(offline):
+    # token bucket neriboja (žr. conftest.offline) - tikrinami tik semaforai
+    response_cache.configure(mode="off", cache_dir=offline / "cache")
+
+
+class InFlight:
+    """Stub for llm_client.acompletion that sleeps DELAY and records the peak in-flight count per provider"""
+
+    def __init__(self):
+        self.current = defaultdict(int)
+        self.peak = defaultdict(int)
+        self.total = 0
+        self.peak_total = 0
+
+    async def __call__(self, model, messages, **kwargs):
+        provider = providers.get_provider(model)
+        self.current[provider] += 1
+        self.total += 1
+        self.peak[provider] = max(self.peak[provider], self.current[provider])
+        self.peak_total = max(self.peak_total, self.total)
+        try:
+            await asyncio.sleep(DELAY)
+        finally:
+            self.current[provider] -= 1
+            self.total -= 1
+        return completion_response("ok")
+
+
+async def _run_matrix_like(max_workers):
+    models = list(providers.MODELS.values())
+    provider_semaphores = providers.create_provider_semaphores(models)
+    worker_pool = asyncio.Semaphore(max_workers)
+
+    def slots_for(model):
+        return providers.CombinedSemaphore(provider_semaphores[providers.get_provider(model)], worker_pool)
+
+    calls = [
+        llm_client.acomplete(model, [{"role": "user", "content": f"{model} {i}"}], slots=slots_for(model))
+        for model in models
+        for i in range(CALLS_PER_MODEL)
+    ]
+    return await asyncio.gather(*calls)
+
+
+def _expected_seconds():
+    """Wall-clock time if every provider runs exactly at its cap: the slowest provider's number of waves"""
+    calls = defaultdict(int)
+    for model in providers.MODELS.values():
+        calls[providers.get_provider(model)] += CALLS_PER_MODEL
+    waves = max(-(-count // providers.get_concurrency_limit(provider)) for provider, count in calls.items())
+    return waves * DELAY
+
+
+def test_provider_caps_hold_and_run_is_parallel(monkeypatch):
+    stub = InFlight()
+    monkeypatch.setattr(llm_client, "acompletion", stub)
+
+    start = time.perf_counter()
+    results = asyncio.run(_run_matrix_like(max_workers=len(providers.MODELS) * CALLS_PER_MODEL))
+    elapsed = time.perf_counter() - start
+
+    assert results == ["ok"] * len(providers.MODELS) * CALLS_PER_MODEL
+    for provider, peak in stub.peak.items():
+        assert peak == providers.get_concurrency_limit(provider)
+    expected = _expected_seconds()
+    serial = len(providers.MODELS) * CALLS_PER_MODEL * DELAY
+    assert expected * 0.9 <= elapsed < expected * 1.5
+    assert elapsed < serial / 2
+
+
+def test_worker_pool_caps_all_providers(monkeypatch):
+    stub = InFlight()
+    monkeypatch.setattr(llm_client, "acompletion", stub)
+
+    asyncio.run(_run_matrix_like(max_workers=3))
+
+    assert stub.peak_total == 3
+    for provider, peak in stub.peak.items():
+        assert peak <= providers.get_concurrency_limit(provider)
+
+
+def test_backoff_does_not_hold_the_provider_slot(monkeypatch):
+    class RateLimitError(Exception):
+        pass
+
+    started = []
+    failed_once = []
+
+    async def flaky(model, messages, **kwargs):
+        started.append((messages[0]["content"], time.perf_counter()))
+        if messages[0]["content"] == "first" and not failed_once:
+            failed_once.append(True)
+            raise RateLimitError("429")
+        await asyncio.sleep(DELAY)
+        return completion_response("ok")
+
+    monkeypatch.setattr(llm_client, "acompletion", flaky)
+    monkeypatch.setattr(rate_limiter, "backoff_delay", lambda attempt, retry_after=None: 5 * DELAY)
+
+    async def run():
+        slot = asyncio.Semaphore(1)
+        first = llm_client.acomplete("mistral/a", [{"role": "user", "content": "first"}], slots=slot)
+        second = llm_client.acomplete("mistral/b", [{"role": "user", "content": "second"}], slots=slot)
+        return await asyncio.gather(first, second)
+
+    start = time.perf_counter()
+    assert asyncio.run(run()) == ["ok", "ok"]
+
+    # antra užklausa gauna vietą, kol pirmoji laukia prieš kartojimą
+    second_start = next(moment for content, moment in started if content == "second")
+    assert second_start - start < 5 * DELAY
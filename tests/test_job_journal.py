@@ -0,0 +1,25 @@
+import job_journal
+
+
+def test_buffered_states_are_replayed_per_job(offline):
+    job_journal.record_many(["generate:a:Zz_1", "generate:a:Zz_2"], "queued")
+    job_journal.record("generate:a:Zz_1", "sent")
+    job_journal.record("generate:a:Zz_1", "written", path=offline / "questions_Zz_1.json")
+    job_journal.record("generate:a:Zz_2", "failed")
+
+    # last_states išrašo dar buferyje laukiančius įrašus
+    assert job_journal.last_states() == {"generate:a:Zz_1": "written", "generate:a:Zz_2": "failed"}
+    assert job_journal.unfinished_jobs() == {"generate:a:Zz_2"}
+
+
+def test_entries_lost_in_a_crash_leave_the_job_unfinished(offline, monkeypatch):
+    journal_path = offline / "job_journal.jsonl"
+    job_journal.record_many(["generate:a:Zz_1"], "queued")
+    monkeypatch.setattr(job_journal, "FLUSH_INTERVAL", 3600)
+    job_journal.record("generate:a:Zz_1", "written")
+    # nutrūkęs paleidimas: buferis neišrašytas, paskutinė eilutė pusiau įrašyta
+    monkeypatch.setattr(job_journal, "_pending", {})
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('{"time": 1, "job": "generate:a:Zz_1", "sta')
+
+    assert job_journal.unfinished_jobs() == {"generate:a:Zz_1"}
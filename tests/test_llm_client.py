@@ -0,0 +1,15 @@
+import llm_client
+from conftest import completion_response
+
+
+def test_sdk_retries_are_disabled(offline, monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm_client, "completion", lambda **kwargs: calls.append(kwargs) or completion_response("ok"))
+
+    assert llm_client.complete("mistral/s", [{"role": "user", "content": "labas"}], response_format={"type": "json_object"}) == "ok"
+    assert llm_client.complete("mistral/s", [{"role": "user", "content": "be formato"}]) == "ok"
+
+    # kartoja tik llm_client, kad 429 ir Retry-After pasiektų rate_limiter
+    for kwargs in calls:
+        assert kwargs["max_retries"] == 0
+        assert kwargs["num_retries"] == 0
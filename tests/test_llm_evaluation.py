@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+import llm_client
+import llm_evaluation
+from conftest import completion_response
+from test_llm_generation import CHAPTER_TEXT
+
+QUESTIONS = [
+    {"id": f"Zz_1_00{i}", "question": f"Klausimas {i}?", "options": {"a": "Žodis", "b": "Dievas", "c": "Šviesa", "d": "Gyvybė"}, "correct": "a", "chapter": "Zz_1"}
+    for i in range(1, 3)
+]
+
+
+def _grades(grade):
+    return json.dumps({"evaluations": [{"id": question["id"], "grade": grade, "comment": "-"} for question in QUESTIONS]})
+
+
+@pytest.fixture
+def chapter(offline, monkeypatch):
+    monkeypatch.setattr(llm_evaluation, "REPAIR_ROUNDS", 1)
+    questions_path = offline / "questions_Zz_1.json"
+    questions_path.write_text(json.dumps(QUESTIONS, ensure_ascii=False), encoding="utf-8")
+    text_path = offline / "Zz_1.txt"
+    text_path.write_text(CHAPTER_TEXT, encoding="utf-8")
+    return questions_path, text_path
+
+
+def test_repair_of_an_all_invalid_reply_calls_the_model_again(chapter, monkeypatch):
+    replies = [_grades("labai gerai"), _grades(5)]
+    monkeypatch.setattr(llm_client, "completion", lambda **kwargs: completion_response(replies.pop(0)))
+
+    evaluations = llm_evaluation.evaluate_questions(chapter[0], "mistral/s", chapter[1])
+
+    # tikslinis prašymas sutampa su pradiniu, todėl jo blogas atsakymas neturi būti grąžintas iš kešo
+    assert replies == []
+    assert [item["grade"] for item in evaluations["results"]] == [5, 5]
+
+
+def test_async_repair_of_an_all_invalid_reply_calls_the_model_again(chapter, monkeypatch):
+    replies = [_grades(None), _grades(4)]
+
+    async def reply(**kwargs):
+        return completion_response(replies.pop(0))
+    monkeypatch.setattr(llm_client, "acompletion", reply)
+    questions_path, text_path = chapter
+
+    evaluations = asyncio.run(llm_evaluation.evaluate_questions_async(questions_path, "mistral/s", text_path, asyncio.Semaphore(1)))
+
+    assert replies == []
+    assert [item["grade"] for item in evaluations["results"]] == [4, 4]
+
+
+def test_partial_repair_is_served_from_the_cache_on_the_next_run(chapter, monkeypatch):
+    calls = []
+    partial = json.dumps({"evaluations": [{"id": "Zz_1_001", "grade": 5, "comment": "-"}]})
+    repaired = json.dumps({"evaluations": [{"id": "Zz_1_002", "grade": 3, "comment": "-"}]})
+    replies = [partial, repaired]
+    monkeypatch.setattr(llm_client, "completion", lambda **kwargs: calls.append(kwargs) or completion_response(replies.pop(0)))
+    questions_path, text_path = chapter
+
+    first = llm_evaluation.evaluate_questions(questions_path, "mistral/s", text_path)
+    second = llm_evaluation.evaluate_questions(questions_path, "mistral/s", text_path)
+
+    assert len(calls) == 2
+    assert first == second
+    assert [item["grade"] for item in second["results"]] == [5, 3]
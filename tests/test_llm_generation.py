@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import job_journal
+import llm_client
+import llm_generation
+from conftest import completion_response, stream_response
+
+CHAPTER_TEXT = "1 Pradžioje buvo Žodis. 2 Jis buvo pradžioje pas Dievą. 3 Visa per jį atsirado."
+
+
+def _questions_reply(count=3):
+    return json.dumps({"questions": [
+        {
+            "question_text": f"Klausimas {i}?",
+            "options": {"a": "Žodis", "b": "Dievas", "c": "Šviesa", "d": "Gyvybė"},
+            "correct_answer": "a",
+        }
+        for i in range(count)
+    ]})
+
+
+def test_unparsable_reply_fails_the_chapter_without_writing_it(offline, monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm_client, "completion", lambda **kwargs: calls.append(kwargs) or completion_response("Atsiprašau, negaliu."))
+    question_file = offline / "questions_Zz_1.json"
+
+    assert llm_generation.generate_questions("mistral/s", CHAPTER_TEXT, "Zz_1", question_file) is False
+    assert not question_file.exists()
+
+    # atsakymas pašalintas iš kešo, todėl kitas bandymas vėl kviečia modelį
+    monkeypatch.setattr(llm_client, "completion", lambda **kwargs: calls.append(kwargs) or completion_response(_questions_reply()))
+    assert llm_generation.generate_questions("mistral/s", CHAPTER_TEXT, "Zz_1", question_file) is True
+    assert len(calls) == 2
+    assert len(json.loads(question_file.read_text(encoding="utf-8"))) == 3
+
+
+def test_unparsable_reply_is_journaled_as_failed(offline, monkeypatch):
+    async def reply(**kwargs):
+        return completion_response("{}")
+    monkeypatch.setattr(llm_client, "acompletion", reply)
+    question_file = offline / "questions_Zz_1.json"
+
+    generated = asyncio.run(llm_generation.generate_questions_async(
+        "mistral/s", CHAPTER_TEXT, "Zz_1", question_file, asyncio.Semaphore(1), journal_id="generate:s:Zz_1"
+    ))
+
+    assert generated is False
+    assert not question_file.exists()
+    assert job_journal.last_states() == {"generate:s:Zz_1": "failed"}
+
+
+def test_regenerated_stream_reports_replaced_ids_again(offline, monkeypatch):
+    broken = json.dumps({"questions": [
+        {"question_text": f"Sugadintas {i}?", "options": {"a": "Žodis"}, "correct_answer": "e"} for i in range(3)
+    ]})
+    replies = [broken, _questions_reply()]
+    monkeypatch.setattr(llm_client, "completion", lambda **kwargs: stream_response(replies.pop(0)))
+    question_file = offline / "questions_Zz_1.json"
+    reported = {}
+
+    assert llm_generation.generate_questions(
+        "mistral/s", CHAPTER_TEXT, "Zz_1", question_file, stream=True, on_question=lambda question: reported.update({question["id"]: question})
+    ) is True
+
+    # paskutinis kiekvieno id objektas sutampa su išsaugotu klausimu
+    saved = json.loads(question_file.read_text(encoding="utf-8"))
+    assert replies == []
+    assert list(reported.values()) == saved
+
+
+def test_chunked_generation_reports_merged_questions(offline, monkeypatch):
+    windows = [
+        {"first": 1, "last": 2, "questions": 2, "text": CHAPTER_TEXT[:40]},
+        {"first": 2, "last": 3, "questions": 2, "text": CHAPTER_TEXT[30:]},
+    ]
+    monkeypatch.setattr(llm_generation, "verse_windows", lambda chapter_name: windows)
+    replies = iter([_questions_reply(2), json.dumps({"questions": [
+        {"question_text": "Kas atsirado per jį?", "options": {"a": "Visa", "b": "Nieko", "c": "Dangus", "d": "Žemė"}, "correct_answer": "a"},
+    ]})])
+
+    async def reply(**kwargs):
+        return completion_response(next(replies))
+    monkeypatch.setattr(llm_client, "acompletion", reply)
+    question_file = offline / "questions_Zz_1.json"
+    reported = []
+
+    assert asyncio.run(llm_generation.generate_questions_async(
+        "mistral/s", CHAPTER_TEXT, "Zz_1", question_file, asyncio.Semaphore(2), chunked=True, on_question=reported.append
+    )) is True
+
+    saved = json.loads(question_file.read_text(encoding="utf-8"))
+    assert len(saved) == 3
+    assert reported == saved
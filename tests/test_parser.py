@@ -0,0 +1,28 @@
+import json
+
+import parser
+
+QUESTION = {"question_text": "Kas buvo pradžioje?", "options": {"a": "Žodis", "b": "Šviesa", "c": "Tamsa", "d": "Vanduo"}, "correct_answer": "A"}
+EXPECTED = {"question": "Kas buvo pradžioje?", "options": QUESTION["options"], "correct": "a"}
+
+
+def _feed_in_chunks(text, size=5):
+    stream_parser = parser.QuestionStreamParser()
+    questions = []
+    for i in range(0, len(text), size):
+        questions.extend(stream_parser.feed(text[i:i + size]))
+    return questions
+
+
+def test_stream_parser_reads_a_questions_object():
+    reply = "```json\n" + json.dumps({"questions": [QUESTION, QUESTION]}, ensure_ascii=False) + "\n```"
+
+    assert _feed_in_chunks(reply) == [EXPECTED, EXPECTED]
+    assert parser.parse_questions_to_json(reply) == [EXPECTED, EXPECTED]
+
+
+def test_stream_parser_reads_a_bare_list_like_the_full_parser():
+    reply = "Štai klausimai:\n" + json.dumps([QUESTION, QUESTION], ensure_ascii=False)
+
+    assert _feed_in_chunks(reply) == [EXPECTED, EXPECTED]
+    assert parser.parse_questions_to_json(reply) == [EXPECTED, EXPECTED]
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import job_journal
+import llm_client
+import rate_limiter
+import scheduler
+from conftest import completion_response
+from test_llm_generation import CHAPTER_TEXT, _questions_reply
+
+
+def _generation_job(tmp_path):
+    text_path = tmp_path / "Zz_1.txt"
+    text_path.write_text(CHAPTER_TEXT, encoding="utf-8")
+    return {
+        "id": "generate:mistral-small:Zz_1",
+        "model": "mistral/mistral-small-latest",
+        "author": "mistral-small",
+        "book": "Zz",
+        "chapter": "Zz_1",
+        "text_path": text_path,
+        "questions_path": tmp_path / "questions" / "questions_Zz_1.json",
+        "done": False,
+    }
+
+
+def test_failed_generation_is_requeued_within_the_run(offline, monkeypatch):
+    replies = ["Atsiprašau, negaliu.", _questions_reply()]
+
+    async def reply(**kwargs):
+        return completion_response(replies.pop(0))
+    monkeypatch.setattr(llm_client, "acompletion", reply)
+    monkeypatch.setattr(rate_limiter, "backoff_delay", lambda attempt, retry_after=None: 0)
+    job = _generation_job(offline)
+
+    assert asyncio.run(scheduler.run_generation_job(job, asyncio.Semaphore(1))) is True
+    assert replies == []
+    assert len(json.loads(job["questions_path"].read_text(encoding="utf-8"))) == 3
+
+
+def test_resumed_job_with_existing_output_is_marked_written(offline):
+    job = _generation_job(offline)
+    job_journal.record(job["id"], "queued")
+    # nutrūkęs paleidimas spėjo įrašyti failą, bet ne "written"
+    job["questions_path"].parent.mkdir()
+    job["questions_path"].write_text(_questions_reply(), encoding="utf-8")
+    job.update(done=True, unfinished=True)
+
+    assert asyncio.run(scheduler.run_generation_job(job, asyncio.Semaphore(1))) is True
+    assert job_journal.unfinished_jobs() == set()
+
+
+def test_resumed_evaluation_with_existing_output_is_marked_written(offline):
+    generation = _generation_job(offline)
+    job = {
+        **generation,
+        "id": "evaluate:gemini-2.5-flash:mistral-small:Zz_1",
+        "evaluator": "gemini-2.5-flash",
+        "evaluations_path": offline / "evaluations" / "Zz_1_evaluations.json",
+        "done": True,
+        "unfinished": True,
+    }
+    job_journal.record(job["id"], "sent")
+    job["evaluations_path"].parent.mkdir()
+    job["evaluations_path"].write_text(json.dumps({"metadata": {}, "results": []}), encoding="utf-8")
+
+    async def generation_failed():
+        return False
+
+    assert asyncio.run(scheduler.run_evaluation_job(job, generation_failed(), asyncio.Semaphore(1))) is True
+    assert job_journal.unfinished_jobs() == set()
+
+
+def test_finished_job_adds_no_journal_lines(offline):
+    job = _generation_job(offline)
+    job["questions_path"].parent.mkdir()
+    job["questions_path"].write_text(_questions_reply(), encoding="utf-8")
+    job["done"] = True
+
+    assert asyncio.run(scheduler.run_generation_job(job, asyncio.Semaphore(1))) is True
+    assert job_journal.last_states() == {}
@@ -0,0 +1,25 @@
+import json
+
+import providers
+import telemetry
+
+
+def test_average_latency_counts_live_calls_only(tmp_path, capsys):
+    path = tmp_path / "telemetry.jsonl"
+    spans = [
+        {"model": "mistral/m", "stage": "generate", "author": "mistral-small", "chapter": "Zz_1", "latency": 2.0, "cache_hit": False, "outcome": "ok"},
+        {"model": "mistral/m", "stage": "generate", "author": "mistral-small", "chapter": "Zz_2", "latency": 4.0, "cache_hit": False, "outcome": "ok"},
+        {"model": "mistral/m", "stage": "generate", "author": "mistral-small", "chapter": "Zz_3", "latency": 30.0, "cache_hit": True, "outcome": "ok"},
+    ]
+    path.write_text("".join(json.dumps(span) + "\n" for span in spans), encoding="utf-8")
+
+    telemetry.print_summary(path)
+
+    row = next(line for line in capsys.readouterr().out.splitlines() if line.startswith("mistral-small (generavimas)"))
+    assert row.split()[-1] == "3.00"
+
+
+def test_model_name_maps_litellm_names_to_folder_names():
+    for name, litellm_model in providers.MODELS.items():
+        assert providers.model_name(litellm_model) == name
+    assert providers.model_name("openai/bench-a") == "openai/bench-a"